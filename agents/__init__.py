@@ -0,0 +1,42 @@
+"""
+Registry of the pipeline agents by graph node.
+Agent modules (and their LangChain, Ollama, FAISS... dependencies) are imported and the
+agents constructed only when a node first needs them; instances are shared process-wide.
+"""
+import importlib
+import threading
+
+# Graph node -> (module, class), in the order a query usually reaches them
+AGENTS = {
+    "retrieve": ("agents.retreiver", "RetrieverAgent"),
+    "prepare": ("agents.converter", "ConverterAgent"),
+    "request": ("agents.executor", "ExecutorAgent"),
+    "feedback": ("agents.feedback", "FeedbackAgent"),
+    "extract": ("agents.extractor", "ExtractorAgent"),
+    "index": ("agents.indexer", "Indexer"),
+    "speculate": ("agents.speculator", "SpeculativeAgent"),
+}
+# Agents built from the shared instances of other nodes instead of their own
+DEPENDENCIES = {"speculate": ["prepare", "request", "feedback"]}
+
+_agents = {}
+# One lock per node: building an agent never waits for another agent being built
+_locks = {node: threading.Lock() for node in AGENTS}
+
+
+def is_loaded(node: str) -> bool:
+    return node in _agents
+
+
+def get_agent(node: str):
+    """The shared agent of a node, imported and constructed on first use."""
+    agent = _agents.get(node)
+    if agent is not None:
+        return agent
+    with _locks[node]:
+        if node not in _agents:
+            dependencies = [get_agent(d) for d in DEPENDENCIES.get(node, [])]
+            module, name = AGENTS[node]
+            agent_class = getattr(importlib.import_module(module), name)
+            _agents[node] = agent_class(*dependencies)
+        return _agents[node]
@@ -1,10 +1,131 @@
-import os, json, yaml, re
-from typing import Any, Dict
+import os, json, yaml, re, time, threading, asyncio, textwrap
+from typing import Any, Dict, List
 from langchain.schema import HumanMessage
-from langchain_community.vectorstores import FAISS
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from state import State
-from config import SERVICE_FOLDER, EMBEDDING_MODEL, CONVERTER_MODEL
+from langchain_ollama import ChatOllama
+from state import State, strip_instructions
+from concurrency import llm_slot
+from instrumentation import LLMTraceHandler, count
+from spec_cache import SpecCache
+from index_manifest import file_sha256
+from vector_store import get_vectorstore_handle, documents_for_source
+from config import SERVICE_FOLDER, EMBEDDING_MODEL, CONVERTER_MODEL, OPENAPI_OUTPUT_DIR, HTML_CONVERSION_MODE, \
+    PROMPT_TOKEN_BUDGET
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), enough to size prompts."""
+    return len(text) // 4 + 1
+
+
+def spec_slices(flat_spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    YAML of a flat spec prepared once for slice_spec: the full text with its token estimate,
+    the top-level keys other than paths, and per operation its path key line, its indented
+    method block and their token estimate.
+    """
+    def dump(data):
+        return yaml.dump(data, sort_keys=False, allow_unicode=True)
+
+    full_yaml = dump(flat_spec)
+    header = {k: v for k, v in flat_spec.items() if k != "paths"}
+    operations: Dict[str, Dict[str, Any]] = {}
+    for path, methods in (flat_spec.get("paths") or {}).items():
+        for method, operation in methods.items():
+            key, _, block = dump({path: {method: operation}}).partition("\n")
+            operations.setdefault(path, {})[method] = {"key": key, "yaml": block,
+                                                       "tokens": estimate_tokens(key + "\n" + block)}
+    return {"yaml": full_yaml, "tokens": estimate_tokens(full_yaml), "header": dump(header) if header else "",
+            "operations": operations}
+
+
+def response_properties(api_spec_yaml: str | None, request: Dict[str, Any] | None = None) -> set:
+    """
+    Top-level properties of the 200 response schema kept in a flat spec: of the endpoint
+    that was called when known (of every endpoint with its method when only the method is,
+    as for the React agent), otherwise of every endpoint in the spec.
+    """
+    try:
+        spec = yaml.safe_load(api_spec_yaml or "") or {}
+    except yaml.YAMLError:
+        return set()
+    request = request or {}
+    operations = [
+        op for path, methods in (spec.get("paths") or {}).items() for method, op in (methods or {}).items()
+        if not request or (request.get("path") in (None, path) and method == request.get("method"))
+    ]
+    props = set()
+    for op in operations:
+        schema = ((op.get("responses") or {}).get("200") or {}).get("content", {}) \
+            .get("application/json", {}).get("schema", {})
+        props.update((schema.get("properties") or {}).keys())
+    return props
+
+
+class HtmlConversionStatus:
+    """
+    Status of the HTML -> OpenAPI conversions, persisted as JSON in the output directory.
+    Each HTML file name maps to its content hash and a status: converted, pending or failed.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, output_dir: str = OPENAPI_OUTPUT_DIR):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, "status.json")
+
+    def spec_path(self, name: str) -> str:
+        return os.path.join(self.output_dir, name + ".yaml")
+
+    def load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, name: str) -> dict | None:
+        return self.load().get(name)
+
+    def is_ready(self, name: str, sha256: str) -> bool:
+        entry = self.get(name)
+        return bool(entry) and entry["status"] == "converted" and entry["sha256"] == sha256 \
+            and os.path.exists(self.spec_path(name))
+
+    def set(self, name: str, sha256: str, status: str, error: str | None = None):
+        with self._lock:
+            entries = self.load()
+            entries[name] = {"sha256": sha256, "status": status, "error": error, "updated_at": time.time()}
+            self._save(entries)
+
+    def prune(self, names: List[str]):
+        """Forget files that are no longer in the service folder, removing their generated specs."""
+        with self._lock:
+            entries = self.load()
+            for name in [n for n in entries if n not in names]:
+                entries.pop(name)
+                if os.path.exists(self.spec_path(name)):
+                    os.remove(self.spec_path(name))
+            self._save(entries)
+
+    def _save(self, entries: Dict[str, dict]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def format(self) -> str:
+        entries = self.load()
+        if not entries:
+            return "No HTML documentation has been converted yet."
+        lines = []
+        for name, entry in sorted(entries.items()):
+            updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.get("updated_at", 0)))
+            line = f"{entry['status']:<10} {name}  (updated {updated})"
+            if entry.get("error"):
+                line += f"\n           error: {entry['error'].splitlines()[0]}"
+            lines.append(line)
+        return "\n".join(lines)
 
 
 class ConverterAgent:
@@ -13,14 +134,19 @@ class ConverterAgent:
             model=llm_model,
             temperature=0.0,
             top_p=0.95,
-            num_ctx=2048
+            num_ctx=2048,
+            callbacks=[LLMTraceHandler("prepare")]
         )
-        self.api_spec_yaml: str | None = None
-        self.system_message: str | None = None
-        self.embedding = OllamaEmbeddings(model=embedding_model)
+        self.store_handle = get_vectorstore_handle(embedding_model=embedding_model)
+        self.spec_cache = SpecCache()
+        self.conversion_status = HtmlConversionStatus()
 
     def load_and_flatten_openapi(self, file_path: str) -> str:
         """Load YAML/JSON OpenAPI e return YAML 'flat'."""
+        return yaml.dump(self.flatten_openapi(file_path), sort_keys=False, allow_unicode=True)
+
+    def flatten_openapi(self, file_path: str) -> Dict[str, Any]:
+        """Load YAML/JSON OpenAPI e return the 'flat' spec as a dict."""
         with open(file_path, "r", encoding="utf-8") as f:
             if file_path.endswith(".json"):
                 spec: Dict[str, Any] = json.load(f)
@@ -71,40 +197,35 @@ class ConverterAgent:
                     },
                 }
 
-        return yaml.dump(flat_spec, sort_keys=False, allow_unicode=True)
-
-    def html_to_openapi_with_llm(self, file_path: str) -> str:
-        """Convert HTML API documentation into a validated OpenAPI YAML using LLM."""
-        from openapi_spec_validator import validate_spec
-        from openapi_spec_validator.validation.exceptions import OpenAPIValidationError
+        return flat_spec
 
-        output_dir = "generated_openapi"
-        os.makedirs(output_dir, exist_ok=True)
+    def html_to_openapi_with_llm(self, file_path: str, index_version: int | None = None) -> Dict[str, Any]:
+        """
+        Convert HTML API documentation into OpenAPI YAML on the query path.
+        Used only when HTML_CONVERSION_MODE is "off": otherwise specs are generated by the Indexer.
+        """
+        # Recupera documentazione indicizzata
+        _, vectorstore = self.store_handle.get(index_version)
+        docs = documents_for_source(vectorstore, file_path)
+        output_file = self.generate_openapi_spec(file_path, file_sha256(file_path), [doc.page_content for doc in docs])
+        return self.flatten_openapi(output_file)
 
+    def generate_openapi_spec(self, file_path: str, sha256: str, contents: List[str]) -> str:
+        """
+        Generate and validate an OpenAPI spec from the indexed chunks of an HTML file,
+        save it and record the outcome in the conversion status. Returns the spec path.
+        """
         base_name = os.path.basename(file_path)
-        output_file = os.path.join(output_dir, base_name + ".yaml")
-
-        # Se già esiste, lo ricarichiamo
-        if os.path.exists(output_file):
-            print(f"Fetching the OpenAPI specifications for the file: {output_file}")
-            return self.load_and_flatten_openapi(output_file)
+        output_file = self.conversion_status.spec_path(base_name)
+        try:
+            if not contents:
+                raise ValueError(f"No indexed content found for {file_path}")
 
-        print("Generating OpenAPI specs from HTML documentation...")
+            print(f"Generating OpenAPI specs from HTML documentation {base_name}...")
+            combined_content = "\n\n".join(contents)
 
-        # Recupera documentazione indicizzata
-        vectorstore = FAISS.load_local("faiss_index", self.embedding, allow_dangerous_deserialization=True)
-        all_docs = vectorstore.docstore._dict.values()
-        matching_docs = [
-            doc.page_content for doc in all_docs
-            if file_path in str(doc.metadata.get("source", ""))
-        ]
-        if not matching_docs:
-            raise ValueError(f"No indexed content found for {file_path}")
-
-        combined_content = "\n\n".join(matching_docs)
-
-        # Prompt rinforzato
-        prompt = f"""
+            # Prompt rinforzato
+            prompt = f"""
 You are an expert assistant capable of extracting information from an API's unstructured documentation and 
 producing a specification in valid OpenAPI 3.0.0 YAML format.
 
@@ -116,54 +237,152 @@ Documentation:
 {combined_content[:12000]}
 """
 
-        messages = [HumanMessage(content=prompt)]
-        response = self.llm.invoke(messages)
-        openapi_yaml = response.content.strip()
+            messages = [HumanMessage(content=prompt)]
+            with llm_slot():
+                response = self.llm.invoke(messages)
+            openapi_yaml = response.content.strip()
 
-        # Pulizia aggressiva
-        openapi_yaml = re.sub(r"(?is)^.*?(openapi:\s*3\.\d+\.\d+)", r"\1", openapi_yaml)
-        openapi_yaml = re.sub(r"```[a-zA-Z]*", "", openapi_yaml)
-        openapi_yaml = re.sub(r"```", "", openapi_yaml).strip()
-        openapi_yaml = re.split(r'\n\s*[A-Z][a-z]+\s', openapi_yaml)[0].strip()
+            # Pulizia aggressiva
+            openapi_yaml = re.sub(r"(?is)^.*?(openapi:\s*3\.\d+\.\d+)", r"\1", openapi_yaml)
+            openapi_yaml = re.sub(r"```[a-zA-Z]*", "", openapi_yaml)
+            openapi_yaml = re.sub(r"```", "", openapi_yaml).strip()
+            openapi_yaml = re.split(r'\n\s*[A-Z][a-z]+\s', openapi_yaml)[0].strip()
 
-        try:
-            spec_dict = yaml.safe_load(openapi_yaml)
-        except yaml.YAMLError as e:
-            print("YAML parsing failed:", e)
-            raise ValueError("Generated YAML is invalid. LLM output:\n" + openapi_yaml)
-        """
-        try:
-            validate_spec(spec_dict)
-        except OpenAPIValidationError as e:
-            print("OpenAPI validation failed:", e)
+            try:
+                spec_dict = yaml.safe_load(openapi_yaml)
+            except yaml.YAMLError as e:
+                print("YAML parsing failed:", e)
+                raise ValueError("Generated YAML is invalid. LLM output:\n" + openapi_yaml)
+            self.validate_generated_spec(spec_dict)
+
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file, "w", encoding="utf-8") as outfile:
+                outfile.write(openapi_yaml)
+        except Exception as e:
+            self.conversion_status.set(base_name, sha256, "failed", error=str(e))
             raise
-        """
-        with open(output_file, "w", encoding="utf-8") as outfile:
-            outfile.write(openapi_yaml)
 
+        self.conversion_status.set(base_name, sha256, "converted")
         print(f"OpenAPI spec validated and saved to {output_file}")
-        return self.load_and_flatten_openapi(output_file)
+        return output_file
 
-    def load_api_spec(self, api_path: str) -> str:
-        """Load API spec from file, converting HTML if needed."""
+    @staticmethod
+    def validate_generated_spec(spec: Any):
+        """Structural checks on a generated spec: the fields the executor relies on must be there."""
+        if not isinstance(spec, dict):
+            raise ValueError("Generated spec is not a YAML mapping")
+        missing = [k for k in ["openapi", "info", "paths"] if k not in spec]
+        if missing:
+            raise ValueError(f"Generated spec misses the fields: {', '.join(missing)}")
+        if not isinstance(spec["paths"], dict) or not spec["paths"]:
+            raise ValueError("Generated spec has no paths")
+
+    def convert_html_sources(self, sources: List[tuple], vectorstore):
+        """Generate the OpenAPI specs of (file_path, sha256) HTML sources from their indexed chunks."""
+        for file_path, sha256 in sources:
+            if self.conversion_status.is_ready(os.path.basename(file_path), sha256):
+                continue
+            docs = documents_for_source(vectorstore, file_path)
+            try:
+                self.generate_openapi_spec(file_path, sha256, [doc.page_content for doc in docs])
+            except Exception as e:
+                print(f"OpenAPI generation failed for {file_path}: {e}")
+
+    def load_html_spec(self, api_path: str, index_version: int | None = None) -> Dict[str, Any]:
+        """Read the spec precomputed for an HTML file; never generates on the query path unless conversion is off."""
+        base_name = os.path.basename(api_path)
+        spec_path = self.conversion_status.spec_path(base_name)
+        if self.conversion_status.is_ready(base_name, file_sha256(api_path)):
+            print(f"Fetching the OpenAPI specifications for the file: {spec_path}")
+            return self.flatten_openapi(spec_path)
+
+        if HTML_CONVERSION_MODE == "off":
+            return self.html_to_openapi_with_llm(api_path, index_version)
+        entry = self.conversion_status.get(base_name)
+        state = entry["status"] if entry else "pending"
+        if state == "converted":
+            state = "outdated, waiting for reindexing"
+        raise ValueError(f"OpenAPI spec for {base_name} is not ready yet ({state})")
+
+    def load_api_spec(self, api_path: str, index_version: int | None = None) -> Dict[str, Any]:
+        """Load the flat API spec from file, using the spec precomputed for HTML files."""
         if api_path.endswith(".html"):
-            return self.html_to_openapi_with_llm(api_path)
+            return self.load_html_spec(api_path, index_version)
         else:
-            return self.load_and_flatten_openapi(api_path)
+            return self.flatten_openapi(api_path)
+
+    def rank_operations(self, flat_spec: Dict[str, Any], query: str, api_path: str,
+                        index_version: int | None = None) -> List[tuple]:
+        """
+        Rank the (path, method) operations of a spec by relevance to the query.
+        Operations matched by the per-operation chunks indexed for the file come first,
+        in vector-search order; the rest are ordered by word overlap with the query.
+        """
+        operations = [(path, method) for path, methods in flat_spec.get("paths", {}).items() for method in methods]
+        ranked = []
+        try:
+            version, vectorstore = self.store_handle.get(index_version)
+            docs = self.store_handle.search_source(version, vectorstore, query, api_path, min(len(operations), 20) or 1)
+            for doc in docs:
+                op = (doc.metadata.get("path"), doc.metadata.get("method"))
+                if op in operations and op not in ranked:
+                    ranked.append(op)
+        except Exception as e:
+            print(f"Vector ranking of endpoints unavailable: {e}")
+
+        query_words = set(re.findall(r"[a-z0-9]+", query.lower()))
+
+        def overlap(op):
+            path, method = op
+            summary = str(flat_spec["paths"][path][method].get("summary", ""))
+            return len(query_words & set(re.findall(r"[a-z0-9]+", f"{path} {summary}".lower())))
+
+        rest = sorted([op for op in operations if op not in ranked], key=overlap, reverse=True)
+        return ranked + rest
+
+    def slice_spec(self, flat_spec: Dict[str, Any], query: str, api_path: str, index_version: int | None = None,
+                   token_budget: int = PROMPT_TOKEN_BUDGET, slices: Dict[str, Any] | None = None) -> str:
+        """
+        Return the spec YAML to paste in the prompt, keeping only the endpoints relevant
+        to the query so that it fits `token_budget` (the executor runs with num_ctx=2048).
+        The YAML is assembled from `slices` (spec_slices, cached with the spec) without dumping again.
+        """
+        slices = slices or spec_slices(flat_spec)
+        if slices["tokens"] <= token_budget:
+            return slices["yaml"]
+
+        operations = slices["operations"]
+        kept: Dict[str, List[str]] = {}
+        used = estimate_tokens(slices["header"] + "paths:\n")
+        for path, method in self.rank_operations(flat_spec, query, api_path, index_version):
+            cost = operations[path][method]["tokens"]
+            # The best endpoint is always kept, even if alone it exceeds the budget
+            if kept and used + cost > token_budget:
+                continue
+            kept.setdefault(path, []).append(method)
+            used += cost
 
-    def build_system_message(self) -> str:
+        parts = [slices["header"], "paths:\n"]
+        for path, methods in kept.items():
+            parts.append("  " + operations[path][methods[0]]["key"] + "\n")
+            parts.extend(textwrap.indent(operations[path][method]["yaml"], "  ") for method in methods)
+        spec_yaml = "".join(parts)
+        total = sum(len(m) for m in operations.values())
+        print(f"Spec sliced to {sum(len(m) for m in kept.values())}/{total} endpoints (~{estimate_tokens(spec_yaml)} tokens)")
+        return spec_yaml
+
+    @staticmethod
+    def build_system_message(api_spec_yaml: str) -> str:
         """Build the system message for the LLM using the loaded API spec."""
-        self.system_message = f"""
+        return f"""
         You have access to API tools that can send HTTP requests (GET/POST/PATCH/PUT/DELETE).
         When the user asks something, you must use the tools to actually send the request and return the real response data, even if it's an error code.
         Do NOT provide code samples or explain how to call the API.
         Use ONLY the endpoints/parameters documented below.
         Here is documentation on the API:
-        {self.api_spec_yaml}
+        {api_spec_yaml}
         """.strip()
 
-        return self.system_message
-
     def run(self, state: State) -> State:
         print("Running ConverterAgent...")
         idx = state.get("current_index", 0)
@@ -178,15 +397,36 @@ Documentation:
             return {**state, "current_index": idx + 1}
 
         try:
-            self.api_spec_yaml = self.load_api_spec(api_path)
-            system_message = self.build_system_message()
+            cached = self.spec_cache.get(api_path)
+            if cached and "flat_spec" in cached:
+                print(f"Using cached API spec for {api_path}")
+                count("spec_cache_hit")
+                flat_spec = cached["flat_spec"]
+                slices = cached.get("slices")
+                if slices is None:
+                    # Entry written before the slices were cached
+                    slices = spec_slices(flat_spec)
+                    self.spec_cache.put(api_path, {"flat_spec": flat_spec, "slices": slices})
+            else:
+                count("spec_cache_miss")
+                flat_spec = self.load_api_spec(api_path, state.get("index_version"))
+                slices = spec_slices(flat_spec)
+                self.spec_cache.put(api_path, {"flat_spec": flat_spec, "slices": slices})
+
+            api_spec_yaml = self.slice_spec(flat_spec, strip_instructions(state.get("user_query", "")), api_path,
+                                            state.get("index_version"), slices=slices)
+            system_message = self.build_system_message(api_spec_yaml)
 
             return {
                 **state,
                 "current_api_path": api_path,
-                "api_spec_yaml": self.api_spec_yaml,
+                "api_spec_yaml": api_spec_yaml,
                 "system_message": system_message,
             }
         except Exception as e:
             print(f"Error processing {api_path}: {e}")
             return {**state, "current_index": idx + 1}
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: spec loading and slicing are disk/CPU bound, so they run in a worker thread."""
+        return await asyncio.to_thread(self.run, state)
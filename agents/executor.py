@@ -1,59 +1,339 @@
+import re
+import json
+import yaml
+import requests
+import httpx
+from typing import Any, Dict
+from urllib.parse import quote
 from state import State
+from concurrency import llm_slot, allm_slot
+from instrumentation import LLMTraceHandler, count
 from langchain_community.agent_toolkits.openapi.toolkit import RequestsToolkit
 from langchain_community.utilities.requests import TextRequestsWrapper
 from langgraph.prebuilt import create_react_agent
 from langchain_ollama import ChatOllama
-from config import EXECUTOR_MODEL
+from config import EXECUTOR_MODEL, EXECUTOR_MODE
+from http_client import get_http_client, get_async_http_client
 
 ALLOW_DANGEROUS_REQUEST = True
 
+PLAN_PROMPT = """
+You plan a single HTTP request that answers the user query, using ONLY the API documented below.
+Reply ONLY with a JSON object, no explanation:
+{{"method": "<get|post|put|patch|delete>", "path": "<documented path, e.g. /items/{{id}}>",
+ "path_params": {{"<name>": "<value>"}}, "query_params": {{"<name>": "<value>"}}, "body": <JSON body or null>}}
+
+API documentation:
+{spec}
+
+User query: {query}
+"""
+
+
+class PlanValidationError(ValueError):
+    pass
+
+
+class PooledRequestsWrapper(TextRequestsWrapper):
+    """
+    TextRequestsWrapper that sends the React agent's tool calls through the shared
+    HTTP clients (connection pool, per-host limits, timeouts, retries, size cap).
+    """
+
+    def get(self, url: str, **kwargs: Any) -> str:
+        return get_http_client().request("GET", url, headers=self.headers, **kwargs).text
+
+    def post(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
+        return get_http_client().request("POST", url, json=data, headers=self.headers, **kwargs).text
+
+    def patch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
+        return get_http_client().request("PATCH", url, json=data, headers=self.headers, **kwargs).text
+
+    def put(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
+        return get_http_client().request("PUT", url, json=data, headers=self.headers, **kwargs).text
+
+    def delete(self, url: str, **kwargs: Any) -> str:
+        return get_http_client().request("DELETE", url, headers=self.headers, **kwargs).text
+
+    async def aget(self, url: str, **kwargs: Any) -> str:
+        return (await get_async_http_client().request("GET", url, headers=self.headers, **kwargs)).text
+
+    async def apost(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
+        return (await get_async_http_client().request("POST", url, json=data, headers=self.headers, **kwargs)).text
+
+    async def apatch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
+        return (await get_async_http_client().request("PATCH", url, json=data, headers=self.headers, **kwargs)).text
+
+    async def aput(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
+        return (await get_async_http_client().request("PUT", url, json=data, headers=self.headers, **kwargs)).text
+
+    async def adelete(self, url: str, **kwargs: Any) -> str:
+        return (await get_async_http_client().request("DELETE", url, headers=self.headers, **kwargs)).text
+
+
 class ExecutorAgent:
     """
     ExecutorAgent is responsible for invoking the LLM-based React agent
     using the system message and user query from the current state.
     It executes API calls through the RequestsToolkit and captures
     the resulting response to store it back in the state.
+    In "plan" mode (EXECUTOR_MODE) the LLM emits a single call plan instead,
+    validated against the flattened spec and sent directly; the React agent
+    is used only when the plan is invalid.
     """
-    def __init__(self, llm_model: str = EXECUTOR_MODEL):
+    def __init__(self, llm_model: str = EXECUTOR_MODEL, mode: str = EXECUTOR_MODE):
+        self.mode = mode
         self.llm = ChatOllama(
             model=llm_model,
             temperature=0.0,
             top_p=0.95,
-            num_ctx=2048
+            num_ctx=2048,
+            callbacks=[LLMTraceHandler("request")]
         )
+        self.plan_llm = ChatOllama(
+            model=llm_model,
+            temperature=0.0,
+            num_ctx=2048,
+            format="json",
+            callbacks=[LLMTraceHandler("request.plan")]
+        )
+        toolkit = RequestsToolkit(
+            requests_wrapper=PooledRequestsWrapper(headers={}),
+            allow_dangerous_requests=ALLOW_DANGEROUS_REQUEST,
+        )
+        self.http_tools = toolkit.get_tools()
+
+    @staticmethod
+    def _parse_plan(raw_plan: str) -> Dict[str, Any]:
+        try:
+            plan = json.loads(raw_plan)
+        except ValueError:
+            raise PlanValidationError(f"Plan is not valid JSON: {raw_plan}")
+        if not isinstance(plan, dict):
+            raise PlanValidationError(f"Plan is not a JSON object: {raw_plan}")
+        return plan
+
+    def plan_request(self, state: State) -> Dict[str, Any]:
+        prompt = PLAN_PROMPT.format(spec=state["api_spec_yaml"], query=state["user_query"])
+        with llm_slot():
+            raw_plan = self.plan_llm.invoke(prompt).content
+        return self._parse_plan(raw_plan)
+
+    async def aplan_request(self, state: State) -> Dict[str, Any]:
+        prompt = PLAN_PROMPT.format(spec=state["api_spec_yaml"], query=state["user_query"])
+        async with allm_slot():
+            raw_plan = (await self.plan_llm.ainvoke(prompt)).content
+        return self._parse_plan(raw_plan)
+
+    @staticmethod
+    def validate_plan(plan: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Check a call plan against the flattened spec and return the request to send
+        (method, url, params, body). Raises PlanValidationError if the plan doesn't fit the spec.
+        """
+        method = str(plan.get("method", "")).lower()
+        path = str(plan.get("path", ""))
+        operation = spec.get("paths", {}).get(path, {}).get(method)
+        if operation is None:
+            raise PlanValidationError(f"{method.upper()} {path} is not documented in the spec")
+
+        base_url = (spec.get("servers") or [{}])[0].get("url", "")
+        if not re.match(r"https?://", base_url):
+            raise PlanValidationError(f"Spec has no absolute server url: '{base_url}'")
+
+        path_params = plan.get("path_params") or {}
+        query_params = plan.get("query_params") or {}
+        if not isinstance(path_params, dict) or not isinstance(query_params, dict):
+            raise PlanValidationError("path_params and query_params must be JSON objects")
+
+        documented = {p.get("name"): p for p in operation.get("parameters", []) if isinstance(p, dict)}
+        template_params = re.findall(r"{([^}]+)}", path)
+        missing = [name for name in template_params if path_params.get(name) in (None, "")]
+        if missing:
+            raise PlanValidationError(f"Missing path parameters: {', '.join(missing)}")
+        required = [
+            name for name, p in documented.items()
+            if p.get("required") and p.get("in") == "query" and name not in query_params
+        ]
+        if required:
+            raise PlanValidationError(f"Missing required query parameters: {', '.join(required)}")
+        unknown = [name for name in query_params if name not in documented]
+        if unknown:
+            raise PlanValidationError(f"Undocumented query parameters: {', '.join(unknown)}")
+
+        url_path = path
+        for name in template_params:
+            url_path = url_path.replace("{" + name + "}", quote(str(path_params[name]), safe=""))
+
+        return {
+            "method": method,
+            "path": path,
+            "url": base_url.rstrip("/") + url_path,
+            "params": query_params,
+            "body": plan.get("body"),
+        }
+
+    @staticmethod
+    def _request_args(request: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "method": request["method"],
+            "url": request["url"],
+            "params": request["params"] or None,
+            "json": request["body"] if request["method"] not in ["get", "delete"] else None,
+        }
+
+    def send_request(self, request: Dict[str, Any]) -> tuple:
+        """Send the validated request; returns (status code, response text)."""
+        resp = get_http_client().request(**self._request_args(request))
+        if resp.from_cache:
+            print("Response served from the HTTP cache")
+        return resp.status_code, resp.pretty_text()
+
+    async def asend_request(self, request: Dict[str, Any]) -> tuple:
+        resp = await get_async_http_client().request(**self._request_args(request))
+        if resp.from_cache:
+            print("Response served from the HTTP cache")
+        return resp.status_code, resp.pretty_text()
+
+    @staticmethod
+    def _plan_result(state: State, request: Dict[str, Any], status: int, last_response: str) -> State:
+        if status >= 400:
+            last_response = f"HTTP {status}\n{last_response}"
+        print(f"\nResult using: {state.get('current_api_path')} \n{last_response}\n")
+        return {
+            **state,
+            "last_response": last_response,
+            "last_status": status,
+            "last_request": {"method": request["method"], "path": request["path"], "url": request["url"]},
+        }
+
+    def plan_call(self, state: State) -> Dict[str, Any] | None:
+        """The validated request of the LLM call plan, None if the plan is invalid."""
+        try:
+            spec = yaml.safe_load(state.get("api_spec_yaml") or "") or {}
+            return self.validate_plan(self.plan_request(state), spec)
+        except Exception as e:
+            print(f"Call plan rejected, falling back to the React agent: {e}")
+            count("plan_rejected")
+            return None
+
+    async def aplan_call(self, state: State) -> Dict[str, Any] | None:
+        try:
+            spec = yaml.safe_load(state.get("api_spec_yaml") or "") or {}
+            return self.validate_plan(await self.aplan_request(state), spec)
+        except Exception as e:
+            print(f"Call plan rejected, falling back to the React agent: {e}")
+            count("plan_rejected")
+            return None
+
+    def send_plan(self, state: State, request: Dict[str, Any]) -> State:
+        print(f"Sending {request['method'].upper()} {request['url']}")
+        try:
+            status, last_response = self.send_request(request)
+        except (requests.RequestException, httpx.HTTPError) as e:
+            print(f"Request failed: {e}")
+            return {**state, "last_response": None}
+        return self._plan_result(state, request, status, last_response)
+
+    async def asend_plan(self, state: State, request: Dict[str, Any]) -> State:
+        print(f"Sending {request['method'].upper()} {request['url']}")
+        try:
+            status, last_response = await self.asend_request(request)
+        except (requests.RequestException, httpx.HTTPError) as e:
+            print(f"Request failed: {e}")
+            return {**state, "last_response": None}
+        return self._plan_result(state, request, status, last_response)
+
+    def run_plan(self, state: State) -> State | None:
+        """Fast path: one LLM call for the plan, one HTTP call. Returns None if the plan is invalid."""
+        request = self.plan_call(state)
+        return self.send_plan(state, request) if request is not None else None
+
+    async def arun_plan(self, state: State) -> State | None:
+        request = await self.aplan_call(state)
+        return await self.asend_plan(state, request) if request is not None else None
+
+    @staticmethod
+    def tool_request(result: Any) -> Dict[str, Any] | None:
+        """
+        The HTTP method the React agent's tool calls used, as last_request: a write
+        (post, put...) wins over gets. None if the agent didn't call any tool.
+        """
+        methods = [
+            call.get("name", "")[len("requests_"):]
+            for message in (result.get("messages", []) if isinstance(result, dict) else [])
+            for call in (getattr(message, "tool_calls", None) or [])
+            if call.get("name", "").startswith("requests_")
+        ]
+        if not methods:
+            return None
+        writes = [m for m in methods if m != "get"]
+        return {"method": writes[-1] if writes else "get"}
+
+    @staticmethod
+    def _agent_result(state: State, result: Any) -> State:
+        last_response = None
+        if isinstance(result, dict) and "messages" in result and result["messages"]:
+            last_response = result["messages"][-1].content
+        else:
+            last_response = str(result)
+
+        print(f"\nResult using: {state.get('current_api_path')} \n{last_response}\n")
+
+        return {**state, "last_response": last_response, "last_status": None,
+                "last_request": ExecutorAgent.tool_request(result)}
 
     def run(self, state: State) -> State:
         print("Running ExecutorAgent...")
         if not state.get("system_message"):
             return state
 
+        if self.mode == "plan":
+            result = self.run_plan(state)
+            if result is not None:
+                return result
+
         try:
             print("Generating the answer...")
-            toolkit = RequestsToolkit(
-                requests_wrapper=TextRequestsWrapper(headers={}),
-                allow_dangerous_requests=ALLOW_DANGEROUS_REQUEST,
+            agent = create_react_agent(
+                self.llm,
+                self.http_tools,
+                prompt=state["system_message"]
             )
 
-            http_tools = toolkit.get_tools()
+            with llm_slot():
+                result = agent.invoke({"messages": [("user", state["user_query"])]})
+
+        except Exception as e:
+            print(f"Executor agent execution failed: {e}")
+            return {**state, "last_response": None}
+
+        return self._agent_result(state, result)
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: LLM calls and HTTP requests are awaited on the event loop."""
+        print("Running ExecutorAgent...")
+        if not state.get("system_message"):
+            return state
 
+        if self.mode == "plan":
+            result = await self.arun_plan(state)
+            if result is not None:
+                return result
+
+        try:
+            print("Generating the answer...")
             agent = create_react_agent(
                 self.llm,
-                http_tools,
+                self.http_tools,
                 prompt=state["system_message"]
             )
 
-            result = agent.invoke({"messages": [("user", state["user_query"])]})
+            async with allm_slot():
+                result = await agent.ainvoke({"messages": [("user", state["user_query"])]})
 
         except Exception as e:
             print(f"Executor agent execution failed: {e}")
             return {**state, "last_response": None}
-        
-        last_response = None
-        if isinstance(result, dict) and "messages" in result and result["messages"]:
-            last_response = result["messages"][-1].content
-        else:
-            last_response = str(result)
-
-        print(f"\nResult using: {state.get('current_api_path')} \n{last_response}\n")
 
-        return {**state, "last_response": last_response}
+        return self._agent_result(state, result)
@@ -1,6 +1,13 @@
+import re
+import json
+import xml.etree.ElementTree as ET
+from typing import Any
 from langchain_ollama import OllamaLLM
-from state import State
-from config import EXTRACTOR_MODEL  
+from state import State, strip_instructions
+from concurrency import llm_slot, allm_slot
+from instrumentation import LLMTraceHandler, count
+from agents.converter import response_properties
+from config import EXTRACTOR_MODEL, EXTRACTOR_MODE, EXTRACT_MAX_CHARS
 
 EXTRACT_PROMPT = """
 You are an agent that converts raw API responses into a concise, human-readable answer.
@@ -17,28 +24,181 @@ User question: {query}
 API response: {response}
 """
 
+# Fields that identify an item and are kept even when not mentioned in the query
+IDENTITY_FIELDS = {"id", "name", "title", "word"}
+SIMPLE_MAX_FIELDS = 8
+
+
+def parse_structured(text: str) -> Any:
+    """Parse a JSON or XML response into Python data; None for anything else."""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    if text.startswith("<") and not text.lower().startswith(("<!doctype html", "<html")):
+        try:
+            return xml_to_data(ET.fromstring(text))
+        except ET.ParseError:
+            pass
+    return None
+
+
+def xml_to_data(element: ET.Element) -> Any:
+    children = list(element)
+    if not children:
+        return (element.text or "").strip()
+    data = {}
+    for child in children:
+        data.setdefault(child.tag, []).append(xml_to_data(child))
+    return {k: v[0] if len(v) == 1 else v for k, v in data.items()}
+
+
+def words(text: str) -> set:
+    """Lowercase words of a text, plus the naive singular of plurals ("titles" -> "title")."""
+    found = set(re.findall(r"[a-z0-9]+", text.lower()))
+    return found | {w[:-1] for w in found if len(w) > 3 and w.endswith("s")}
+
+
+def select_fields(keys: list, query_words: set, schema_props: set) -> list:
+    """
+    The documented schema fields plus the keys mentioned in the query, else everything.
+    Undocumented fields are dropped only when a schema is known: a query mentioning one
+    key ("word") must not hide the others ("definitions").
+    """
+    if not schema_props:
+        return keys
+    kept = [k for k in keys if k in schema_props or k in IDENTITY_FIELDS
+            or words(str(k).replace("_", " ")) & query_words]
+    return kept or keys
+
+
+def prune(data: Any, query_words: set, schema_props: set, max_items: int, max_str: int, depth: int = 0) -> Any:
+    """Reduce a parsed response to the fields relevant to the query, capping lists and strings."""
+    if isinstance(data, dict):
+        keys = select_fields(list(data.keys()), query_words, schema_props if depth == 0 else set())
+        return {k: prune(data[k], query_words, set(), max_items, max_str, depth + 1) for k in keys}
+    if isinstance(data, list):
+        items = [prune(item, query_words, schema_props, max_items, max_str, depth) for item in data[:max_items]]
+        if len(data) > max_items:
+            items.append(f"... {len(data) - max_items} more items")
+        return items
+    if isinstance(data, str) and len(data) > max_str:
+        return data[:max_str] + "..."
+    return data
+
+
+def compact_response(data: Any, query: str, schema_props: set, max_chars: int = EXTRACT_MAX_CHARS) -> tuple:
+    """
+    Prune the data, shrinking the list/string caps until its JSON fits `max_chars`.
+    Returns (pruned data, JSON text); the text is cut if even the smallest caps don't fit.
+    """
+    query_words = words(query)
+    max_items, max_str = 50, 500
+    while True:
+        pruned = prune(data, query_words, schema_props, max_items, max_str)
+        text = json.dumps(pruned, ensure_ascii=False)
+        if len(text) <= max_chars or max_items == 1:
+            return pruned, text[:max_chars]
+        max_items, max_str = max(1, max_items // 2), max(50, max_str // 2)
+
+
+def render_simple(data: Any) -> str | None:
+    """Plain-text rendering of simple responses (scalars, small flat objects or lists); None otherwise."""
+    if isinstance(data, (str, int, float, bool)):
+        return str(data)
+    if isinstance(data, dict) and 0 < len(data) <= SIMPLE_MAX_FIELDS \
+            and all(isinstance(v, (str, int, float, bool)) for v in data.values()):
+        return "\n".join(f"{k}: {v}" for k, v in data.items())
+    if isinstance(data, list) and 0 < len(data) <= 3 * SIMPLE_MAX_FIELDS \
+            and all(isinstance(v, (str, int, float)) for v in data):
+        return ", ".join(str(v) for v in data)
+    return None
+
+
 class ExtractorAgent:
     """
     ExtractorAgent takes the raw API response and produces a concise, human-readable answer.
     It uses an LLM to reformat or extract only the relevant information.
+    JSON/XML responses are pruned to the relevant fields and capped in size before
+    the LLM sees them; with mode "auto" simple responses are rendered without the LLM,
+    with mode "direct" the LLM is never called.
     """
 
-    def __init__(self, llm_model: str = EXTRACTOR_MODEL):
-        self.llm = OllamaLLM(model=llm_model)
+    def __init__(self, llm_model: str = EXTRACTOR_MODEL, mode: str = EXTRACTOR_MODE):
+        self.llm = OllamaLLM(model=llm_model, callbacks=[LLMTraceHandler("extract")])
+        self.mode = mode
+
+    def pre_extract(self, state: State) -> tuple:
+        """Returns (response to show the LLM, answer rendered without the LLM or None)."""
+        last_response = state["last_response"]
+        data = parse_structured(last_response)
+        if data is None:
+            return last_response[:EXTRACT_MAX_CHARS], None
+
+        schema_props = response_properties(state.get("api_spec_yaml"), state.get("last_request"))
+        pruned, compact = compact_response(data, strip_instructions(state.get("user_query", "")), schema_props)
+        if self.mode == "llm":
+            return compact, None
+        # A pruned response may have lost the answer: only the LLM sees it then
+        direct = render_simple(pruned) if pruned == data else None
+        if direct is None and self.mode == "direct":
+            direct = compact
+        return compact, direct
+
+    def build_prompt(self, state: State) -> tuple:
+        """Returns (prompt for the LLM, None) or (None, answer rendered without the LLM)."""
+        last_response = state["last_response"]
+        try:
+            compact, direct = self.pre_extract(state)
+        except Exception as e:
+            print(f"Pre-extraction failed, using the raw response: {e}")
+            compact, direct = last_response, None
+        if direct is not None:
+            print(f"Extracted answer (no LLM):\n{direct}\n")
+            count("extract_without_llm")
+            return None, direct
+        return EXTRACT_PROMPT.format(query=strip_instructions(state.get("user_query", "")), response=compact), None
 
     def run(self, state: State) -> State:
         print("Running ExtractorAgent...")
-        last_response = state.get("last_response")
-        user_query = state.get("user_query", "")
+        if not state.get("last_response"):
+            return state
+
+        prompt, direct = self.build_prompt(state)
+        if direct is not None:
+            return {**state, "last_response": direct, "done": True}
 
-        if not last_response:
+        try:
+            print("Extracting human-readable answer from API response...")
+            with llm_slot():
+                extracted = self.llm.invoke(prompt)
+            print(f"Extracted answer:\n{extracted}\n")
+            return {
+                **state,
+                "last_response": extracted,
+                "done": True
+            }
+        except Exception as e:
+            return {
+                **state,
+                "error": f"ExtractorAgent error: {e}"
+            }
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: the LLM call is awaited."""
+        print("Running ExtractorAgent...")
+        if not state.get("last_response"):
             return state
 
-        prompt = EXTRACT_PROMPT.format(query=user_query, response=last_response)
+        prompt, direct = self.build_prompt(state)
+        if direct is not None:
+            return {**state, "last_response": direct, "done": True}
 
         try:
             print("Extracting human-readable answer from API response...")
-            extracted = self.llm.invoke(prompt)
+            async with allm_slot():
+                extracted = await self.llm.ainvoke(prompt)
             print(f"Extracted answer:\n{extracted}\n")
             return {
                 **state,
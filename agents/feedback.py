@@ -1,9 +1,12 @@
 import re
-import requests
 import json
 from state import State
+from concurrency import llm_slot, allm_slot
+from instrumentation import LLMTraceHandler, count
+from agents.converter import response_properties
+from http_client import get_http_client, get_async_http_client
 from langchain_ollama import OllamaLLM
-from config import FEEDBACK_MODEL
+from config import FEEDBACK_MODEL, FEEDBACK_RULES
 
 EVAL_PROMPT = """
 You are the Feedback Agent. 
@@ -24,44 +27,110 @@ Reply ONLY in JSON:
 - {"action": "reformulate", "new_query": "<better user query>"}
 """
 
+URL_ONLY = re.compile(r"^\s*<?(https?://[^\s\"'<>]+)>?\s*$")
+HTTP_ERROR_PREFIX = re.compile(r"^\s*HTTP ([45]\d\d)\b")
+TOOL_REMINDER = "Send the request with your tool and return ONLY the raw HTTP response."
+
+
+def is_error_body(data) -> bool:
+    if not isinstance(data, dict):
+        return False
+    status = data.get("status", data.get("statusCode"))
+    if isinstance(status, int) and status >= 400:
+        return True
+    if isinstance(status, str) and status.lower() in ["error", "fail", "failed"]:
+        return True
+    return set(data.keys()) <= {"error", "errors", "message", "status", "code", "detail"} \
+        and ("error" in data or "errors" in data)
+
+
+def classify_response(state: State) -> dict | None:
+    """
+    Deterministic verdict for clear-cut responses, None when the LLM has to decide.
+    - fenced code -> reformulate (the executor explained instead of calling the API), next_file the second time
+    - a lone URL -> fetch_url (once)
+    - HTTP error status or error body -> next_file
+    - parseable, non-empty JSON whose keys are mostly documented response properties -> accept
+    """
+    text = str(state.get("last_response") or "").strip()
+    user_query = state.get("user_query", "")
+
+    if "```" in text:
+        if TOOL_REMINDER in user_query:
+            # Already reformulated: the same query would produce the same explanation
+            return {"action": "next_file"}
+        return {"action": "reformulate", "new_query": f"{user_query}\n{TOOL_REMINDER}"}
+
+    if URL_ONLY.match(text):
+        return {"action": "fetch_url"} if not state.get("fetched_url") else None
+
+    status = state.get("last_status")
+    if (isinstance(status, int) and status >= 400) or HTTP_ERROR_PREFIX.match(text):
+        return {"action": "next_file"}
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if is_error_body(data):
+        return {"action": "next_file"}
+    if not data or not isinstance(data, (dict, list)):
+        return None
+
+    # Without a documented schema, any JSON could be the wrong API's answer: the LLM decides
+    props = response_properties(state.get("api_spec_yaml"), state.get("last_request"))
+    sample = data[0] if isinstance(data, list) else data
+    if not props or not isinstance(sample, dict) or not sample:
+        return None
+    if 2 * len(props & set(sample.keys())) < len(sample):
+        return None
+    return {"action": "accept"}
+
+
 class FeedbackAgent:
     """
     FeedbackAgent evaluates the last API response generated by the ExecutorAgent
     and decides the next step in the multi-agent pipeline. It can accept the output,
     fetch a URL, move to the next API, or reformulate the user query.
+    Clear-cut responses are classified by deterministic rules (classify_response);
+    only ambiguous ones are evaluated by the LLM.
     """
 
-    def __init__(self, llm_model: str = FEEDBACK_MODEL):
-        self.llm = OllamaLLM(model=llm_model)
-
-    def run(self, state: State) -> State:
-        print("Running FeedbackAgent...")
-        last_response = state.get("last_response")
-        current_index = state.get("current_index", 0)
-        candidate_files = state.get("candidate_files", []) or []
+    def __init__(self, llm_model: str = FEEDBACK_MODEL, use_rules: bool = FEEDBACK_RULES):
+        self.llm = OllamaLLM(model=llm_model, callbacks=[LLMTraceHandler("feedback")])
+        self.use_rules = use_rules
 
-        if not last_response:
-            next_index = min(current_index + 1, len(candidate_files) - 1)
+    @staticmethod
+    def _next_file_state(state: State) -> State:
+        next_index = state.get("current_index", 0) + 1
+        if next_index >= len(state.get("candidate_files", []) or []):
+            # Clamping to the last file would retry it forever: the run ends here
+            print("No candidate API left")
             return {**state,
-                    "current_index": next_index,
+                    "done": True,
+                    "error": "No candidate API returned an accepted response",
                     "last_response": None,
-                    "api_spec_yaml": None,
-                    "system_message": None,
                     "fetched_url": False}
-
-        user_query = state.get("user_query", "")
-        eval_input = f"User query: {user_query}\nAPI response: {last_response}"
-
-        try:
-            raw_output = self.llm.invoke(EVAL_PROMPT + "\n\n" + eval_input)
-        except Exception as e:
-            return {**state, "error": f"FeedbackAgent LLM error: {e}"}
-
-        try:
-            decision = json.loads(raw_output.strip().split("\n")[-1])
-        except Exception:
-            return {**state, "error": f"Invalid feedback output: {raw_output}"}
-
+        return {**state,
+                "current_index": next_index,
+                "last_response": None,
+                "api_spec_yaml": None,
+                "system_message": None,
+                "fetched_url": False}
+
+    def _eval_prompt(self, state: State) -> str:
+        eval_input = f"User query: {state.get('user_query', '')}\nAPI response: {state.get('last_response')}"
+        return EVAL_PROMPT + "\n\n" + eval_input
+
+    @staticmethod
+    def _url_to_fetch(state: State) -> str | None:
+        if state.get("fetched_url", False):
+            return None
+        url_match = re.search(r"(https?://[^\s\"']+)", str(state.get("last_response")))
+        return url_match.group(1) if url_match else None
+
+    def _apply_decision(self, state: State, decision: dict) -> State:
+        """State update for every action except a URL that still has to be fetched."""
         action = decision.get("action")
 
         if action == "accept":
@@ -69,37 +138,14 @@ class FeedbackAgent:
             state["accepted"] = True
             return state
 
-        elif action == "fetch_url":
-            if not state.get("fetched_url", False):
-                url_match = re.search(r"(https?://[^\s\"']+)", str(last_response))
-                if url_match:
-                    url = url_match.group(1)
-                    state["fetched_url"] = True
-                    try:
-                        resp = requests.get(url, timeout=10)
-                        try:
-                            data = resp.json()
-                            state["last_response"] = json.dumps(data, indent=2, ensure_ascii=False)
-                        except ValueError:
-                            state["last_response"] = resp.text
-                        print(f"\nFetched URL response:\n{state['last_response']}\n")
-                        return self.run(state)
-                    except Exception as e:
-                        return {**state, "error": f"Failed to fetch {url}: {e}"}
-
-        elif action == "next_file":
+        elif action in ["next_file", "fetch_url"]:
+            # fetch_url lands here only when there is nothing (left) to fetch
             print("Trying next API")
-            next_index = min(current_index + 1, len(candidate_files) - 1)
-            return {**state,
-                    "current_index": next_index,
-                    "last_response": None,
-                    "api_spec_yaml": None,
-                    "system_message": None,
-                    "fetched_url": False}
+            return self._next_file_state(state)
 
         elif action == "reformulate":
             print("Reformulating user query")
-            new_query = decision.get("new_query", user_query)
+            new_query = decision.get("new_query", state.get("user_query", ""))
             return {**state,
                     "user_query": new_query,
                     "retrieved": False,
@@ -112,3 +158,74 @@ class FeedbackAgent:
             return {**state,
                     "error": f"Unknown action from feedback: {decision}",
                     "fetched_url": False}
+
+    def run(self, state: State) -> State:
+        print("Running FeedbackAgent...")
+        if not state.get("last_response"):
+            return self._next_file_state(state)
+
+        decision = classify_response(state) if self.use_rules else None
+
+        if decision is not None:
+            print(f"Rule-based feedback verdict: {decision['action']}")
+            count("feedback_rule_verdict")
+        else:
+            try:
+                with llm_slot():
+                    raw_output = self.llm.invoke(self._eval_prompt(state))
+            except Exception as e:
+                return {**state, "error": f"FeedbackAgent LLM error: {e}"}
+
+            try:
+                decision = json.loads(raw_output.strip().split("\n")[-1])
+            except Exception:
+                return {**state, "error": f"Invalid feedback output: {raw_output}"}
+
+        url = self._url_to_fetch(state) if decision.get("action") == "fetch_url" else None
+        if url is None:
+            return self._apply_decision(state, decision)
+
+        state["fetched_url"] = True
+        try:
+            resp = get_http_client().get(url)
+        except Exception as e:
+            return {**state, "error": f"Failed to fetch {url}: {e}"}
+        state["last_response"] = resp.pretty_text()
+        print(f"\nFetched URL response:\n{state['last_response']}\n")
+        return self.run(state)
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: the LLM evaluation and the URL fetch are awaited."""
+        print("Running FeedbackAgent...")
+        if not state.get("last_response"):
+            return self._next_file_state(state)
+
+        decision = classify_response(state) if self.use_rules else None
+
+        if decision is not None:
+            print(f"Rule-based feedback verdict: {decision['action']}")
+            count("feedback_rule_verdict")
+        else:
+            try:
+                async with allm_slot():
+                    raw_output = await self.llm.ainvoke(self._eval_prompt(state))
+            except Exception as e:
+                return {**state, "error": f"FeedbackAgent LLM error: {e}"}
+
+            try:
+                decision = json.loads(raw_output.strip().split("\n")[-1])
+            except Exception:
+                return {**state, "error": f"Invalid feedback output: {raw_output}"}
+
+        url = self._url_to_fetch(state) if decision.get("action") == "fetch_url" else None
+        if url is None:
+            return self._apply_decision(state, decision)
+
+        state["fetched_url"] = True
+        try:
+            resp = await get_async_http_client().get(url)
+        except Exception as e:
+            return {**state, "error": f"Failed to fetch {url}: {e}"}
+        state["last_response"] = resp.pretty_text()
+        print(f"\nFetched URL response:\n{state['last_response']}\n")
+        return await self.arun(state)
@@ -1,59 +1,190 @@
+import asyncio
+import threading
 from pathlib import Path
-from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from config import SERVICE_FOLDER, INDEX_PATH, EMBEDDING_MODEL
+from config import SERVICE_FOLDER, INDEX_PATH, EMBEDDING_MODEL, INGEST_WORKERS, HTML_CONVERSION_MODE
+from agents import get_agent
+from agents.converter import HtmlConversionStatus
+from bm25_index import BM25Index, get_bm25_handle
 from data_ingestor import DataIngestor
+from embedding_pipeline import BatchedEmbeddings
+from index_manifest import IndexManifest
 from state import State
+from vector_store import get_vectorstore_handle, index_exists, load_store, new_store, iter_documents, vector_count
+from semantic_cache import get_semantic_cache
 
 
 class Indexer:
     """
     LangGraph node that builds/updates the FAISS index when requested.
+    The index is updated incrementally using the manifest stored next to it:
+    only added/modified files are ingested and embedded, vectors of deleted
+    or modified files are removed and unchanged files are left alone.
+    The BM25 index (bm25.json) is kept in sync with the same chunk ids.
+    HTML sources are then converted to OpenAPI specs (see convert_html_specs).
     """
 
+    _conversion_lock = threading.Lock()
+    # Concurrent queries may all ask for reindexing: updates are serialized
+    _index_lock = threading.Lock()
+
     def __init__(self, services_dir=SERVICE_FOLDER, index_path=INDEX_PATH, embedding_model=EMBEDDING_MODEL):
         self.services_dir = Path(services_dir)
         self.index_path = Path(index_path)
-        self.embedding = OllamaEmbeddings(model=embedding_model)
+        self.embedding = BatchedEmbeddings(model=embedding_model)
+        self.store_handle = get_vectorstore_handle(index_path, embedding_model)
+        self.bm25_handle = get_bm25_handle(index_path)
         self.vectorstore = None
 
-    def _create_index(self):
-        """Build a new FAISS index from the documents in the service directory."""
+    def _load_existing_index(self):
+        if not index_exists(self.index_path):
+            return None
+        try:
+            return load_store(self.index_path, self.embedding, writable=True)
+        except Exception as e:
+            print(f"Existing index could not be loaded, rebuilding it: {e}")
+            return None
+
+    def _load_bm25(self, vectorstore) -> tuple:
+        """Returns (BM25 index to update, whether it had to be rebuilt from the FAISS docstore)."""
+        bm25 = BM25Index.load(self.index_path) if vectorstore is not None else None
+        if bm25 is not None or vectorstore is None:
+            return bm25 or BM25Index(), False
+        # FAISS index built before BM25 existed (or bm25.json lost): index its chunks as they are
+        bm25 = BM25Index()
+        for doc_id, doc in iter_documents(vectorstore):
+            bm25.add(doc_id, doc.page_content, str(doc.metadata.get("source", "")))
+        print(f"BM25 index rebuilt from {len(bm25)} indexed chunks")
+        return bm25, True
+
+    def _add_chunks(self, vectorstore, chunks, ids):
+        if vectorstore is None:
+            return new_store(chunks, self.embedding, ids, self.index_path)
+        vectorstore.add_documents(chunks, ids=ids)
+        return vectorstore
+
+    def _create_index(self, html_conversion: str = HTML_CONVERSION_MODE):
+        """
+        Build or incrementally update the FAISS index from the documents in the service directory.
+        `html_conversion` is "background", "sync" or "off" (see HTML_CONVERSION_MODE).
+        """
+        self.embedding.reset_stats()
+        manifest = IndexManifest.load(self.index_path)
+        vectorstore = self._load_existing_index() if manifest.files else None
+        if vectorstore is None:
+            # Without a usable index every file has to be ingested again
+            manifest = IndexManifest(self.index_path)
+        bm25, bm25_rebuilt = self._load_bm25(vectorstore)
+
+        diff = manifest.scan(self.services_dir)
+        print(f"Index changes: {len(diff.added)} added, {len(diff.modified)} modified, "
+              f"{len(diff.removed)} removed, {len(diff.unchanged)} unchanged")
+
+        stale_ids = []
+        for name in diff.removed + diff.modified:
+            stale_ids.extend(manifest.remove(name))
+        if vectorstore is not None and stale_ids:
+            vectorstore.delete(stale_ids)
+        bm25.remove(stale_ids)
+        answers = get_semantic_cache()
+        if answers is not None:
+            for name in diff.removed + diff.modified:
+                answers.invalidate_file(str(self.services_dir / name))
+
+        for name in diff.unchanged:
+            if name in diff.hashes:
+                # Touched but identical: refresh size/mtime so the next scan skips hashing it
+                manifest.record(self.services_dir / name, diff.hashes[name], manifest.files[name]["ids"])
+
         ingestor = DataIngestor()
-        chunks = []
+        paths = [str(self.services_dir / name) for name in diff.added + diff.modified]
+        embedded, pending_chunks, pending_ids = 0, [], []
+        # Chunks are embedded as files finish parsing, in groups large enough to fill every embedding worker
+        flush_size = self.embedding.batch_size * self.embedding.max_workers
 
-        for file in self.services_dir.iterdir():
-            if not file.is_file():
+        for file_path, docs, error in ingestor.iter_load_files(paths, INGEST_WORKERS):
+            file = Path(file_path)
+            sha256 = diff.hashes[file.name]
+            if error:
+                print(f"Error loading {file.name}: {error}")
+                # Recorded with no vectors so an unparsable file doesn't trigger reindexing forever
+                manifest.record(file, sha256, [], error=error)
                 continue
-            try:
-                ext = file.suffix.lower()
-                if ext == ".html":
-                    docs = ingestor.load_html(str(file))
-                elif ext in [".yaml", ".yml"]:
-                    docs = ingestor.load_openapi_yaml(str(file))
-                elif ext == ".json":
-                    docs = ingestor.load_openapi_json(str(file))
-                else:
-                    continue
-                chunks.extend(docs)
-            except Exception as e:
-                print(f"Error loading {file.name}: {e}")
-
-        if not chunks:
+            doc_ids = [f"{file.name}#{sha256[:12]}#{i}" for i in range(len(docs))]
+            manifest.record(file, sha256, doc_ids)
+            bm25.add_documents(docs, doc_ids)
+            pending_chunks.extend(docs)
+            pending_ids.extend(doc_ids)
+            if len(pending_chunks) >= flush_size:
+                vectorstore = self._add_chunks(vectorstore, pending_chunks, pending_ids)
+                embedded += len(pending_chunks)
+                pending_chunks, pending_ids = [], []
+
+        if pending_chunks:
+            vectorstore = self._add_chunks(vectorstore, pending_chunks, pending_ids)
+            embedded += len(pending_chunks)
+        if embedded:
+            print(self.embedding.stats.report())
+
+        if vectorstore is None or not manifest.all_ids():
             print("No documents ingested during indexing. Index will not be created.")
             return None
 
-        self.vectorstore = FAISS.from_documents(chunks, self.embedding)
-        self.vectorstore.save_local(str(self.index_path))
-        print(f"FAISS index created at {self.index_path}, total vectors: {self.vectorstore.index.ntotal}")
+        if diff.has_changes or diff.hashes or bm25_rebuilt:
+            vectorstore.save_local(str(self.index_path))
+            bm25.save(self.index_path)
+            manifest.save()
+            # Swap the new index into the shared handle; queries pinned to the old version keep it
+            self.store_handle.publish(manifest.version, vectorstore)
+            # Never mutated after this point: the next update works on a fresh copy loaded from disk
+            self.bm25_handle.publish(manifest.version, bm25)
+        self.vectorstore = vectorstore
+        if html_conversion != "off":
+            self.convert_html_specs(vectorstore, background=html_conversion == "background")
+        print(f"FAISS index updated at {self.index_path}, embedded chunks: {embedded}, "
+              f"total vectors: {vector_count(self.vectorstore)}")
         return self.vectorstore
 
+    def convert_html_specs(self, vectorstore, background: bool = True):
+        """
+        Offline stage: generate the OpenAPI specs of the HTML sources whose content hash
+        has no converted spec yet, so the query path only reads ready specs.
+        """
+        manifest = IndexManifest.load(self.index_path)
+        html_files = {name: entry for name, entry in manifest.files.items() if name.lower().endswith(".html")}
+        status = HtmlConversionStatus()
+        status.prune(list(html_files))
+        todo = [
+            (entry["path"], entry["sha256"]) for name, entry in html_files.items()
+            if entry.get("ids") and not status.is_ready(name, entry["sha256"])
+        ]
+        if not todo:
+            return None
+        for file_path, sha256 in todo:
+            status.set(Path(file_path).name, sha256, "pending")
+
+        # The pipeline's converter: one LLM client and spec cache per process
+        converter = get_agent("prepare")
+
+        def convert():
+            with self._conversion_lock:
+                converter.convert_html_sources(todo, vectorstore)
+
+        if not background:
+            convert()
+            return None
+        print(f"Converting {len(todo)} HTML documents to OpenAPI in the background")
+        # Not a daemon: a one-shot CLI run finishes the conversion before exiting
+        thread = threading.Thread(target=convert, name="html-openapi-conversion")
+        thread.start()
+        return thread
+
     def run(self, state: State) -> State:
         """
-        LangGraph node: builds FAISS index and resets needs_reindex flag.
+        LangGraph node: updates the FAISS index and resets needs_reindex flag.
         """
-        print("Running Indexer...\nrebuilding FAISS index")
-        vectorstore = self._create_index()
+        print("Running Indexer...\nupdating FAISS index")
+        with self._index_lock:
+            vectorstore = self._create_index()
         if not vectorstore:
             return {**state, "done": True, "error": "Indexing failed: no documents found"}
 
@@ -64,3 +195,7 @@ class Indexer:
             #"retrieved": False,
             #"done": False,
         }
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: indexing runs in a worker thread, the event loop stays free."""
+        return await asyncio.to_thread(self.run, state)
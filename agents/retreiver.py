@@ -1,56 +1,51 @@
-import os
+import asyncio
 from pathlib import Path
-from langchain_ollama import OllamaLLM, OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
+from typing import Optional
+from langchain_ollama import OllamaLLM
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from config import SERVICE_FOLDER, INDEX_PATH, EMBEDDING_MODEL, RETRIEVER_MODEL
-from state import State
+from config import (SERVICE_FOLDER, INDEX_PATH, EMBEDDING_MODEL, RETRIEVER_MODEL, RETRIEVER_MODE, RETRIEVER_K,
+                    RETRIEVER_FETCH_K, RETRIEVER_RERANK)
+from index_manifest import IndexManifest
+from state import State, strip_instructions
+from concurrency import llm_slot, allm_slot
+from instrumentation import LLMTraceHandler, span, count
+from ranking import aggregate_file_scores, aggregate_source_scores, lexical_rerank, rrf_fuse
+from bm25_index import BM25_NAME, get_bm25_handle
+from vector_store import get_vectorstore_handle, index_exists
 
 class RetrieverAgent:
     """
     RetrieverAgent queries the FAISS index and selects relevant documents for a given user query.
     Also checks if reindexing is needed.
+    In "vector" mode candidate files are ranked from the chunk relevance scores
+    (see ranking.py) and no LLM is called; "hybrid" fuses that ranking with the BM25 one.
     """
 
-    def __init__(self, services_dir=SERVICE_FOLDER, index_path=INDEX_PATH, embedding_model=EMBEDDING_MODEL, llm_model=RETRIEVER_MODEL):
+    def __init__(self, services_dir=SERVICE_FOLDER, index_path=INDEX_PATH, embedding_model=EMBEDDING_MODEL, llm_model=RETRIEVER_MODEL,
+                 mode=RETRIEVER_MODE, rerank=RETRIEVER_RERANK):
         self.services_dir = Path(services_dir)
         self.index_path = Path(index_path)
-        self.embedding = OllamaEmbeddings(model=embedding_model)
-        self.llm = OllamaLLM(model=llm_model)
-
-    def _get_current_files_set(self):
-        return {
-            f.name
-            for f in self.services_dir.iterdir()
-            if f.is_file() and f.suffix.lower() in [".html", ".json", ".yaml", ".yml"]
-        }
-
-    def _get_index_files_set(self):
-        if not self.index_path.exists():
-            return set()
-        try:
-            vs = FAISS.load_local(str(self.index_path), self.embedding, allow_dangerous_deserialization=True)
-            all_docs = list(vs.docstore._dict.values())
-            return {os.path.basename(doc.metadata.get("source", "")) for doc in all_docs}
-        except Exception:
-            return set()
-
-    def _needs_reindex(self) -> bool:
-        current_files = self._get_current_files_set()
-        index_files = self._get_index_files_set()
-        return current_files != index_files
-
-    def _load_vectorstore(self):
-        if not self.index_path.exists():
-            raise FileNotFoundError("Index path not found. Run Indexer first.")
-        return FAISS.load_local(
-            str(self.index_path),
-            self.embedding,
-            allow_dangerous_deserialization=True
-        )
-
-    def get_relevant_files(self, query: str, retriever, llm) -> list[str]:
+        self.store_handle = get_vectorstore_handle(index_path, embedding_model)
+        self.bm25_handle = get_bm25_handle(index_path)
+        self.llm = OllamaLLM(model=llm_model, callbacks=[LLMTraceHandler("retrieve")])
+        self.mode = mode
+        self.rerank = rerank
+
+    def _needs_reindex(self, manifest: IndexManifest) -> bool:
+        """
+        Compares the sidecar manifest with the service directory.
+        Only files whose size/mtime changed are hashed, the FAISS store is not touched.
+        """
+        if not manifest.files or not index_exists(self.index_path):
+            return True
+        if self.mode == "hybrid" and not (self.index_path / BM25_NAME).exists():
+            return True
+        diff = manifest.scan(self.services_dir)
+        # Touched-but-identical files are hashed too: let the Indexer refresh their stats
+        return diff.has_changes or bool(diff.hashes)
+
+    def _build_qa_chain(self, retriever, llm):
         prompt_template = PromptTemplate(
             input_variables=["context", "question"],
             template="""
@@ -75,7 +70,10 @@ class RetrieverAgent:
             chain_type_kwargs={"prompt": prompt_template},
         )
 
-        result = qa_chain.invoke({"query": query})
+        return qa_chain
+
+    @staticmethod
+    def _files_from_result(result: dict) -> list[str]:
         retrieved_docs = result.get("source_documents", [])
 
         if not retrieved_docs:
@@ -88,33 +86,99 @@ class RetrieverAgent:
                 files_by_source[source] = source
         return list(files_by_source.keys())
 
+    def get_relevant_files(self, query: str, retriever, llm) -> list[str]:
+        qa_chain = self._build_qa_chain(retriever, llm)
+        with llm_slot():
+            result = qa_chain.invoke({"query": query})
+        return self._files_from_result(result)
+
+    async def aget_relevant_files(self, query: str, retriever, llm) -> list[str]:
+        qa_chain = self._build_qa_chain(retriever, llm)
+        async with allm_slot():
+            result = await qa_chain.ainvoke({"query": query})
+        return self._files_from_result(result)
+
+    def rank_files(self, query: str, vectorstore, index_version: Optional[int] = None) -> list[str]:
+        """Candidate files ranked by aggregated chunk scores, without any LLM call."""
+        with span("retrieve", self.mode, rerank=self.rerank) as attrs:
+            docs_and_scores = vectorstore.similarity_search_with_relevance_scores(query, k=RETRIEVER_FETCH_K)
+            ranked = aggregate_file_scores(docs_and_scores)
+            if self.mode == "hybrid":
+                bm25 = self.bm25_handle.get(index_version)
+                hits = bm25.search(query, RETRIEVER_FETCH_K) if bm25 is not None else []
+                attrs["bm25_hits"] = len(hits)
+                ranked = rrf_fuse([ranked, aggregate_source_scores((source, score) for _, source, score in hits)])
+            if not ranked:
+                raise ValueError("No relevant API found in FAISS index")
+            if self.rerank == "lexical":
+                ranked = lexical_rerank(query, ranked, [doc for doc, _ in docs_and_scores])
+            attrs["chunks"] = len(docs_and_scores)
+        count("retrieve_without_llm")
+        return [source for source, _ in ranked[:RETRIEVER_K]]
+
+    def _open_index(self):
+        """Returns (index_version, vectorstore), or None when the index must be rebuilt first."""
+        manifest = IndexManifest.load(self.index_path)
+        if self._needs_reindex(manifest):
+            print("Retriever detected index out-of-date. Triggering Indexer...")
+            return None
+        return self.store_handle.get()
+
+    @staticmethod
+    def _mmr_retriever(vectorstore):
+        return vectorstore.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": RETRIEVER_K, "lambda_mult": 0.9, "fetch_k": RETRIEVER_FETCH_K},
+        )
+
+    @staticmethod
+    def _retrieved_state(state: State, files: list[str], index_version: int) -> State:
+        print("Relevant files retrieved:")
+        for f in files:
+            print(f" - {f}")
+
+        return {
+            **state,
+            #"retriever": retriever,
+            "candidate_files": files,
+            "current_index": 0,
+            "index_version": index_version,
+            "retrieved": True,
+            "needs_reindex": False,
+        }
+
     def run(self, state: State) -> State:
         try:
             print("Running RetrieverAgent...")
 
-            if self._needs_reindex():
-                print("Retriever detected index out-of-date. Triggering Indexer...")
+            opened = self._open_index()
+            if opened is None:
                 return {**state, "needs_reindex": True, "retrieved": False, "done": False}
+            index_version, vectorstore = opened
+            if self.mode in ["vector", "hybrid"]:
+                files = self.rank_files(strip_instructions(state["user_query"]), vectorstore, index_version)
+            else:
+                files = self.get_relevant_files(strip_instructions(state["user_query"]), self._mmr_retriever(vectorstore), self.llm)
+            return self._retrieved_state(state, files, index_version)
+
+        except Exception as e:
+            print(f"RetrieverAgent failed: {e}")
+            return {**state, "done": True, "error": str(e), "retrieved": True, "needs_reindex": False}
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: disk access and vector ranking run in a worker thread, the LLM call is awaited."""
+        try:
+            print("Running RetrieverAgent...")
 
-            vectorstore = self._load_vectorstore()
-            retriever = vectorstore.as_retriever(
-                search_type="mmr",
-                search_kwargs={"k": 5, "lambda_mult": 0.9, "fetch_k": 20},
-            )
-            files = self.get_relevant_files(state["user_query"], retriever, self.llm)
-
-            print("Relevant files retrieved:")
-            for f in files:
-                print(f" - {f}")
-
-            return {
-                **state,
-                #"retriever": retriever,
-                "candidate_files": files,
-                "current_index": 0,
-                "retrieved": True,
-                "needs_reindex": False,
-            }
+            opened = await asyncio.to_thread(self._open_index)
+            if opened is None:
+                return {**state, "needs_reindex": True, "retrieved": False, "done": False}
+            index_version, vectorstore = opened
+            if self.mode in ["vector", "hybrid"]:
+                files = await asyncio.to_thread(self.rank_files, strip_instructions(state["user_query"]), vectorstore, index_version)
+            else:
+                files = await self.aget_relevant_files(strip_instructions(state["user_query"]), self._mmr_retriever(vectorstore), self.llm)
+            return self._retrieved_state(state, files, index_version)
 
         except Exception as e:
             print(f"RetrieverAgent failed: {e}")
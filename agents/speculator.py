@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from state import State
+from instrumentation import span, count
+from agents.converter import ConverterAgent
+from agents.executor import ExecutorAgent
+from agents.feedback import FeedbackAgent
+from config import SPECULATIVE_CANDIDATES
+
+
+class SpeculativeAgent:
+    """
+    SpeculativeAgent prepares, executes and evaluates the top-N candidate APIs concurrently
+    instead of one at a time. Responses are evaluated as they arrive: the first one accepted
+    by the FeedbackAgent wins and the other candidates are cancelled (pending ones never start,
+    running ones stop at their next step). If none is accepted, the pipeline goes on
+    sequentially from candidate N.
+    Only GET call plans are sent speculatively: a candidate whose plan writes (POST, PUT...)
+    or is invalid is skipped, and the sequential run restarts from the first skipped one.
+    """
+
+    def __init__(self, converter: ConverterAgent, executor: ExecutorAgent, feedback: FeedbackAgent,
+                 candidates: int = SPECULATIVE_CANDIDATES):
+        self.converter = converter
+        self.executor = executor
+        self.feedback = feedback
+        self.candidates = max(1, candidates)
+
+    def _indexes(self, state: State) -> list:
+        start = state.get("current_index", 0)
+        files = state.get("candidate_files", []) or []
+        return list(range(start, min(start + self.candidates, len(files))))
+
+    @staticmethod
+    def _candidate_state(state: State, idx: int) -> State:
+        return {**state,
+                "current_index": idx,
+                "current_api_path": None,
+                "api_spec_yaml": None,
+                "system_message": None,
+                "last_response": None,
+                "last_status": None,
+                "last_request": None,
+                "fetched_url": False,
+                "accepted": False}
+
+    @staticmethod
+    def _prepared(candidate: State, idx: int) -> bool:
+        # The converter moves to the next index when the file is missing or unreadable
+        return candidate.get("current_index") == idx and bool(candidate.get("system_message"))
+
+    @staticmethod
+    def _speculable(request: dict | None, idx: int, skipped: list, attrs: dict) -> bool:
+        """Only a valid GET plan is safe to send for a candidate that may lose."""
+        if request is not None and request["method"] == "get":
+            return True
+        attrs["outcome"] = "not_get" if request is not None else "plan_rejected"
+        skipped.append(idx)
+        return False
+
+    def _run_candidate(self, state: State, idx: int, cancelled: threading.Event, skipped: list) -> State | None:
+        """prepare -> plan -> request -> feedback for one candidate; the accepted state or None."""
+        with span("speculate", f"candidate {idx}", api_file=state["candidate_files"][idx]) as attrs:
+            candidate = self.converter.run(self._candidate_state(state, idx))
+            if cancelled.is_set() or not self._prepared(candidate, idx):
+                attrs["outcome"] = "cancelled" if cancelled.is_set() else "prepare_failed"
+                return None
+            request = self.executor.plan_call(candidate)
+            if cancelled.is_set():
+                attrs["outcome"] = "cancelled"
+                return None
+            if not self._speculable(request, idx, skipped, attrs):
+                return None
+            candidate = self.executor.send_plan(candidate, request)
+            if cancelled.is_set() or not candidate.get("last_response"):
+                attrs["outcome"] = "cancelled" if cancelled.is_set() else "no_response"
+                return None
+            candidate = self.feedback.run(candidate)
+            attrs["outcome"] = "accepted" if candidate.get("accepted") else "rejected"
+            return candidate if candidate.get("accepted") else None
+
+    async def _arun_candidate(self, state: State, idx: int, skipped: list) -> State | None:
+        with span("speculate", f"candidate {idx}", api_file=state["candidate_files"][idx]) as attrs:
+            candidate = await self.converter.arun(self._candidate_state(state, idx))
+            if not self._prepared(candidate, idx):
+                attrs["outcome"] = "prepare_failed"
+                return None
+            request = await self.executor.aplan_call(candidate)
+            if not self._speculable(request, idx, skipped, attrs):
+                return None
+            candidate = await self.executor.asend_plan(candidate, request)
+            if not candidate.get("last_response"):
+                attrs["outcome"] = "no_response"
+                return None
+            candidate = await self.feedback.arun(candidate)
+            attrs["outcome"] = "accepted" if candidate.get("accepted") else "rejected"
+            return candidate if candidate.get("accepted") else None
+
+    def _result(self, state: State, indexes: list, winner: State | None, skipped: list) -> State:
+        if winner is not None:
+            print(f"Candidate {winner['current_index']} accepted, the other candidates are cancelled")
+            count("speculative_accept")
+            return {**winner, "speculated": True}
+        files = state.get("candidate_files", []) or []
+        if skipped:
+            next_index = min(skipped)
+        else:
+            next_index = indexes[-1] + 1 if indexes else state.get("current_index", 0)
+        print(f"No speculative candidate accepted, continuing sequentially from candidate {next_index}")
+        count("speculative_miss")
+        result = {**self._candidate_state(state, next_index), "speculated": True}
+        if next_index >= len(files):
+            result["error"] = "No candidate API returned an accepted response"
+        return result
+
+    def run(self, state: State) -> State:
+        print("Running SpeculativeAgent...")
+        if self.executor.mode != "plan":
+            # The React agent picks the HTTP method itself: nothing guarantees a read-only call
+            return {**state, "speculated": True}
+        indexes = self._indexes(state)
+        print(f"Trying candidates {indexes} concurrently")
+        cancelled = threading.Event()
+        winner = None
+        skipped = []
+        pool = ThreadPoolExecutor(max_workers=max(1, len(indexes)), thread_name_prefix="speculate")
+        # Each candidate gets its own copy of the context, so its spans land in the query's trace
+        futures = [pool.submit(contextvars.copy_context().run, self._run_candidate, state, idx, cancelled, skipped)
+                   for idx in indexes]
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Speculative candidate failed: {e}")
+                    continue
+                if result is not None:
+                    winner = result
+                    break
+        finally:
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+        return self._result(state, indexes, winner, skipped)
+
+    async def arun(self, state: State) -> State:
+        """Async variant of run: candidates are tasks, and the losers are really cancelled."""
+        print("Running SpeculativeAgent...")
+        if self.executor.mode != "plan":
+            return {**state, "speculated": True}
+        indexes = self._indexes(state)
+        print(f"Trying candidates {indexes} concurrently")
+        skipped = []
+        tasks = [asyncio.create_task(self._arun_candidate(state, idx, skipped)) for idx in indexes]
+        winner = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except Exception as e:
+                    print(f"Speculative candidate failed: {e}")
+                    continue
+                if result is not None:
+                    winner = result
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self._result(state, indexes, winner, skipped)
@@ -0,0 +1,98 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Tuple
+from config import BATCH_WORKERS, MAX_CONCURRENT_LLM_CALLS, TRACE_ENABLED
+from concurrency import set_llm_concurrency
+from instrumentation import get_aggregator
+from pipeline import QUERY_INSTRUCTIONS, get_compiled_graph, invoke_pipeline
+
+
+def iter_queries(input_path: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yield (id, query, error) from a JSONL file. Each line is an object with a
+    "query" (or "user_query") field and an optional "id" (or "request_id").
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield str(line_no), "", f"Invalid JSON: {e}"
+                continue
+            query_id = str(record.get("id", record.get("request_id", line_no)))
+            query = record.get("query") or record.get("user_query") or ""
+            yield query_id, query, None if query else "Missing 'query' field"
+
+
+def summarize_state(final_state: dict) -> dict:
+    """Answer, chosen API file, node timings and error of a final pipeline state."""
+    summary = {"answer": None, "api_file": final_state.get("current_api_path"),
+               "node_timings": final_state.get("node_timings", {}), "trace_id": final_state.get("trace_id"),
+               "cache_hit": final_state.get("cache_hit"), "error": None}
+    if final_state.get("done") and final_state.get("last_response") and not final_state.get("error"):
+        summary["answer"] = final_state["last_response"]
+    else:
+        summary["error"] = final_state.get("error") or "Pipeline did not complete successfully."
+    return summary
+
+
+def run_query(query_id: str, query: str) -> dict:
+    start = time.perf_counter()
+    result = {"id": query_id, "query": query, "answer": None, "api_file": None,
+              "node_timings": {}, "error": None}
+    try:
+        final_state = invoke_pipeline(query + QUERY_INSTRUCTIONS)
+        result.update(summarize_state(final_state))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(input_path: str, output_path: str, workers: int = BATCH_WORKERS,
+              max_llm_calls: int = MAX_CONCURRENT_LLM_CALLS) -> dict:
+    """
+    Run every query of a JSONL file through the pipeline, `workers` queries at a time
+    with at most `max_llm_calls` concurrent LLM calls. The graph is compiled once and
+    each result is appended to `output_path` as a JSON line as soon as it is ready.
+    """
+    set_llm_concurrency(max_llm_calls)
+    get_compiled_graph()
+    write_lock = threading.Lock()
+    summary = {"total": 0, "answered": 0, "failed": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        def write(result: dict):
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                summary["total"] += 1
+                summary["answered" if result["answer"] is not None else "failed"] += 1
+
+        pending = set()
+        for query_id, query, error in iter_queries(input_path):
+            if error:
+                write({"id": query_id, "query": query, "answer": None, "api_file": None,
+                       "node_timings": {}, "error": error, "elapsed": 0.0})
+                continue
+            # Bounded submission: queries are read lazily, not all loaded up front
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(pool.submit(run_query, query_id, query))
+
+        for future in wait(pending).done:
+            write(future.result())
+
+    summary["elapsed"] = round(time.perf_counter() - start, 3)
+    print(f"Batch completed: {summary['answered']}/{summary['total']} answered in {summary['elapsed']}s")
+    if TRACE_ENABLED:
+        print(get_aggregator().report())
+        get_aggregator().save()
+    return summary
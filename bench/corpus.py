@@ -0,0 +1,118 @@
+import os
+import json
+import random
+import shutil
+import yaml
+from typing import Any, Dict, List, Tuple
+
+NOUNS = ["book", "movie", "city", "planet", "recipe", "song", "player", "team", "flight", "hotel",
+         "car", "bike", "course", "student", "invoice", "order", "product", "review", "ticket", "event",
+         "museum", "artist", "painting", "species", "mountain", "river", "station", "train", "vaccine", "drug"]
+ADJECTIVES = ["open", "global", "simple", "public", "free", "fast", "smart", "daily", "local", "national"]
+ATTRIBUTES = ["name", "title", "country", "year", "rating", "price", "category", "status", "author", "color"]
+
+
+def synthetic_spec(i: int, base_url: str, rng: random.Random) -> Tuple[Dict[str, Any], str]:
+    """Small OpenAPI 3 spec (list, get by id, search, create) for one made-up resource; returns (spec, query)."""
+    noun = NOUNS[i % len(NOUNS)]
+    adjective = ADJECTIVES[(i // len(NOUNS)) % len(ADJECTIVES)]
+    attrs = rng.sample(ATTRIBUTES, 3)
+    title = f"{adjective.capitalize()} {noun.capitalize()} API {i}"
+    item = {
+        "type": "object",
+        "properties": {"id": {"type": "integer"}, **{a: {"type": "string"} for a in attrs}},
+    }
+    spec = {
+        "openapi": "3.0.0",
+        "info": {"title": title, "version": "1.0.0",
+                 "description": f"The {title} returns {noun}s with their {', '.join(attrs)}."},
+        "servers": [{"url": f"{base_url}/svc{i}"}],
+        "paths": {
+            f"/{noun}s": {
+                "get": {
+                    "summary": f"List {noun}s",
+                    "description": f"Returns every {noun} of the {title}.",
+                    "responses": {"200": {"description": f"A list of {noun}s",
+                                          "content": {"application/json": {"schema": {"type": "array", "items": item}}}}},
+                },
+                "post": {
+                    "summary": f"Create a {noun}",
+                    "requestBody": {"content": {"application/json": {"schema": item}}},
+                    "responses": {"201": {"description": f"The created {noun}",
+                                          "content": {"application/json": {"schema": item}}}},
+                },
+            },
+            f"/{noun}s/{{id}}": {
+                "get": {
+                    "summary": f"Get a {noun} by id",
+                    "description": f"Returns the {noun} with the given id, including its {attrs[0]}.",
+                    "parameters": [{"name": "id", "in": "path", "required": True, "schema": {"type": "integer"}}],
+                    "responses": {"200": {"description": f"The {noun}",
+                                          "content": {"application/json": {"schema": item}}},
+                                  "404": {"description": "Not found"}},
+                },
+            },
+            f"/{noun}s/search": {
+                "get": {
+                    "summary": f"Search {noun}s by {attrs[1]}",
+                    "parameters": [{"name": attrs[1], "in": "query", "required": True, "schema": {"type": "string"}}],
+                    "responses": {"200": {"description": f"Matching {noun}s",
+                                          "content": {"application/json": {"schema": {"type": "array", "items": item}}}}},
+                },
+            },
+        },
+    }
+    query = f"What is the {attrs[0]} of the {noun} with id {rng.randint(1, 99)} in the {title}?"
+    return spec, query
+
+
+def write_synthetic_corpus(services_dir: str, size: int, base_url: str, seed: int = 0) -> Tuple[Dict[str, dict], List[str]]:
+    """
+    Write `size` synthetic specs (alternating YAML and JSON) to `services_dir`.
+    Returns ({service prefix: spec} for the mock backends, one query per spec).
+    """
+    rng = random.Random(seed)
+    os.makedirs(services_dir, exist_ok=True)
+    specs, queries = {}, []
+    for i in range(size):
+        spec, query = synthetic_spec(i, base_url, rng)
+        name = f"synthetic_{i:05d}"
+        if i % 2:
+            with open(os.path.join(services_dir, name + ".json"), "w", encoding="utf-8") as f:
+                json.dump(spec, f)
+        else:
+            with open(os.path.join(services_dir, name + ".yaml"), "w", encoding="utf-8") as f:
+                yaml.safe_dump(spec, f, sort_keys=False)
+        specs[f"svc{i}"] = spec
+        queries.append(query)
+    return specs, queries
+
+
+def copy_real_specs(source_dir: str, services_dir: str, base_url: str) -> Dict[str, dict]:
+    """
+    Copy the OpenAPI files of `source_dir` (e.g. services_descriptions/) pointing their servers
+    at the mock backends; HTML docs are copied unchanged. Returns {service prefix: spec}.
+    """
+    os.makedirs(services_dir, exist_ok=True)
+    specs = {}
+    for i, name in enumerate(sorted(os.listdir(source_dir))):
+        path = os.path.join(source_dir, name)
+        ext = os.path.splitext(name)[1].lower()
+        if ext == ".html":
+            shutil.copy(path, os.path.join(services_dir, name))
+            continue
+        if ext not in [".yaml", ".yml", ".json"]:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            spec = json.load(f) if ext == ".json" else yaml.safe_load(f)
+        if not isinstance(spec, dict):
+            continue
+        prefix = f"real{i}"
+        spec["servers"] = [{"url": f"{base_url}/{prefix}"}]
+        with open(os.path.join(services_dir, name), "w", encoding="utf-8") as f:
+            if ext == ".json":
+                json.dump(spec, f)
+            else:
+                yaml.safe_dump(spec, f, sort_keys=False, allow_unicode=True)
+        specs[prefix] = spec
+    return specs
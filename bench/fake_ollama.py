@@ -0,0 +1,274 @@
+"""
+Deterministic stand-in for the Ollama HTTP API (/api/chat, /api/generate, /api/embed,
+/api/tags), so the pipeline can run without models. Point the agents at it with
+OLLAMA_HOST=http://127.0.0.1:<port>.
+
+Answers are scripted: user rules ({"match": regex, "response": text}) are tried first,
+then built-in rules that play each agent's role well enough for the pipeline to finish:
+call plans and tool calls built from the spec in the prompt, "accept" feedback verdicts,
+OpenAPI YAML for HTML conversions. Embeddings are hashed bags of words, so similar
+texts get similar vectors.
+
+    python -m bench.fake_ollama --port 11435 --latency 0.2 --token-latency 0.005
+"""
+import re
+import json
+import math
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import yaml
+
+EMBEDDING_DIM = 128
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Hashed bag-of-words vector, L2-normalized."""
+    vector = [0.0] * dim
+    for word in WORD.findall(text.lower()):
+        h = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little")
+        vector[h % dim] += 1.0 if h & 1 << 31 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if not norm:
+        vector[0] = norm = 1.0
+    return [v / norm for v in vector]
+
+
+def spec_after(text: str, marker: str) -> Optional[dict]:
+    if marker not in text:
+        return None
+    spec_text = text.split(marker, 1)[1].split("\nUser query:", 1)[0].strip()
+    try:
+        spec = yaml.safe_load(spec_text)
+    except yaml.YAMLError:
+        return None
+    return spec if isinstance(spec, dict) else None
+
+
+def plan_from_spec(spec: dict, query: str) -> Optional[Dict[str, Any]]:
+    """Pick the GET operation sharing most words with the query and fill its parameters."""
+    query_words = set(WORD.findall(query.lower()))
+    numbers = re.findall(r"\b\d+\b", query)
+    best, best_score = None, -1
+    for path, methods in (spec.get("paths") or {}).items():
+        for method, operation in (methods or {}).items():
+            if method != "get" or not isinstance(operation, dict):
+                continue
+            text = " ".join([path, str(operation.get("summary", "")), str(operation.get("description", ""))])
+            score = len(query_words & set(WORD.findall(text.lower())))
+            if score > best_score:
+                best, best_score = (path, operation), score
+    if best is None:
+        return None
+    path, operation = best
+    path_params = {name: numbers[0] if numbers else "1" for name in re.findall(r"{([^}]+)}", path)}
+    query_params = {
+        p["name"]: "1" for p in operation.get("parameters", [])
+        if isinstance(p, dict) and p.get("in") == "query" and p.get("required")
+    }
+    return {"method": "get", "path": path, "path_params": path_params, "query_params": query_params, "body": None}
+
+
+def plan_url(spec: dict, plan: Dict[str, Any]) -> str:
+    url = plan["path"]
+    for name, value in plan["path_params"].items():
+        url = url.replace("{" + name + "}", str(value))
+    query = "&".join(f"{k}={v}" for k, v in plan["query_params"].items())
+    base = ((spec.get("servers") or [{}])[0].get("url") or "").rstrip("/")
+    return base + url + (f"?{query}" if query else "")
+
+
+class FakeOllama:
+    def __init__(self, latency: float = 0.0, token_latency: float = 0.0, embed_latency: float = 0.0,
+                 rules: Optional[List[Dict[str, str]]] = None, html_server_url: str = "http://127.0.0.1:9/html"):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.embed_latency = embed_latency
+        self.rules = [(re.compile(r["match"], re.S), r["response"]) for r in (rules or [])]
+        self.html_server_url = html_server_url
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def answer(self, text: str, fmt: Any = None, tools: Optional[list] = None,
+               tool_result: Optional[str] = None, system: str = "", user: str = "") -> Dict[str, Any]:
+        """Returns {"content": ..., "tool_calls": [...]} for a prompt."""
+        for pattern, response in self.rules:
+            if pattern.search(text):
+                return {"content": response}
+        if tool_result is not None:
+            return {"content": tool_result}
+
+        query = text.rsplit("User query:", 1)[-1].strip() if "User query:" in text else text
+        if fmt == "json" and "API documentation:" in text:
+            spec = spec_after(text, "API documentation:")
+            plan = plan_from_spec(spec, query) if spec else None
+            return {"content": json.dumps(plan or {})}
+        if tools and "Here is documentation on the API:" in text:
+            spec = spec_after(system or text, "Here is documentation on the API:")
+            plan = plan_from_spec(spec, user or text) if spec else None
+            get_tool = next((t["function"]["name"] for t in tools if "get" in t["function"]["name"]), None)
+            if plan and get_tool:
+                return {"content": "", "tool_calls": [{"function": {"name": get_tool,
+                                                                    "arguments": {"url": plan_url(spec, plan)}}}]}
+        if "Evaluate if the last API response" in text:
+            return {"content": '{"action": "accept"}'}
+        if "OpenAPI 3.0.0 YAML" in text:
+            return {"content": yaml.safe_dump({
+                "openapi": "3.0.0",
+                "info": {"title": "Converted API", "version": "1.0.0"},
+                "servers": [{"url": self.html_server_url}],
+                "paths": {"/entries/{word}": {"get": {
+                    "summary": "Get the entries of a word",
+                    "parameters": [{"name": "word", "in": "path", "required": True, "schema": {"type": "string"}}],
+                    "responses": {"200": {"description": "Entries"}}}}},
+            }, sort_keys=False)}
+        if "selects the most relevant documents" in text:
+            return {"content": "The most relevant documents are listed in the context."}
+        return {"content": "OK"}
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status: int, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, chunks: List[dict]):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    if chunk.pop("_delay", 0):
+                        time.sleep(fake.token_latency * chunk.get("eval_count", 1))
+                    data = (json.dumps(chunk) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    return self._json(200, {"models": [{"name": "fake:latest", "model": "fake:latest"}]})
+                if self.path == "/api/version":
+                    return self._json(200, {"version": "0.0.0-fake"})
+                self._json(404, {"error": "not found"})
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                endpoint = self.path.split("?")[0]
+                fake.count(endpoint)
+                if endpoint in ["/api/embed", "/api/embeddings"]:
+                    inputs = body.get("input", body.get("prompt", ""))
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    time.sleep(fake.embed_latency * len(inputs))
+                    vectors = [embed_text(t) for t in inputs]
+                    if endpoint == "/api/embeddings":
+                        return self._json(200, {"embedding": vectors[0]})
+                    return self._json(200, {"model": body.get("model"), "embeddings": vectors})
+                if endpoint == "/api/chat":
+                    messages = body.get("messages") or []
+                    text = "\n".join(str(m.get("content", "")) for m in messages)
+                    system = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+                    tool_result = messages[-1].get("content") if messages and messages[-1].get("role") == "tool" else None
+                    user = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+                    answer = fake.answer(text, body.get("format"), body.get("tools"), tool_result, system, user)
+                    return self._reply(body, text, answer, chat=True)
+                if endpoint == "/api/generate":
+                    text = str(body.get("prompt", ""))
+                    return self._reply(body, text, fake.answer(text, body.get("format")), chat=False)
+                if endpoint == "/api/show":
+                    return self._json(200, {"modelfile": "", "parameters": "", "template": "", "details": {}})
+                self._json(404, {"error": "not found"})
+
+            def _reply(self, body: dict, prompt: str, answer: dict, chat: bool):
+                time.sleep(fake.latency)
+                content = answer["content"]
+                words = re.findall(r"\S+\s*", content) or [""]
+                created_at = datetime.now(timezone.utc).isoformat()
+                final = {"model": body.get("model"), "created_at": created_at, "done": True, "done_reason": "stop",
+                         "prompt_eval_count": len(prompt) // 4 + 1, "eval_count": len(words),
+                         "total_duration": 0, "load_duration": 0, "prompt_eval_duration": 0, "eval_duration": 0}
+
+                def piece(text: str, tool_calls=None) -> dict:
+                    if chat:
+                        message = {"role": "assistant", "content": text}
+                        if tool_calls:
+                            message["tool_calls"] = tool_calls
+                        return {"model": body.get("model"), "created_at": created_at, "message": message, "done": False}
+                    return {"model": body.get("model"), "created_at": created_at, "response": text, "done": False}
+
+                if not body.get("stream", True):
+                    done = {**piece(content, answer.get("tool_calls")), **final}
+                    time.sleep(fake.token_latency * len(words))
+                    return self._json(200, done)
+
+                # About four words per streamed chunk; the last chunk carries the token counts
+                chunks = [{**piece("".join(words[i:i + 4])), "_delay": 1, "eval_count": len(words[i:i + 4])}
+                          for i in range(0, len(words), 4)]
+                if answer.get("tool_calls"):
+                    chunks.append(piece("", answer["tool_calls"]))
+                last = piece("")
+                last.update(final)
+                chunks.append(last)
+                self._stream(chunks)
+
+        return Handler
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        """Serve in a daemon thread; port 0 picks a free port (see server.server_address)."""
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+        return server
+
+
+def load_rules(path: Optional[str]) -> List[Dict[str, str]]:
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deterministic fake Ollama server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every chat/generate call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated word")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedded text")
+    parser.add_argument("--rules", help='JSON file with [{"match": regex, "response": text}, ...]')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = FakeOllama(args.latency, args.token_latency, args.embed_latency, load_rules(args.rules)).start(args.host, args.port)
+    print(f"Fake Ollama listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
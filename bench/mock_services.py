@@ -0,0 +1,125 @@
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+
+def example_from_schema(schema: Any, spec: dict, seed: int = 1, depth: int = 0) -> Any:
+    """Deterministic sample value for an OpenAPI schema ($ref, example, object, array, scalars)."""
+    if not isinstance(schema, dict) or depth > 6:
+        return None
+    if "$ref" in schema:
+        target = spec
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            target = target.get(part, {}) if isinstance(target, dict) else {}
+        return example_from_schema(target, spec, seed, depth + 1)
+    if "example" in schema:
+        return schema["example"]
+    for combined in ["allOf", "oneOf", "anyOf"]:
+        if schema.get(combined):
+            return example_from_schema(schema[combined][0], spec, seed, depth + 1)
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if kind == "object":
+        return {name: example_from_schema(prop, spec, seed, depth + 1)
+                for name, prop in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return [example_from_schema(schema.get("items", {}), spec, seed + n, depth + 1) for n in range(3)]
+    if kind == "integer":
+        return seed
+    if kind == "number":
+        return seed + 0.5
+    if kind == "boolean":
+        return True
+    if schema.get("enum"):
+        return schema["enum"][0]
+    return f"sample-{seed}"
+
+
+def path_pattern(template: str) -> re.Pattern:
+    return re.compile("^" + re.sub(r"\\{[^}]+\\}", r"[^/]+", re.escape(template)) + "/?$")
+
+
+class MockServices:
+    """
+    Local stand-in for the services: requests to /<prefix>/<path> are matched against
+    the paths of the spec registered under <prefix> and answered with a sample built
+    from the documented response schema. Unknown prefixes get a generic JSON object.
+    """
+
+    def __init__(self, specs: Optional[Dict[str, dict]] = None, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._routes: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        for prefix, spec in (specs or {}).items():
+            self.register(prefix, spec)
+
+    def register(self, prefix: str, spec: dict):
+        routes = []
+        for template, methods in (spec.get("paths") or {}).items():
+            # Literal paths first, so /items/search wins over /items/{id}
+            routes.append((template.count("{"), path_pattern(template), methods, spec))
+        with self._lock:
+            self._routes[prefix] = sorted(routes, key=lambda r: r[0])
+
+    def respond(self, method: str, path: str) -> tuple:
+        """Returns (status, body) for a request."""
+        with self._lock:
+            self.requests += 1
+        prefix, _, rest = path.lstrip("/").partition("/")
+        routes = self._routes.get(prefix)
+        if routes is None:
+            return 200, {"service": prefix, "path": "/" + rest, "result": "ok"}
+        for _, pattern, methods, spec in routes:
+            if not pattern.match("/" + rest):
+                continue
+            operation = methods.get(method.lower())
+            if operation is None:
+                return 405, {"error": "Method not allowed"}
+            responses = operation.get("responses") or {}
+            # YAML keys may be ints (200) or strings ("200")
+            ok = sorted((key for key in responses if str(key).startswith("2")), key=str)
+            code = int(str(ok[0])) if ok else 200
+            content = ((responses.get(ok[0]) if ok else None) or {}).get("content") or {}
+            schema = (content.get("application/json") or next(iter(content.values()), {})).get("schema")
+            digits = re.findall(r"\d+", rest)
+            body = example_from_schema(schema, spec, int(digits[-1]) if digits else 1)
+            return code, body if body is not None else {"result": "ok"}
+        return 404, {"error": "Not found", "path": "/" + rest}
+
+    def handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                if services.latency:
+                    time.sleep(services.latency)
+                status, body = services.respond(self.command, urlsplit(self.path).path)
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+        return Handler
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        """Serve in a daemon thread; port 0 picks a free port (see server.server_address)."""
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="mock-services", daemon=True).start()
+        return server
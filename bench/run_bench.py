@@ -0,0 +1,233 @@
+"""
+Offline end-to-end benchmark: the pipeline runs against the fake Ollama server and the
+mock service backends on synthetic corpora of growing size. Each size runs in its own
+process (config is read at import time, and memory is measured per process).
+
+    python -m bench.run_bench --sizes 10,100,1000 --queries 20 --latency 0.05
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from bench.corpus import write_synthetic_corpus, copy_real_specs
+from bench.fake_ollama import FakeOllama, load_rules
+from bench.mock_services import MockServices
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NODES = ["index", "retrieve", "speculate", "prepare", "request", "feedback", "extract"]
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def max_rss_mb() -> float:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_worker(run_dir: str, workers: int) -> dict:
+    """Index the corpus, then answer the queries sequentially and concurrently. Runs in the child process."""
+    with open(os.path.join(run_dir, "queries.json"), "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    result = {}
+
+    start = time.perf_counter()
+    from agents.indexer import Indexer
+    from pipeline import QUERY_INSTRUCTIONS, get_compiled_graph, run_with_multiagent
+    from batch import run_query
+    from instrumentation import get_aggregator
+    result["import_s"] = round(time.perf_counter() - start, 3)
+
+    indexer = Indexer()
+    start = time.perf_counter()
+    indexer._create_index(html_conversion="sync")
+    result["index_s"] = round(time.perf_counter() - start, 3)
+    result["rss_after_index_mb"] = max_rss_mb()
+
+    start = time.perf_counter()
+    indexer._create_index(html_conversion="sync")
+    result["noop_reindex_s"] = round(time.perf_counter() - start, 3)
+
+    from vector_store import load_store
+    start = time.perf_counter()
+    load_store(indexer.index_path, indexer.embedding)
+    result["load_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    get_compiled_graph()
+    result["compile_s"] = round(time.perf_counter() - start, 3)
+
+    latencies, answered = [], 0
+    for q in queries:
+        start = time.perf_counter()
+        try:
+            run_with_multiagent(q["query"] + QUERY_INSTRUCTIONS)
+            answered += 1
+        except Exception as e:
+            print(f"Query failed: {e}")
+        latencies.append(time.perf_counter() - start)
+    result["sequential"] = {
+        "queries": len(queries),
+        "answered": answered,
+        "p50_s": round(percentile(latencies, 0.5), 3),
+        "p95_s": round(percentile(latencies, 0.95), 3),
+        "mean_s": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+    }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda q: run_query(q["id"], q["query"]), queries))
+    elapsed = time.perf_counter() - start
+    hits = sum(1 for r, q in zip(results, queries)
+               if r["api_file"] and os.path.splitext(os.path.basename(r["api_file"]))[0] == q["expected"])
+    result["concurrent"] = {
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(queries) / elapsed, 3) if elapsed else 0.0,
+        "answered": sum(1 for r in results if r["answer"] is not None),
+        "expected_api_hit_rate": round(hits / len(queries), 3) if queries else 0.0,
+    }
+
+    histograms = get_aggregator().to_dict()["histograms"]
+    result["nodes"] = {n: histograms[f"node:{n}"] for n in NODES if f"node:{n}" in histograms}
+    result["spans"] = {k: {"count": h["count"], "mean": h["mean"], "p95": h["p95"]}
+                       for k, h in histograms.items() if not k.startswith("node:")}
+    result["max_rss_mb"] = max_rss_mb()
+    return result
+
+
+def run_size(size: int, args, fake_url: str, mock: MockServices, mock_url: str) -> dict:
+    run_dir = tempfile.mkdtemp(prefix=f"bench_{size}_")
+    services_dir = os.path.join(run_dir, "services")
+    start = time.perf_counter()
+    specs, queries = write_synthetic_corpus(services_dir, size, mock_url, seed=args.seed)
+    if args.include_real:
+        specs.update(copy_real_specs(os.path.join(REPO_ROOT, "services_descriptions"), services_dir, mock_url))
+    for prefix, spec in specs.items():
+        mock.register(prefix, spec)
+    corpus_s = round(time.perf_counter() - start, 3)
+
+    rng = random.Random(args.seed)
+    picked = rng.sample(range(size), min(args.queries, size))
+    with open(os.path.join(run_dir, "queries.json"), "w", encoding="utf-8") as f:
+        json.dump([{"id": str(i), "query": queries[i], "expected": f"synthetic_{i:05d}"}
+                   for i in picked], f)
+
+    env = {
+        **os.environ,
+        "OLLAMA_HOST": fake_url,
+        "NO_PROXY": "127.0.0.1,localhost",
+        "SERVICE_FOLDER": services_dir,
+        "INDEX_PATH": os.path.join(run_dir, "faiss_index"),
+        "CACHE_DIR": os.path.join(run_dir, "cache"),
+        "OPENAPI_OUTPUT_DIR": os.path.join(run_dir, "generated_openapi"),
+        "TRACE_DIR": os.path.join(run_dir, "traces"),
+        "EXECUTOR_MODE": args.executor_mode,
+        "RETRIEVER_MODE": args.retriever_mode,
+        "INDEX_FORMAT": args.index_format,
+        "INDEX_QUANTIZATION": args.quantization,
+        "INDEX_LAYOUT": args.index_layout,
+        "RETRIEVER_RERANK": args.rerank,
+        "SPECULATIVE_CANDIDATES": str(args.speculative),
+        # Off by default: the throughput phase replays the queries of the sequential phase
+        "SEMANTIC_CACHE_ENABLED": "true" if args.semantic_cache else "false",
+    }
+    log_path = os.path.join(run_dir, "pipeline.log")
+    print(f"[size {size}] corpus written to {run_dir} in {corpus_s}s, running pipeline (log: {log_path})")
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run([sys.executable, "-m", "bench.run_bench", "--worker", run_dir, "--workers", str(args.workers)],
+                              cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout)
+    result_path = os.path.join(run_dir, "result.json")
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        return {"size": size, "error": f"worker exited with code {proc.returncode}, see {log_path}"}
+    with open(result_path, "r", encoding="utf-8") as f:
+        return {"size": size, "corpus_s": corpus_s, "run_dir": run_dir, **json.load(f)}
+
+
+def format_report(results: list) -> str:
+    header = (f"{'size':>6}{'index s':>9}{'noop s':>8}{'load s':>8}{'p50 s':>8}{'p95 s':>8}{'qps':>8}{'answered':>10}"
+              f"{'api hit':>9}{'rss MB':>8}  " + "".join(f"{n:>10}" for n in NODES[1:]))
+    lines = ["Per-node columns: mean seconds per node execution", header]
+    for r in results:
+        if "error" in r:
+            lines.append(f"{r['size']:>6}  {r['error']}")
+            continue
+        seq, conc = r["sequential"], r["concurrent"]
+        nodes = "".join(f"{r['nodes'].get(n, {}).get('mean', 0.0):>10.3f}" for n in NODES[1:])
+        lines.append(f"{r['size']:>6}{r['index_s']:>9.2f}{r['noop_reindex_s']:>8.2f}{r['load_s']:>8.3f}{seq['p50_s']:>8.2f}{seq['p95_s']:>8.2f}"
+                     f"{conc['throughput_qps']:>8.2f}{seq['answered']:>5}/{seq['queries']:<4}"
+                     f"{conc['expected_api_hit_rate']:>9.2f}{r['max_rss_mb']:>8.0f}  {nodes}")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the multi-agent pipeline.")
+    parser.add_argument("--sizes", default="10,100,1000", help="comma separated corpus sizes (spec files)")
+    parser.add_argument("--queries", type=int, default=10, help="queries per corpus size")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent queries in the throughput phase")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake LLM latency per call (seconds)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake LLM latency per generated word")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="fake embedding latency per text")
+    parser.add_argument("--service-latency", type=float, default=0.0, help="mock API latency per request")
+    parser.add_argument("--rules", help="JSON file with scripted LLM answers for the fake Ollama")
+    parser.add_argument("--executor-mode", default="plan", choices=["plan", "react"])
+    parser.add_argument("--retriever-mode", default="llm", choices=["llm", "vector", "hybrid"])
+    parser.add_argument("--index-format", default="faiss", choices=["faiss", "compact"])
+    parser.add_argument("--index-layout", default="single", choices=["single", "sharded"])
+    parser.add_argument("--quantization", default="fp16", choices=["none", "fp16", "ivfpq"])
+    parser.add_argument("--rerank", default="none", choices=["none", "lexical"])
+    parser.add_argument("--speculative", type=int, default=0,
+                        help="candidate APIs tried concurrently per query (SPECULATIVE_CANDIDATES)")
+    parser.add_argument("--include-real", action="store_true",
+                        help="also index the specs of services_descriptions/, served by the mock backends")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="keep the semantic answer cache on (repeated queries are then served from it)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds allowed per corpus size")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--worker", metavar="RUN_DIR", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        result = run_worker(args.worker, args.workers)
+        with open(os.path.join(args.worker, "result.json"), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        return
+
+    mock = MockServices(latency=args.service_latency)
+    mock_server = mock.start()
+    mock_url = f"http://127.0.0.1:{mock_server.server_address[1]}"
+    fake = FakeOllama(args.latency, args.token_latency, args.embed_latency, load_rules(args.rules),
+                      html_server_url=f"{mock_url}/html")
+    fake_server = fake.start()
+    fake_url = f"http://127.0.0.1:{fake_server.server_address[1]}"
+    print(f"Fake Ollama on {fake_url}, mock services on {mock_url}")
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        results.append(run_size(size, args, fake_url, mock, mock_url))
+        print(format_report(results[-1:]).splitlines()[-1])
+
+    report = {"args": {k: v for k, v in vars(args).items() if k != "worker"}, "fake_ollama_calls": fake.calls,
+              "mock_service_requests": mock.requests, "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print()
+    print(format_report(results))
+    print(f"\nFull results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import os
+import json
+import math
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import INDEX_PATH
+from ranking import TERM, STOPWORDS
+
+BM25_NAME = "bm25.json"
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TERM.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process inverted index (Okapi BM25) over the same chunks as the FAISS index, with the
+    same ids, so exact tokens (endpoint names, API titles) weigh in the ranking.
+    Per-chunk term counts are persisted as bm25.json next to the FAISS index; the postings
+    are rebuilt in memory on load. Chunks are added and removed incrementally by the Indexer.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Tuple[str, Dict[str, int]]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _index(self, doc_id: str, source: str, tf: Dict[str, int]):
+        self.docs[doc_id] = (source, tf)
+        length = sum(tf.values())
+        self.doc_len[doc_id] = length
+        self.total_len += length
+        for term, n in tf.items():
+            self.postings.setdefault(term, {})[doc_id] = n
+
+    def add(self, doc_id: str, text: str, source: str):
+        if doc_id in self.docs:
+            self.remove([doc_id])
+        self._index(doc_id, source, dict(Counter(tokenize(text))))
+
+    def add_documents(self, docs: Iterable, ids: Iterable[str]):
+        for doc, doc_id in zip(docs, ids):
+            self.add(doc_id, doc.page_content, str(doc.metadata.get("source", "")))
+
+    def remove(self, ids: Iterable[str]):
+        for doc_id in ids:
+            entry = self.docs.pop(doc_id, None)
+            if entry is None:
+                continue
+            self.total_len -= self.doc_len.pop(doc_id)
+            for term in entry[1]:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, str, float]]:
+        """Top `k` chunks as (id, source, score), best first."""
+        if not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_len = self.total_len / n_docs or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        best = sorted(scores.items(), key=lambda x: -x[1])[:k]
+        return [(doc_id, self.docs[doc_id][0], score) for doc_id, score in best]
+
+    def save(self, index_path=INDEX_PATH):
+        """Write bm25.json atomically next to the FAISS index."""
+        index_path = Path(index_path)
+        index_path.mkdir(parents=True, exist_ok=True)
+        path = index_path / BM25_NAME
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b,
+                       "docs": {i: {"source": s, "tf": tf} for i, (s, tf) in self.docs.items()}}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, index_path=INDEX_PATH) -> Optional["BM25Index"]:
+        """The persisted index, or None if missing or unreadable (the Indexer then rebuilds it)."""
+        path = Path(index_path) / BM25_NAME
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable BM25 index {path}: {e}")
+            return None
+        index = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        for doc_id, entry in data.get("docs", {}).items():
+            index._index(doc_id, entry["source"], entry["tf"])
+        return index
+
+
+class BM25Handle:
+    """Process-wide BM25 index of an index path, reloaded when the index version changes."""
+
+    def __init__(self, index_path=INDEX_PATH):
+        self.index_path = Path(index_path)
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._index: Optional[BM25Index] = None
+
+    def get(self, version: Optional[int] = None) -> Optional[BM25Index]:
+        # Queries pinned to an older version just get the current one: lexical scores don't need to match exactly
+        with self._lock:
+            if self._version is None or (version is not None and version > self._version):
+                self._index = BM25Index.load(self.index_path)
+                self._version = version if version is not None else -1
+            return self._index
+
+    def publish(self, version: int, index: BM25Index):
+        with self._lock:
+            self._version = version
+            self._index = index
+
+
+_handles: Dict[str, BM25Handle] = {}
+_handles_lock = threading.Lock()
+
+
+def get_bm25_handle(index_path=INDEX_PATH) -> BM25Handle:
+    key = str(Path(index_path).resolve())
+    with _handles_lock:
+        if key not in _handles:
+            _handles[key] = BM25Handle(index_path)
+        return _handles[key]
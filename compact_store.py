@@ -0,0 +1,295 @@
+import os
+import json
+import math
+import uuid
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from config import INDEX_QUANTIZATION, INDEX_NPROBE
+
+VECTORS_NAME = "vectors.faiss"
+CHUNKS_NAME = "chunks.sqlite"
+# IVF-PQ needs this many training vectors per inverted list; smaller corpora fall back to fp16
+IVF_TRAINING_PER_LIST = 39
+# IO_FLAG_MMAP maps only IVF inverted lists: flat and fp16 codes would still be copied in memory.
+# IO_FLAG_MMAP_IFC (faiss >= 1.8) reads every code array zero-copy from the mapped file.
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def normalized(vectors) -> np.ndarray:
+    array = np.asarray(vectors, dtype=np.float32)
+    array = array.reshape(1, -1) if array.ndim == 1 else array
+    faiss.normalize_L2(array)
+    return array
+
+
+class CompactVectorStore(VectorStore):
+    """
+    Vector store whose load time and memory don't grow with the corpus:
+    - vectors live in vectors.faiss, memory-mapped by readers, either exact (float32),
+      float16 or IVF-PQ compressed (INDEX_QUANTIZATION); ids are SQLite rowids
+    - chunk text and metadata live in chunks.sqlite and are read by id only for the hits
+    Nothing is unpickled. The Indexer opens it writable (vectors in memory): deletions of
+    chunk rows are deferred to save_local, so readers of the previous version keep working
+    until the new index file replaces the old one.
+    """
+
+    def __init__(self, index_path, embedding: Embeddings, index=None, writable: bool = False,
+                 quantization: str = INDEX_QUANTIZATION):
+        self.index_path = Path(index_path)
+        self.embedding = embedding
+        self.index = index
+        self.writable = writable
+        self.quantization = quantization
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._deleted: Set[int] = set()
+        db_path = self.index_path / CHUNKS_NAME
+        if writable:
+            self.index_path.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # AUTOINCREMENT: rowids of deleted chunks are never reused, old index files stay consistent
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (rowid INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "id TEXT NOT NULL, source TEXT, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            # Not unique: a rebuild re-inserts the ids of the rows it drops on save_local
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+            self._conn.commit()
+        else:
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    @classmethod
+    def exists(cls, index_path) -> bool:
+        return (Path(index_path) / VECTORS_NAME).exists() and (Path(index_path) / CHUNKS_NAME).exists()
+
+    @classmethod
+    def load(cls, index_path, embedding: Embeddings, writable: bool = False) -> "CompactVectorStore":
+        """Readers memory-map the vectors; the writable copy is read in memory to be updated."""
+        path = str(Path(index_path) / VECTORS_NAME)
+        index = faiss.read_index(path) if writable else faiss.read_index(path, MMAP_FLAG)
+        if isinstance(index, faiss.IndexIVF):
+            index.nprobe = INDEX_NPROBE
+        return cls(index_path, embedding, index=index, writable=writable)
+
+    @classmethod
+    def create(cls, index_path, embedding: Embeddings, quantization: str = INDEX_QUANTIZATION) -> "CompactVectorStore":
+        """Empty writable store; rows of a previous index at the same path are dropped on save_local."""
+        store = cls(index_path, embedding, writable=True, quantization=quantization)
+        store._deleted = {row for (row,) in store._conn.execute("SELECT rowid FROM chunks")}
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, index_path=None, **kwargs: Any) -> "CompactVectorStore":
+        store = cls.create(index_path, embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def _build_index(self, vectors: np.ndarray) -> faiss.Index:
+        dim = vectors.shape[1]
+        if self.quantization == "ivfpq":
+            nlist = max(1, int(4 * math.sqrt(len(vectors))))
+            m = next((m for m in [dim // 8, dim // 4, dim // 2, dim] if m and dim % m == 0), 1)
+            if len(vectors) >= max(nlist, 256) * IVF_TRAINING_PER_LIST:
+                print(f"Training IVF-PQ index ({nlist} lists, {m} sub-quantizers) on {len(vectors)} vectors")
+                index = faiss.IndexIVFPQ(faiss.IndexFlatIP(dim), dim, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+                index.train(vectors)
+                index.set_direct_map_type(faiss.DirectMap.Hashtable)
+                index.nprobe = INDEX_NPROBE
+                return index
+            print(f"Too few vectors ({len(vectors)}) to train IVF-PQ, using float16 vectors")
+        if self.quantization in ["fp16", "ivfpq"]:
+            base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        else:
+            base = faiss.IndexFlatIP(dim)
+        return faiss.IndexIDMap2(base)
+
+    def _flush_pending(self):
+        """Vectors are buffered until the index exists, so IVF-PQ is trained on the whole first build."""
+        if not self._pending:
+            return
+        rowids = np.concatenate([r for r, _ in self._pending])
+        vectors = np.vstack([v for _, v in self._pending])
+        self._pending = []
+        if self._deleted:
+            # Deleted before the index existed
+            keep = np.array([r not in self._deleted for r in rowids], dtype=bool)
+            rowids, vectors = rowids[keep], vectors[keep]
+        if not len(rowids):
+            return
+        if self.index is None:
+            self.index = self._build_index(vectors)
+        self.index.add_with_ids(vectors, rowids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        if not self.writable:
+            raise PermissionError("CompactVectorStore opened read-only")
+        texts = list(texts)
+        return self.add_embeddings(list(zip(texts, self.embedding.embed_documents(texts))), metadatas, ids)
+
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]], metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """add_texts with vectors computed by the caller."""
+        if not self.writable:
+            raise PermissionError("CompactVectorStore opened read-only")
+        text_embeddings = list(text_embeddings)
+        texts = [t for t, _ in text_embeddings]
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        vectors = normalized([v for _, v in text_embeddings])
+        with self._lock:
+            rowids = []
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                cur = self._conn.execute(
+                    "INSERT INTO chunks (id, source, content, metadata) VALUES (?, ?, ?, ?)",
+                    (doc_id, str(metadata.get("source", "")), text, json.dumps(metadata, default=str)),
+                )
+                rowids.append(cur.lastrowid)
+            self._pending.append((np.asarray(rowids, dtype=np.int64), vectors))
+            if self.index is not None:
+                self._flush_pending()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        with self._lock:
+            rowids = [row for chunk in [ids[i:i + 500] for i in range(0, len(ids), 500)]
+                      for (row,) in self._conn.execute(
+                          f"SELECT rowid FROM chunks WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                      if row not in self._deleted]
+            if rowids and self.index is not None:
+                self.index.remove_ids(np.asarray(rowids, dtype=np.int64))
+            self._deleted.update(rowids)
+        return True
+
+    def save_local(self, folder_path=None):
+        """Write the vectors atomically, then drop the chunk rows deleted since the last save."""
+        folder = Path(folder_path or self.index_path)
+        with self._lock:
+            self._flush_pending()
+            self._conn.commit()
+            if self.index is not None:
+                tmp_path = folder / (VECTORS_NAME + ".tmp")
+                faiss.write_index(self.index, str(tmp_path))
+                os.replace(tmp_path, folder / VECTORS_NAME)
+            deleted = sorted(self._deleted)
+            for i in range(0, len(deleted), 500):
+                chunk = deleted[i:i + 500]
+                self._conn.execute(f"DELETE FROM chunks WHERE rowid IN ({','.join('?' * len(chunk))})", chunk)
+            self._deleted = set()
+            self._conn.commit()
+
+    def _documents(self, rowids: List[int]) -> Dict[int, Document]:
+        if not rowids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT rowid, id, content, metadata FROM chunks WHERE rowid IN ({','.join('?' * len(rowids))})",
+                [int(r) for r in rowids],
+            ).fetchall()
+        return {row: Document(page_content=content, metadata=json.loads(metadata), id=doc_id)
+                for row, doc_id, content, metadata in rows}
+
+    def _vectors(self, rowids: List[int]) -> np.ndarray:
+        return np.vstack([self.index.reconstruct(int(r)) for r in rowids])
+
+    def _search(self, vector: np.ndarray, k: int, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """(rowid, cosine similarity) of the top k vectors, optionally restricted by metadata equality."""
+        with self._lock:
+            self._flush_pending()
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        if filter and set(filter) == {"source"}:
+            # Only the chunks of one file: score them exactly instead of searching the whole index
+            with self._lock:
+                rowids = [row for (row,) in self._conn.execute("SELECT rowid FROM chunks WHERE source = ?",
+                                                               (str(filter["source"]),))]
+            rowids = [r for r in rowids if r not in self._deleted]
+            if not rowids:
+                return []
+            scores = self._vectors(rowids) @ vector[0]
+            best = np.argsort(-scores)[:k]
+            return [(rowids[i], float(scores[i])) for i in best]
+        scores, labels = self.index.search(vector, k if not filter else max(k * 4, 20))
+        return [(int(r), float(s)) for r, s in zip(labels[0], scores[0]) if r != -1]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        hits = self._search(normalized(embedding), k, filter)
+        docs = self._documents([r for r, _ in hits])
+        results = []
+        for rowid, score in hits:
+            doc = docs.get(rowid)
+            if doc is None:
+                continue
+            if filter and any(doc.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            results.append((doc, score))
+        return results[:k]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Vectors are normalized, inner product is cosine similarity
+        return lambda score: max(0.0, min(1.0, score))
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(self.embedding.embed_query(query), k, fetch_k,
+                                                            lambda_mult, **kwargs)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        vector = normalized(embedding)
+        hits = self._search(vector, fetch_k, kwargs.get("filter"))
+        if not hits:
+            return []
+        rowids = [r for r, _ in hits]
+        picked = maximal_marginal_relevance(vector[0], list(self._vectors(rowids)), lambda_mult=lambda_mult, k=k)
+        docs = self._documents([rowids[i] for i in picked])
+        return [docs[rowids[i]] for i in picked if rowids[i] in docs]
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[str, Document]]:
+        """(id, document) of every chunk, read in batches."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, id, content, metadata FROM chunks WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row, doc_id, content, metadata in rows:
+                if row not in self._deleted:
+                    yield doc_id, Document(page_content=content, metadata=json.loads(metadata), id=doc_id)
+            last = rows[-1][0]
+
+    def documents_for_source(self, file_path: str) -> List[Document]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, content, metadata FROM chunks WHERE source = ?", (file_path,)).fetchall()
+            if not rows:
+                rows = self._conn.execute("SELECT id, content, metadata FROM chunks WHERE instr(source, ?) > 0",
+                                          (file_path,)).fetchall()
+        return [Document(page_content=content, metadata=json.loads(metadata), id=doc_id) for doc_id, content, metadata in rows]
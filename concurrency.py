@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+_llm_limit: Optional[int] = None
+_llm_semaphore: Optional[threading.BoundedSemaphore] = None
+_async_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def set_llm_concurrency(limit: Optional[int]):
+    """Cap the number of LLM calls running at once in this process (None or 0: no cap)."""
+    global _llm_limit, _llm_semaphore
+    _llm_limit = limit or None
+    _llm_semaphore = threading.BoundedSemaphore(limit) if limit else None
+    _async_llm_semaphores.clear()
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the LLM call slots for the duration of the block."""
+    semaphore = _llm_semaphore
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def allm_slot():
+    """Async counterpart of llm_slot: the cap applies to the coroutines of the running event loop."""
+    if _llm_limit is None:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    if loop not in _async_llm_semaphores:
+        _async_llm_semaphores[loop] = asyncio.Semaphore(_llm_limit)
+    async with _async_llm_semaphores[loop]:
+        yield
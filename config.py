@@ -10,8 +10,80 @@ def get_env(key: str, default: str):
 EMBEDDING_MODEL = get_env("EMBEDDING_MODEL", "nomic-embed-text")
 SERVICE_FOLDER = get_env("SERVICE_FOLDER", "services_descriptions")
 INDEX_PATH = get_env("INDEX_PATH", "faiss_index")
+# "faiss" (LangChain FAISS, pickled docstore) or "compact" (memory-mapped vectors + SQLite chunks)
+INDEX_FORMAT = get_env("INDEX_FORMAT", "faiss")
+# Vectors of the compact format: "none" (float32), "fp16" or "ivfpq" (large corpora)
+INDEX_QUANTIZATION = get_env("INDEX_QUANTIZATION", "fp16")
+INDEX_NPROBE = int(get_env("INDEX_NPROBE", "16"))
+# "single" (one index) or "sharded" (service files hashed into INDEX_SHARDS shards behind a router)
+INDEX_LAYOUT = get_env("INDEX_LAYOUT", "single")
+INDEX_SHARDS = int(get_env("INDEX_SHARDS", "32"))
+# Queries search only the shards holding the files closest to them in the router
+ROUTER_TOP_FILES = int(get_env("ROUTER_TOP_FILES", "16"))
+INDEX_SEARCH_WORKERS = int(get_env("INDEX_SEARCH_WORKERS", "4"))
 RETRIEVER_MODEL = get_env("RETRIEVER_MODEL", "llama3")
+# "llm" (RetrievalQA chain), "vector" (files ranked from chunk scores, no LLM call)
+# or "hybrid" (vector and BM25 rankings fused with reciprocal rank fusion, no LLM call)
+RETRIEVER_MODE = get_env("RETRIEVER_MODE", "llm")
+RETRIEVER_K = int(get_env("RETRIEVER_K", "5"))
+RETRIEVER_FETCH_K = int(get_env("RETRIEVER_FETCH_K", "20"))
+# Score multiplier of OpenAPI files (.json, .yaml, .yml) over HTML pages
+OPENAPI_WEIGHT = float(get_env("OPENAPI_WEIGHT", "1.2"))
+# "none" or "lexical" (query term overlap blended with the vector score)
+RETRIEVER_RERANK = get_env("RETRIEVER_RERANK", "none")
+RETRIEVER_RERANK_WEIGHT = float(get_env("RETRIEVER_RERANK_WEIGHT", "0.3"))
+RRF_K = int(get_env("RRF_K", "60"))
 CONVERTER_MODEL = get_env("CONVERTER_MODEL", "mistral")
 EXECUTOR_MODEL = get_env("EXECUTOR_MODEL", "mistral")
 FEEDBACK_MODEL = get_env("FEEDBACK_MODEL", "llama3")
-EXTRACTOR_MODEL = get_env("EXTRACTOR_MODEL", "llama3")
\ No newline at end of file
+EXTRACTOR_MODEL = get_env("EXTRACTOR_MODEL", "llama3")
+
+CACHE_DIR = get_env("CACHE_DIR", ".cache")
+EMBED_BATCH_SIZE = int(get_env("EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(get_env("EMBED_WORKERS", "4"))
+EMBEDDING_CACHE_PATH = get_env("EMBEDDING_CACHE_PATH", os.path.join(CACHE_DIR, "embeddings.sqlite"))
+INGEST_WORKERS = int(get_env("INGEST_WORKERS", str(os.cpu_count() or 1)))
+HTML_PARSER = get_env("HTML_PARSER", "auto")
+SPEC_CACHE_DIR = get_env("SPEC_CACHE_DIR", os.path.join(CACHE_DIR, "specs"))
+SPEC_CACHE_SIZE = int(get_env("SPEC_CACHE_SIZE", "128"))
+OPENAPI_OUTPUT_DIR = get_env("OPENAPI_OUTPUT_DIR", "generated_openapi")
+HTML_CONVERSION_MODE = get_env("HTML_CONVERSION_MODE", "background")
+PROMPT_TOKEN_BUDGET = int(get_env("PROMPT_TOKEN_BUDGET", "1200"))
+EXECUTOR_MODE = get_env("EXECUTOR_MODE", "react")
+HTTP_TIMEOUT = float(get_env("HTTP_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(get_env("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF = float(get_env("HTTP_BACKOFF", "0.5"))
+HTTP_POOL_SIZE = int(get_env("HTTP_POOL_SIZE", "10"))
+HTTP_PER_HOST_LIMIT = int(get_env("HTTP_PER_HOST_LIMIT", "4"))
+HTTP_MAX_RESPONSE_BYTES = int(get_env("HTTP_MAX_RESPONSE_BYTES", "1000000"))
+HTTP_CACHE_ENABLED = get_env("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_SIZE = int(get_env("HTTP_CACHE_SIZE", "512"))
+HTTP_CACHE_DEFAULT_TTL = float(get_env("HTTP_CACHE_DEFAULT_TTL", "300"))
+# Per-service TTLs in seconds, e.g. "dogapi.dog=3600,jsonplaceholder.typicode.com=60"
+HTTP_CACHE_TTLS = get_env("HTTP_CACHE_TTLS", "")
+FEEDBACK_RULES = get_env("FEEDBACK_RULES", "true").lower() == "true"
+EXTRACTOR_MODE = get_env("EXTRACTOR_MODE", "auto")
+EXTRACT_MAX_CHARS = int(get_env("EXTRACT_MAX_CHARS", "4000"))
+BATCH_WORKERS = int(get_env("BATCH_WORKERS", "4"))
+MAX_CONCURRENT_LLM_CALLS = int(get_env("MAX_CONCURRENT_LLM_CALLS", "2"))
+# Candidate APIs tried concurrently after retrieval (0 or 1 = one at a time)
+SPECULATIVE_CANDIDATES = int(get_env("SPECULATIVE_CANDIDATES", "0"))
+# Only answers obtained through GET calls are stored: plan-mode GET requests, or React runs
+# whose tool calls were all requests_get (ExecutorAgent.tool_request)
+SEMANTIC_CACHE_ENABLED = get_env("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_PATH = get_env("SEMANTIC_CACHE_PATH", os.path.join(CACHE_DIR, "semantic_cache.sqlite"))
+SEMANTIC_CACHE_THRESHOLD = float(get_env("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(get_env("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SIZE = int(get_env("SEMANTIC_CACHE_SIZE", "1000"))
+TRACE_ENABLED = get_env("TRACE_ENABLED", "true").lower() == "true"
+# Per-query JSON traces and the aggregate summary.json are written here
+TRACE_DIR = get_env("TRACE_DIR", os.path.join(CACHE_DIR, "traces"))
+# Oldest per-query traces are deleted beyond this many files (0 keeps them all)
+TRACE_MAX_FILES = int(get_env("TRACE_MAX_FILES", "1000"))
+# Latency samples kept per histogram for the quantiles; count, mean and max stay exact
+HISTOGRAM_RESERVOIR = int(get_env("HISTOGRAM_RESERVOIR", "2048"))
+SERVER_HOST = get_env("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(get_env("SERVER_PORT", "8080"))
+SERVER_MAX_CONCURRENT = int(get_env("SERVER_MAX_CONCURRENT", "4"))
+SERVER_QUEUE_SIZE = int(get_env("SERVER_QUEUE_SIZE", "16"))
+SERVER_DEADLINE = float(get_env("SERVER_DEADLINE", "120"))
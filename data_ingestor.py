@@ -1,17 +1,69 @@
 import os
 import json, yaml
-from typing import List
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Tuple
 from bs4 import BeautifulSoup
 
 from langchain_core.documents import Document
 from langchain_community.document_transformers import Html2TextTransformer
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from config import HTML_PARSER
+
+
+def resolve_html_parser(parser: str = HTML_PARSER) -> str:
+    """'auto' picks lxml when it is installed and falls back to the pure-Python html.parser."""
+    if parser == "auto":
+        return "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+    return parser
+
+
+def _load_file_worker(args) -> Tuple[str, List[Document], Optional[str]]:
+    """Process pool entry point: loads a single file and never raises."""
+    file_path, chunk_size, chunk_overlap, html_parser = args
+    try:
+        ingestor = DataIngestor(chunk_size, chunk_overlap, html_parser)
+        return file_path, ingestor.load_file(file_path), None
+    except Exception as e:
+        return file_path, [], str(e)
 
 
 class DataIngestor:
-    def __init__(self, chunk_size=1000, chunk_overlap=100):
+    def __init__(self, chunk_size=1000, chunk_overlap=100, html_parser=HTML_PARSER):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.html_parser = resolve_html_parser(html_parser)
+
+    def iter_load_files(self, file_paths: List[str], max_workers: int = 1) -> Iterator[Tuple[str, List[Document], Optional[str]]]:
+        """
+        Loads many files and yields (file_path, documents, error) as soon as each file is parsed.
+        With max_workers > 1 files are parsed across a process pool, so the caller can
+        embed the chunks of a file while the others are still being parsed.
+        """
+        jobs = [(path, self.chunk_size, self.chunk_overlap, self.html_parser) for path in file_paths]
+        if max_workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                yield _load_file_worker(job)
+            return
+
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+            futures = [pool.submit(_load_file_worker, job) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def load_file(self, file_path: str) -> List[Document]:
+        """
+        Loads a service description, choosing the parser from the file extension.
+        Returns an empty list for unsupported extensions.
+        """
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext == ".html":
+            return self.load_html(file_path)
+        elif ext in [".yaml", ".yml"]:
+            return self.load_openapi_yaml(file_path)
+        elif ext == ".json":
+            return self.load_openapi_json(file_path)
+        return []
 
     def load_html(self, file_path: str) -> List[Document]:
         """
@@ -19,7 +71,7 @@ class DataIngestor:
         Uses BeautifulSoup to parse and clean the HTML, then splits into sections.
         """
         with open(file_path, "r", encoding="utf-8") as f:
-            soup = BeautifulSoup(f, "html.parser")
+            soup = BeautifulSoup(f, self.html_parser)
 
         for tag in soup.select(
             "nav, footer, header, noscript, aside, style, "
@@ -0,0 +1,128 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+from instrumentation import span
+from config import EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBED_WORKERS, EMBEDDING_CACHE_PATH
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of embedding vectors keyed by (embedding model, chunk text hash).
+    Vectors are stored as float32 blobs in a SQLite table.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Query in slices to stay below SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                part = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                )
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, h, array("f", v).tobytes()) for h, v in vectors.items()],
+            )
+            self._conn.commit()
+
+
+class EmbeddingStats:
+    def __init__(self):
+        self.chunks = 0
+        self.cache_hits = 0
+        self.embedded = 0
+        self.seconds = 0.0
+
+    def report(self) -> str:
+        rate = self.chunks / self.seconds if self.seconds else float(self.chunks)
+        hit_rate = 100 * self.cache_hits / self.chunks if self.chunks else 0.0
+        return (f"Embedded {self.chunks} chunks in {self.seconds:.2f}s ({rate:.1f} chunks/sec), "
+                f"cache hit rate {hit_rate:.1f}% ({self.cache_hits} hits, {self.embedded} sent to the model)")
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper used by the Indexer: chunks are embedded in batches of
+    `batch_size`, up to `max_workers` batches run concurrently against the embedding
+    server, and vectors are cached on disk so identical chunks are never re-embedded.
+    Queries are passed straight to the underlying OllamaEmbeddings.
+    """
+
+    def __init__(self, model: str = EMBEDDING_MODEL, batch_size: int = EMBED_BATCH_SIZE,
+                 max_workers: int = EMBED_WORKERS, cache_path: str | None = EMBEDDING_CACHE_PATH):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.client = OllamaEmbeddings(model=model)
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.stats = EmbeddingStats()
+
+    def reset_stats(self):
+        self.stats = EmbeddingStats()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embedding", "documents", model=self.model, texts=len(texts)) as attrs:
+            vectors, attrs["cache_hits"] = self._embed_documents(texts)
+            return vectors
+
+    def _embed_documents(self, texts: List[str]) -> tuple:
+        """Returns (vectors, number of texts served from the cache)."""
+        start = time.perf_counter()
+        hashes = [text_sha256(t) for t in texts]
+        unique = dict(zip(hashes, texts))
+
+        vectors = self.cache.get_many(self.model, list(unique)) if self.cache else {}
+        missing = [h for h in unique if h not in vectors]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                results = pool.map(lambda b: self.client.embed_documents([unique[h] for h in b]), batches)
+                new_vectors = {}
+                for batch, batch_vectors in zip(batches, results):
+                    new_vectors.update(zip(batch, batch_vectors))
+            if self.cache:
+                self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        self.stats.chunks += len(texts)
+        self.stats.embedded += len(missing)
+        self.stats.cache_hits += len(texts) - len(missing)
+        self.stats.seconds += time.perf_counter() - start
+        return [vectors[h] for h in hashes], len(texts) - len(missing)
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embedding", "query", model=self.model):
+            return self.client.embed_query(text)
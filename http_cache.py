@@ -0,0 +1,191 @@
+import re
+import time
+from email.utils import parsedate_to_datetime
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from config import HTTP_CACHE_SIZE, HTTP_CACHE_DEFAULT_TTL, HTTP_CACHE_TTLS
+
+CACHEABLE_METHODS = ["GET", "HEAD"]
+CACHEABLE_STATUSES = [200, 203, 204, 300, 301]
+# Cached only when the service says for how long (max-age or Expires): a 404 may be transient
+ERROR_STATUSES = [404, 410]
+# Request headers that change the representation returned by a service
+VARY_HEADERS = ["accept", "accept-language", "authorization"]
+
+
+def parse_service_ttls(value: str = HTTP_CACHE_TTLS) -> Dict[str, float]:
+    """Parse "host=seconds,host=seconds" into a dict."""
+    ttls = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, _, seconds = item.partition("=")
+        try:
+            ttls[host.strip().lower()] = float(seconds)
+        except ValueError:
+            print(f"Ignoring invalid HTTP cache TTL entry: '{item}'")
+    return ttls
+
+
+def normalize_url(url: str, params: Optional[dict] = None) -> str:
+    """Lowercase scheme/host, drop default ports and fragment, merge and sort query parameters."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((parts.scheme == "http" and port == 80) or (parts.scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(str(k), str(v)) for k, v in (params or {}).items()]
+    return urlunsplit((parts.scheme.lower(), host, parts.path or "/", urlencode(sorted(query)), ""))
+
+
+class CacheEntry:
+    def __init__(self, response, expires_at: float):
+        self.response = response
+        self.expires_at = expires_at
+        self.etag = response.headers.get("ETag") or response.headers.get("etag")
+        self.last_modified = response.headers.get("Last-Modified") or response.headers.get("last-modified")
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache of GET/HEAD responses keyed by normalized URL + relevant headers.
+    Cache-Control (no-store, no-cache, max-age) is honored when the service sends it,
+    otherwise the per-service TTL (HTTP_CACHE_TTLS) or the default TTL applies.
+    Stale entries with an ETag/Last-Modified are revalidated with a conditional request.
+    """
+
+    def __init__(self, max_entries: int = HTTP_CACHE_SIZE, default_ttl: float = HTTP_CACHE_DEFAULT_TTL,
+                 service_ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self.service_ttls = parse_service_ttls() if service_ttls is None else service_ttls
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def key(self, method: str, url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> str:
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        vary = "&".join(f"{h}={headers[h]}" for h in VARY_HEADERS if h in headers)
+        return f"{method.upper()} {normalize_url(url, params)} {vary}"
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for a key (fresh or stale) and count hits/misses for fresh lookups."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if entry is not None and entry.fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    @staticmethod
+    def expires_ttl(headers: Dict[str, str]) -> Optional[float]:
+        """Seconds until the Expires header date, None if absent or invalid."""
+        value = headers.get("Expires") or headers.get("expires")
+        if not value:
+            return None
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def explicit_freshness(headers: Dict[str, str]) -> bool:
+        cache_control = (headers.get("Cache-Control") or headers.get("cache-control") or "").lower()
+        return bool(re.search(r"(?:s-maxage|max-age)=\d+", cache_control)) \
+            or bool(headers.get("Expires") or headers.get("expires"))
+
+    def ttl_for(self, url: str, headers: Dict[str, str]) -> Optional[float]:
+        """Seconds the response may be reused, or None if it must not be stored."""
+        cache_control = (headers.get("Cache-Control") or headers.get("cache-control") or "").lower()
+        if "no-store" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            return 0.0
+        max_age = re.search(r"(?:s-maxage|max-age)=(\d+)", cache_control)
+        if max_age:
+            return float(max_age.group(1))
+        expires = self.expires_ttl(headers)
+        if expires is not None:
+            return expires
+        host = (urlsplit(url).hostname or "").lower()
+        return self.service_ttls.get(host, self.default_ttl)
+
+    def store(self, key: str, url: str, response) -> Optional[CacheEntry]:
+        if response.truncated:
+            return None
+        if response.status_code not in CACHEABLE_STATUSES and not (
+                response.status_code in ERROR_STATUSES and self.explicit_freshness(response.headers)):
+            return None
+        ttl = self.ttl_for(url, response.headers)
+        if ttl is None:
+            return None
+        entry = CacheEntry(response, time.time() + ttl)
+        if ttl <= 0 and not (entry.etag or entry.last_modified):
+            return None
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def refresh(self, key: str, url: str, not_modified_response) -> Optional[CacheEntry]:
+        """
+        Handle a 304: keep the cached body, extend its lifetime with the new headers.
+        None if the entry was evicted meanwhile: the caller has to refetch unconditionally.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            headers = {**entry.response.headers, **not_modified_response.headers}
+            ttl = self.ttl_for(url, headers) or 0.0
+            entry.expires_at = time.time() + ttl
+            self.revalidated += 1
+            return entry
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"HTTP cache: {s['hits']} hits, {s['misses']} misses ({100 * s['hit_rate']:.1f}% hit rate), "
+                f"{s['revalidated']} revalidated (304), {s['entries']} entries")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache shared by the HTTP clients."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
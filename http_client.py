@@ -0,0 +1,251 @@
+import json
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (HTTP_TIMEOUT, HTTP_MAX_RETRIES, HTTP_BACKOFF, HTTP_POOL_SIZE,
+                    HTTP_PER_HOST_LIMIT, HTTP_MAX_RESPONSE_BYTES, HTTP_CACHE_ENABLED)
+from http_cache import CACHEABLE_METHODS, get_response_cache
+from instrumentation import span
+
+RETRY_STATUSES = [429, 502, 503, 504]
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+
+
+class HttpResponse:
+    """Response returned by the shared clients, with the body already read (and capped)."""
+
+    def __init__(self, status_code: int, headers: Dict[str, str], content: bytes,
+                 encoding: Optional[str] = None, truncated: bool = False, retries: int = 0,
+                 from_cache: bool = False):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or "utf-8"
+        self.truncated = truncated
+        self.retries = retries
+        self.from_cache = from_cache
+
+    def cached_copy(self) -> "HttpResponse":
+        return HttpResponse(self.status_code, self.headers, self.content, self.encoding,
+                            self.truncated, 0, from_cache=True)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def pretty_text(self) -> str:
+        """JSON bodies indented, anything else as plain text."""
+        try:
+            return json.dumps(self.json(), indent=2, ensure_ascii=False)
+        except ValueError:
+            return self.text
+
+
+def record_response(attrs: dict, resp: HttpResponse):
+    """Span attributes of a response: status, size, retries, cache hit."""
+    attrs.update(status=resp.status_code, bytes=len(resp.content), retries=resp.retries,
+                 from_cache=resp.from_cache, truncated=resp.truncated)
+
+
+class HttpClient:
+    """
+    Shared synchronous HTTP client: keep-alive connection pool, per-host concurrency
+    limit, timeouts, bounded retries with exponential backoff (idempotent methods only)
+    and a cap on the response size. GET/HEAD responses go through the shared ResponseCache.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, max_retries: int = HTTP_MAX_RETRIES,
+                 backoff: float = HTTP_BACKOFF, pool_size: int = HTTP_POOL_SIZE,
+                 per_host_limit: int = HTTP_PER_HOST_LIMIT, max_response_bytes: int = HTTP_MAX_RESPONSE_BYTES,
+                 use_cache: bool = HTTP_CACHE_ENABLED):
+        self.cache = get_response_cache() if use_cache else None
+        self.timeout = timeout
+        self.per_host_limit = max(1, per_host_limit)
+        self.max_response_bytes = max_response_bytes
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._hosts_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._hosts[host]
+
+    def request(self, method: str, url: str, params: Optional[dict] = None, json: Any = None,
+                data: Any = None, headers: Optional[dict] = None) -> HttpResponse:
+        method = method.upper()
+        with span("http", f"{method} {urlsplit(url).netloc}", url=url) as attrs:
+            resp = self._cached_request(method, url, params, json, data, headers)
+            record_response(attrs, resp)
+            return resp
+
+    def _cached_request(self, method: str, url: str, params: Optional[dict], json: Any, data: Any,
+                        headers: Optional[dict]) -> HttpResponse:
+        if self.cache is None or method not in CACHEABLE_METHODS:
+            return self._send(method, url, params, json, data, headers)
+
+        key = self.cache.key(method, url, params, headers)
+        entry = self.cache.lookup(key)
+        if entry is not None and entry.fresh:
+            return entry.response.cached_copy()
+        conditional = {**(headers or {}), **entry.validators()} if entry is not None else headers
+        resp = self._send(method, url, params, json, data, conditional)
+        if entry is not None and resp.status_code == 304:
+            refreshed = self.cache.refresh(key, url, resp)
+            if refreshed is not None:
+                return refreshed.response.cached_copy()
+            # Evicted by a concurrent query since the lookup: the 304 has no body to return
+            resp = self._send(method, url, params, json, data, headers)
+        self.cache.store(key, url, resp)
+        return resp
+
+    def _send(self, method: str, url: str, params: Optional[dict], json: Any, data: Any,
+              headers: Optional[dict]) -> HttpResponse:
+        with self._host_slot(url):
+            with self.session.request(method, url, params=params, json=json, data=data,
+                                      headers=headers, timeout=self.timeout, stream=True) as resp:
+                content, truncated = bytearray(), False
+                for chunk in resp.iter_content(chunk_size=65536):
+                    content.extend(chunk)
+                    if len(content) > self.max_response_bytes:
+                        del content[self.max_response_bytes:]
+                        truncated = True
+                        print(f"Response from {url} truncated to {self.max_response_bytes} bytes")
+                        break
+                retries = len(resp.raw.retries.history) if getattr(resp.raw, "retries", None) else 0
+                return HttpResponse(resp.status_code, dict(resp.headers), bytes(content),
+                                    resp.encoding, truncated, retries)
+
+    def get(self, url: str, **kwargs) -> HttpResponse:
+        return self.request("GET", url, **kwargs)
+
+
+class AsyncHttpClient:
+    """
+    Asynchronous counterpart of HttpClient built on httpx, with the same pool,
+    per-host limit, timeout, retry, size-cap and caching policy. Bound to one event loop.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, max_retries: int = HTTP_MAX_RETRIES,
+                 backoff: float = HTTP_BACKOFF, pool_size: int = HTTP_POOL_SIZE,
+                 per_host_limit: int = HTTP_PER_HOST_LIMIT, max_response_bytes: int = HTTP_MAX_RESPONSE_BYTES,
+                 use_cache: bool = HTTP_CACHE_ENABLED):
+        self.cache = get_response_cache() if use_cache else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.per_host_limit = max(1, per_host_limit)
+        self.max_response_bytes = max_response_bytes
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            follow_redirects=True,
+        )
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._hosts[host]
+
+    async def request(self, method: str, url: str, params: Optional[dict] = None, json: Any = None,
+                      data: Any = None, headers: Optional[dict] = None) -> HttpResponse:
+        method = method.upper()
+        with span("http", f"{method} {urlsplit(url).netloc}", url=url) as attrs:
+            resp = await self._cached_request(method, url, params, json, data, headers)
+            record_response(attrs, resp)
+            return resp
+
+    async def _cached_request(self, method: str, url: str, params: Optional[dict], json: Any, data: Any,
+                              headers: Optional[dict]) -> HttpResponse:
+        if self.cache is None or method not in CACHEABLE_METHODS:
+            return await self._send(method, url, params, json, data, headers)
+
+        key = self.cache.key(method, url, params, headers)
+        entry = self.cache.lookup(key)
+        if entry is not None and entry.fresh:
+            return entry.response.cached_copy()
+        conditional = {**(headers or {}), **entry.validators()} if entry is not None else headers
+        resp = await self._send(method, url, params, json, data, conditional)
+        if entry is not None and resp.status_code == 304:
+            refreshed = self.cache.refresh(key, url, resp)
+            if refreshed is not None:
+                return refreshed.response.cached_copy()
+            # Evicted by a concurrent query since the lookup: the 304 has no body to return
+            resp = await self._send(method, url, params, json, data, headers)
+        self.cache.store(key, url, resp)
+        return resp
+
+    async def _send(self, method: str, url: str, params: Optional[dict], json: Any, data: Any,
+                    headers: Optional[dict]) -> HttpResponse:
+        attempts = 1 + (self.max_retries if method in IDEMPOTENT_METHODS else 0)
+        async with self._host_slot(url):
+            for attempt in range(attempts):
+                last_attempt = attempt == attempts - 1
+                try:
+                    async with self.client.stream(method, url, params=params, json=json, data=data,
+                                                  headers=headers) as resp:
+                        if resp.status_code in RETRY_STATUSES and not last_attempt:
+                            await asyncio.sleep(self.backoff * 2 ** attempt)
+                            continue
+                        content, truncated = bytearray(), False
+                        async for chunk in resp.aiter_bytes():
+                            content.extend(chunk)
+                            if len(content) > self.max_response_bytes:
+                                del content[self.max_response_bytes:]
+                                truncated = True
+                                print(f"Response from {url} truncated to {self.max_response_bytes} bytes")
+                                break
+                        return HttpResponse(resp.status_code, dict(resp.headers), bytes(content),
+                                            resp.encoding, truncated, attempt)
+                except (httpx.TransportError, httpx.TimeoutException):
+                    if last_attempt:
+                        raise
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("GET", url, **kwargs)
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHttpClient]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide synchronous client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def get_async_http_client() -> AsyncHttpClient:
+    """Return the asynchronous client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = AsyncHttpClient()
+    return _async_clients[loop]
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+from config import INDEX_PATH
+
+SUPPORTED_EXTENSIONS = [".html", ".json", ".yaml", ".yml"]
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(file_path) -> str:
+    """Return the hex SHA-256 of a file's content, read in blocks."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ManifestDiff:
+    """
+    Result of comparing the manifest with the files in the service directory.
+    `hashes` holds the content hash computed for every file that had to be hashed.
+    """
+
+    def __init__(self):
+        self.added: List[str] = []
+        self.modified: List[str] = []
+        self.removed: List[str] = []
+        self.unchanged: List[str] = []
+        self.hashes: Dict[str, str] = {}
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+    def __repr__(self):
+        return (f"ManifestDiff(added={self.added}, modified={self.modified}, "
+                f"removed={self.removed}, unchanged={len(self.unchanged)})")
+
+
+class IndexManifest:
+    """
+    Persistent record of the service files ingested in the FAISS index, stored next to it.
+    For every file name it keeps path, size, mtime, content hash and the ids of the
+    vectors generated from that file, so the Indexer can update the index incrementally.
+    """
+
+    def __init__(self, index_path=INDEX_PATH):
+        self.index_path = Path(index_path)
+        self.path = self.index_path / MANIFEST_NAME
+        self.version = 0
+        self.files: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, index_path=INDEX_PATH) -> "IndexManifest":
+        manifest = cls(index_path)
+        if not manifest.path.exists():
+            return manifest
+        try:
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            manifest.version = data.get("version", 0)
+            manifest.files = data.get("files", {})
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable index manifest {manifest.path}: {e}")
+        return manifest
+
+    def save(self):
+        """Write the manifest atomically and bump its version."""
+        self.version += 1
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def record(self, file_path: Path, sha256: str, ids: List[str], error: Optional[str] = None):
+        st = file_path.stat()
+        self.files[file_path.name] = {
+            "path": str(file_path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": sha256,
+            "ids": ids,
+        }
+        if error:
+            self.files[file_path.name]["error"] = error
+
+    def remove(self, name: str) -> List[str]:
+        """Drop a file from the manifest and return the ids of its vectors."""
+        entry = self.files.pop(name, None)
+        return entry.get("ids", []) if entry else []
+
+    def all_ids(self) -> List[str]:
+        return [i for entry in self.files.values() for i in entry.get("ids", [])]
+
+    def scan(self, services_dir) -> ManifestDiff:
+        """
+        Compare the manifest with the supported files in `services_dir`.
+        Files whose size and mtime are unchanged are not read; the others are hashed,
+        so a touched-but-identical file is reported as unchanged.
+        """
+        diff = ManifestDiff()
+        current = set()
+
+        for file in Path(services_dir).iterdir():
+            if not file.is_file() or file.suffix.lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            current.add(file.name)
+            entry = self.files.get(file.name)
+            st = file.stat()
+            if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+                diff.unchanged.append(file.name)
+                continue
+
+            sha256 = file_sha256(file)
+            diff.hashes[file.name] = sha256
+            if entry is None:
+                diff.added.append(file.name)
+            elif entry.get("sha256") != sha256:
+                diff.modified.append(file.name)
+            else:
+                diff.unchanged.append(file.name)
+
+        diff.removed = [name for name in self.files if name not in current]
+        return diff
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from config import TRACE_ENABLED, TRACE_DIR, TRACE_MAX_FILES, HISTOGRAM_RESERVOIR
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")]
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """
+    Everything measured while answering one query: a span per graph node, LLM call,
+    embedding call and HTTP call (with tokens, retries, cache hits), plus the routing decisions.
+    """
+
+    def __init__(self, query: str):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.routes: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def offset(self) -> float:
+        return round(time.perf_counter() - self._t0, 4)
+
+    def add_span(self, kind: str, name: str, start: float, duration: float, **attrs):
+        with self._lock:
+            self.spans.append({"kind": kind, "name": name, "start": round(start, 4),
+                               "duration": round(duration, 4), **attrs})
+
+    def count(self, counter: str, n: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def route(self, decision: str):
+        with self._lock:
+            self.routes.append({"at": self.offset(), "next": decision})
+
+    def summary(self) -> Dict[str, Any]:
+        """Total time, call counts and tokens per span kind, and time per node."""
+        totals: Dict[str, Dict[str, float]] = {}
+        nodes: Dict[str, float] = {}
+        for s in self.spans:
+            t = totals.setdefault(s["kind"], {"calls": 0, "seconds": 0.0})
+            t["calls"] += 1
+            t["seconds"] = round(t["seconds"] + s["duration"], 4)
+            for key in ["prompt_tokens", "completion_tokens"]:
+                if s.get(key):
+                    t[key] = t.get(key, 0) + s[key]
+            if s["kind"] == "node":
+                nodes[s["name"]] = round(nodes.get(s["name"], 0.0) + s["duration"], 4)
+        return {"duration": self.duration, "nodes": nodes, "totals": totals, "counters": dict(self.counters)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "query": self.query,
+            "started_at": self.started_at,
+            "summary": self.summary(),
+            "routes": self.routes,
+            "spans": sorted(self.spans, key=lambda s: s["start"]),
+        }
+
+    def report(self) -> str:
+        s = self.summary()
+        nodes = ", ".join(f"{n} {sec:.2f}s" for n, sec in sorted(s["nodes"].items(), key=lambda x: -x[1]))
+        llm = s["totals"].get("llm", {})
+        return (f"Trace {self.trace_id}: {s['duration']:.2f}s total | nodes: {nodes or '-'} | "
+                f"LLM calls: {llm.get('calls', 0)} ({llm.get('prompt_tokens', 0)} prompt / "
+                f"{llm.get('completion_tokens', 0)} completion tokens) | "
+                f"HTTP calls: {s['totals'].get('http', {}).get('calls', 0)}")
+
+
+class Histogram:
+    """
+    Bucket counts, count, sum and max are exact; quantiles come from a uniform reservoir
+    sample of at most `reservoir` values, so memory stays bounded in a long-running server.
+    """
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS, reservoir: int = HISTOGRAM_RESERVOIR):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.reservoir = max(1, reservoir)
+        self.values: List[float] = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.values) < self.reservoir:
+            self.values.append(value)
+        else:
+            # Reservoir sampling: every observation so far is kept with the same probability
+            i = random.randrange(self.count)
+            if i < self.reservoir:
+                self.values[i] = value
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "max": round(self.max, 4),
+            "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in zip(self.buckets, self.counts)},
+        }
+
+
+class TraceAggregator:
+    """Process-wide latency histograms per span (kind:name) and per query, fed by finished traces."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.queries = 0
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self.queries += 1
+            self.histograms.setdefault("query", Histogram()).observe(trace.duration or 0.0)
+            for s in trace.spans:
+                self.histograms.setdefault(f"{s['kind']}:{s['name']}", Histogram()).observe(s["duration"])
+            for key, n in trace.counters.items():
+                self.counters[key] = self.counters.get(key, 0) + n
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "counters": dict(self.counters),
+                "histograms": {k: h.to_dict() for k, h in sorted(self.histograms.items())},
+            }
+
+    def report(self) -> str:
+        data = self.to_dict()
+        lines = [f"Latency over {data['queries']} queries (seconds):",
+                 f"{'span':<32}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}"]
+        for name, h in data["histograms"].items():
+            lines.append(f"{name:<32}{h['count']:>7}{h['mean']:>9.3f}{h['p50']:>9.3f}{h['p95']:>9.3f}{h['max']:>9.3f}")
+        return "\n".join(lines)
+
+    def save(self, trace_dir: str = TRACE_DIR):
+        os.makedirs(trace_dir, exist_ok=True)
+        with open(os.path.join(trace_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+_aggregator = TraceAggregator()
+
+
+def get_aggregator() -> TraceAggregator:
+    return _aggregator
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def prune_traces(trace_dir: str, max_files: int = TRACE_MAX_FILES):
+    """Delete the oldest per-query trace files beyond `max_files` (summary.json is kept)."""
+    if max_files <= 0:
+        return
+    traces = [e for e in os.scandir(trace_dir)
+              if e.is_file() and e.name.endswith(".json") and e.name != "summary.json"]
+    if len(traces) <= max_files:
+        return
+    traces.sort(key=lambda e: e.stat().st_mtime)
+    for entry in traces[:len(traces) - max_files]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def start_trace(query: str, trace_dir: str = TRACE_DIR, enabled: bool = TRACE_ENABLED):
+    """Trace the block (one pipeline run); the trace is exported to `trace_dir` when it ends."""
+    if not enabled:
+        yield None
+        return
+    trace = Trace(query)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.duration = trace.offset()
+        _aggregator.add(trace)
+        if trace_dir:
+            try:
+                os.makedirs(trace_dir, exist_ok=True)
+                with open(os.path.join(trace_dir, f"{trace.trace_id}.json"), "w", encoding="utf-8") as f:
+                    json.dump(trace.to_dict(), f, indent=2, ensure_ascii=False, default=str)
+                prune_traces(trace_dir)
+            except OSError as e:
+                print(f"Could not write trace {trace.trace_id}: {e}")
+
+
+@contextmanager
+def span(kind: str, name: str, **attrs):
+    """
+    Time the block as a span of the current trace (no-op outside a trace).
+    The yielded dict can be filled with attributes known only at the end (status, cache hit...).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+    start = trace.offset()
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        trace.add_span(kind, name, start, time.perf_counter() - t0, **attrs)
+
+
+def count(counter: str, n: int = 1):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(counter, n)
+
+
+def record_route(decision: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.route(decision)
+
+
+def token_usage(response) -> Dict[str, int]:
+    """Prompt/completion tokens of an LLMResult from OllamaLLM (generation_info) or ChatOllama (usage_metadata)."""
+    prompt = completion = 0
+    for generations in response.generations:
+        for gen in generations:
+            usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+            elif gen.generation_info:
+                prompt += gen.generation_info.get("prompt_eval_count") or 0
+                completion += gen.generation_info.get("eval_count") or 0
+    return {"prompt_tokens": prompt, "completion_tokens": completion}
+
+
+class LLMTraceHandler(BaseCallbackHandler):
+    """LangChain callback handler adding a span (model, duration, tokens) per LLM call to the current trace."""
+
+    run_inline = True
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._runs: Dict[Any, tuple] = {}
+
+    def _start(self, run_id, serialized, kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        params = kwargs.get("invocation_params") or {}
+        model = (kwargs.get("metadata") or {}).get("ls_model_name") or params.get("model") \
+            or (serialized or {}).get("kwargs", {}).get("model", "")
+        self._runs[run_id] = (trace, trace.offset(), time.perf_counter(), model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, serialized, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, serialized, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            trace, start, t0, model = run
+            trace.add_span("llm", self.agent, start, time.perf_counter() - t0, model=model, **token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            trace, start, t0, model = run
+            trace.add_span("llm", self.agent, start, time.perf_counter() - t0, model=model,
+                           error=f"{type(error).__name__}: {error}")
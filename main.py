@@ -1,9 +1,67 @@
-from pipeline import run_with_multiagent
-from config import SERVICE_FOLDER
+import argparse
+import threading
+from config import SERVICE_FOLDER, BATCH_WORKERS, MAX_CONCURRENT_LLM_CALLS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the services described in '" + SERVICE_FOLDER + "'.")
+    parser.add_argument("--conversion-status", action="store_true",
+                        help="show which HTML docs are converted to OpenAPI, pending or failed")
+    parser.add_argument("--convert-html", action="store_true",
+                        help="update the index and convert pending HTML docs to OpenAPI, then exit")
+    parser.add_argument("--batch", metavar="INPUT_JSONL",
+                        help="answer every query of a JSONL file ({\"id\": ..., \"query\": ...} per line)")
+    parser.add_argument("--output", default="batch_results.jsonl",
+                        help="JSONL file where batch results are appended (default: batch_results.jsonl)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="queries run concurrently in batch mode")
+    parser.add_argument("--max-llm-calls", type=int, default=MAX_CONCURRENT_LLM_CALLS,
+                        help="maximum concurrent LLM calls in batch mode")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="show where startup time goes (imports by package, graph and agents), then exit")
+    return parser.parse_args()
+
+
+def prewarm():
+    """Import the pipeline and build the graph and the agents on its route while the user types the question."""
+    try:
+        from pipeline import prewarm as prewarm_pipeline
+        prewarm_pipeline()
+    except Exception as e:
+        # The query builds whatever is missing and reports the error itself
+        print(f"Prewarm failed: {e}")
+
+
+def ask() -> tuple:
+    """(question, prewarm thread): the query starts without waiting for the thread, and
+    waits only for the agent it needs next if that one is still being built."""
+    warm = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+    warm.start()
+    return input("Ask me a question. I'll respond using the services described in the '" + SERVICE_FOLDER + "' folder.\n>> "), warm
+
 
 if __name__ == "__main__":
-    query = input("Ask me a question. I'll respond using the services described in the '" + SERVICE_FOLDER + "' folder.\n>> ")
-    query = query + ("\nDon't explain how to call the API and don't show code examples. "
-        "You must use your tool to actually send the request and return the real response data.\nReturn ONLY the http response."
-    )
-    run_with_multiagent(query)
\ No newline at end of file
+    args = parse_args()
+
+    if args.startup_report:
+        from startup import startup_report
+        print(startup_report())
+    elif args.conversion_status or args.convert_html:
+        from agents.converter import HtmlConversionStatus
+        if args.convert_html:
+            from agents.indexer import Indexer
+            Indexer()._create_index(html_conversion="sync")
+        print(HtmlConversionStatus().format())
+    elif args.batch:
+        from batch import run_batch
+        run_batch(args.batch, args.output, args.workers, args.max_llm_calls)
+    else:
+        query, warm = ask()
+        from pipeline import run_with_multiagent, QUERY_INSTRUCTIONS
+        query = query + QUERY_INSTRUCTIONS
+        try:
+            print(f"\nAnswer:\n{run_with_multiagent(query)}")
+        except RuntimeError as e:
+            print(f"\nNo answer: {e}")
+        finally:
+            # A daemon thread killed while importing native code can abort the interpreter at exit
+            warm.join()
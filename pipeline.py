@@ -1,16 +1,26 @@
-from langgraph.graph import StateGraph
-from state import State
-from agents.converter import ConverterAgent
-from agents.executor import ExecutorAgent
-from agents.feedback import FeedbackAgent
-from agents.retreiver import RetrieverAgent
-from agents.extractor import ExtractorAgent
-from agents.indexer import Indexer
+import time
+import asyncio
+import threading
+from typing import Iterator, Tuple
+from state import State, QUERY_INSTRUCTIONS, strip_instructions
+from agents import AGENTS, get_agent, is_loaded
+from config import SPECULATIVE_CANDIDATES, EXECUTOR_MODE
+
+_compiled_graphs = {}
+_compiled_graph_lock = threading.Lock()
+
 
 def print_node(node):
     print(f"======== {node} node ========")
 
 def routing(state: State) -> str:
+    from instrumentation import record_route
+    decision = next_node(state)
+    record_route(decision)
+    return decision
+
+
+def next_node(state: State) -> str:
     if state.get("done"):
         return "end"
 
@@ -27,6 +37,11 @@ def routing(state: State) -> str:
         return "end"
 
     if not state.get("api_spec_yaml") or not state.get("system_message"):
+        # Speculation needs plan mode: only there is the HTTP method known before sending
+        if SPECULATIVE_CANDIDATES > 1 and EXECUTOR_MODE == "plan" and not state.get("speculated") \
+                and len(files) - idx > 1:
+            print_node("speculate")
+            return "speculate"
         print_node("prepare")
         return "prepare"
 
@@ -41,32 +56,235 @@ def routing(state: State) -> str:
     return "feedback"
 
 
-def build_multiagent_graph() -> StateGraph:
+def timed(node: str, fn):
+    """Wrap a node so that its wall time is accumulated in state["node_timings"] and traced as a span."""
+    from instrumentation import span
+
+    def run(state: State) -> State:
+        start = time.perf_counter()
+        with span("node", node):
+            result = fn(state)
+        timings = dict(result.get("node_timings") or {})
+        timings[node] = round(timings.get(node, 0.0) + time.perf_counter() - start, 4)
+        return {**result, "node_timings": timings}
+    return run
+
+
+def atimed(node: str, fn):
+    """Async counterpart of timed, for the agents' arun methods."""
+    from instrumentation import span
+
+    async def run(state: State) -> State:
+        start = time.perf_counter()
+        with span("node", node):
+            result = await fn(state)
+        timings = dict(result.get("node_timings") or {})
+        timings[node] = round(timings.get(node, 0.0) + time.perf_counter() - start, 4)
+        return {**result, "node_timings": timings}
+    return run
+
+
+def lazy_node(node: str, use_async: bool = False):
+    """Node function resolving its agent from the registry when the node first runs."""
+    if use_async:
+        async def arun(state: State) -> State:
+            # Importing and constructing an agent blocks: not on the event loop
+            agent = get_agent(node) if is_loaded(node) else await asyncio.to_thread(get_agent, node)
+            return await agent.arun(state)
+        return arun
+
+    def run(state: State) -> State:
+        return get_agent(node).run(state)
+    return run
+
+
+def build_multiagent_graph(use_async: bool = False):
+    """With use_async the nodes are the agents' arun coroutines, for graph.ainvoke."""
+    from langgraph.graph import StateGraph
+
     g = StateGraph(State)
-    g.add_node("index", Indexer().run)
-    g.add_node("retrieve", RetrieverAgent().run)
-    g.add_node("prepare", ConverterAgent().run)
-    g.add_node("request", ExecutorAgent().run)
-    g.add_node("feedback", FeedbackAgent().run)
-    g.add_node("extract", ExtractorAgent().run)
+    for node in AGENTS:
+        g.add_node(node, atimed(node, lazy_node(node, True)) if use_async else timed(node, lazy_node(node)))
 
     g.set_entry_point("retrieve")
-    print_node("retrieve")
 
-    for node in ["index", "retrieve", "prepare", "request", "feedback", "extract"]:
+    for node in AGENTS:
         g.add_conditional_edges(node, routing)
 
     return g
 
 
-def run_with_multiagent(user_query: str) -> str:
-    graph = build_multiagent_graph().compile()
-    initial_state: State = {
+def get_compiled_graph(use_async: bool = False):
+    """Compile the graph once per process (and mode); agents and their clients are shared by every query."""
+    with _compiled_graph_lock:
+        if use_async not in _compiled_graphs:
+            _compiled_graphs[use_async] = build_multiagent_graph(use_async).compile()
+        return _compiled_graphs[use_async]
+
+
+def route_nodes() -> list:
+    """
+    Nodes a query can reach with the current configuration: speculate only when enabled,
+    index only when there is no index yet (an outdated one is detected by the first query).
+    """
+    from vector_store import index_exists
+    nodes = [node for node in AGENTS if node not in ["speculate", "index"]]
+    if SPECULATIVE_CANDIDATES > 1 and EXECUTOR_MODE == "plan":
+        nodes.append("speculate")
+    if not index_exists():
+        nodes.append("index")
+    return nodes
+
+
+def prewarm(nodes=None, use_async: bool = False) -> dict:
+    """
+    Compile the graph and construct the agents ahead of the first query (the route_nodes by default).
+    Returns the seconds spent per step.
+    """
+    timings = {}
+    start = time.perf_counter()
+    get_compiled_graph(use_async)
+    timings["graph"] = round(time.perf_counter() - start, 3)
+    for node in nodes or route_nodes():
+        start = time.perf_counter()
+        get_agent(node)
+        timings[f"agent:{node}"] = round(time.perf_counter() - start, 3)
+    return timings
+
+
+def initial_state(user_query: str) -> State:
+    return {
         "user_query": user_query,
         "needs_reindex": False,
         "retrieved": False,
     }
-    final_state = graph.invoke(initial_state)
+
+
+def cached_state(user_query: str) -> tuple:
+    """
+    Look the query up in the semantic answer cache.
+    Returns (final state built from the cached answer or None, query vector or None).
+    """
+    from instrumentation import count
+    from semantic_cache import get_semantic_cache
+    cache = get_semantic_cache()
+    if cache is None:
+        return None, None
+    try:
+        hit, vector = cache.lookup(strip_instructions(user_query))
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {e}")
+        return None, None
+    if hit is None:
+        return None, vector
+    cached_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(hit["cached_at"]))
+    print(f"Answer served from the semantic cache: similar to '{hit['matched_query']}' "
+          f"(similarity {hit['similarity']}), API file {hit['api_file']}, cached at {cached_at}")
+    count("semantic_cache_hit")
+    return {
+        **initial_state(user_query),
+        "retrieved": True,
+        "done": True,
+        "current_api_path": hit["api_file"],
+        "last_response": hit["answer"],
+        "cache_hit": hit,
+    }, vector
+
+
+def remember_answer(user_query: str, final_state: State, vector=None):
+    """Store a successful answer obtained through a known GET call; write calls (POST, PUT...) are not replayed."""
+    from semantic_cache import get_semantic_cache
+    cache = get_semantic_cache()
+    if cache is None or final_state.get("cache_hit") or final_state.get("error"):
+        return
+    if not (final_state.get("done") and final_state.get("last_response")):
+        return
+    # No last_request: the executor answered without an HTTP call, or its method is unknown
+    request = final_state.get("last_request")
+    if not request or str(request.get("method", "")).lower() != "get":
+        return
+    try:
+        cache.store(strip_instructions(user_query), final_state["last_response"],
+                    final_state.get("current_api_path"), vector)
+    except Exception as e:
+        print(f"Could not store the answer in the semantic cache: {e}")
+
+
+def finish_trace(final_state: State, trace) -> State:
+    if trace is None:
+        return final_state
+    print(trace.report())
+    return {**final_state, "trace_id": trace.trace_id}
+
+
+def invoke_pipeline(user_query: str) -> State:
+    """Run the graph for a query and return the final state."""
+    from instrumentation import start_trace
+    graph = get_compiled_graph()
+    with start_trace(user_query) as trace:
+        final_state, vector = cached_state(user_query)
+        if final_state is None:
+            print_node("retrieve")
+            final_state = graph.invoke(initial_state(user_query))
+            remember_answer(user_query, final_state, vector)
+    return finish_trace(final_state, trace)
+
+
+def stream_pipeline(user_query: str) -> Iterator[Tuple[str, State]]:
+    """
+    Run the graph for a query, yielding (node, state) after every node completes.
+    The last state yielded is the final one; closing the generator stops the run
+    before the next node starts.
+    """
+    from instrumentation import start_trace
+    graph = get_compiled_graph()
+    state = initial_state(user_query)
+    with start_trace(user_query) as trace:
+        cached, vector = cached_state(user_query)
+        if cached is not None:
+            yield "cache", cached if trace is None else {**cached, "trace_id": trace.trace_id}
+        else:
+            print_node("retrieve")
+            for update in graph.stream(state, stream_mode="updates"):
+                for node, node_state in update.items():
+                    state = {**state, **(node_state or {})}
+                    yield node, state if trace is None else {**state, "trace_id": trace.trace_id}
+            remember_answer(user_query, state, vector)
+    if trace is not None:
+        print(trace.report())
+
+
+async def ainvoke_pipeline(user_query: str) -> State:
+    """Async counterpart of invoke_pipeline: many queries can be in flight on one event loop."""
+    from instrumentation import start_trace
+    graph = get_compiled_graph(use_async=True)
+    with start_trace(user_query) as trace:
+        final_state, vector = await asyncio.to_thread(cached_state, user_query)
+        if final_state is None:
+            print_node("retrieve")
+            final_state = await graph.ainvoke(initial_state(user_query))
+            await asyncio.to_thread(remember_answer, user_query, final_state, vector)
+    return finish_trace(final_state, trace)
+
+
+def run_with_multiagent(user_query: str) -> str:
+    return final_answer(invoke_pipeline(user_query))
+
+
+async def arun_with_multiagent(user_query: str) -> str:
+    """Async run_with_multiagent, e.g. asyncio.gather(*(arun_with_multiagent(q) for q in queries))."""
+    return final_answer(await ainvoke_pipeline(user_query))
+
+
+def final_answer(final_state: State) -> str:
+    from http_cache import get_response_cache
+    from semantic_cache import get_semantic_cache
+    cache = get_response_cache()
+    if cache.hits or cache.misses:
+        print(cache.report())
+    answers = get_semantic_cache()
+    if answers is not None and (answers.hits or answers.misses):
+        print(answers.report())
 
     if final_state.get("done") and final_state.get("last_response"):
         print("Pipeline completed successfully.")
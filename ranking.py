@@ -0,0 +1,78 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+from langchain_core.documents import Document
+from config import OPENAPI_WEIGHT, RETRIEVER_RERANK_WEIGHT, RRF_K
+
+OPENAPI_EXTENSIONS = (".json", ".yaml", ".yml")
+TERM = re.compile(r"[a-z0-9]{3,}")
+STOPWORDS = {"the", "and", "for", "with", "from", "that", "this", "what", "which", "are", "you", "your",
+             "can", "get", "give", "show", "tell", "about", "api", "please", "all", "any", "its"}
+
+
+def is_openapi_source(source: str) -> bool:
+    return source.lower().endswith(OPENAPI_EXTENSIONS)
+
+
+def query_terms(text: str) -> set:
+    return {t for t in TERM.findall(text.lower()) if t not in STOPWORDS}
+
+
+def aggregate_file_scores(docs_and_scores: Iterable[Tuple[Document, float]], openapi_weight: float = OPENAPI_WEIGHT,
+                          decay: float = 0.5) -> List[Tuple[str, float]]:
+    """
+    File-level scores from chunk relevance scores, best first.
+    The best chunk of a file counts fully and each further chunk `decay` times the previous
+    one, so a file matching in several places beats a single lucky chunk.
+    OpenAPI files (.json, .yaml, .yml) are multiplied by `openapi_weight` over HTML pages.
+    """
+    return aggregate_source_scores(((str(doc.metadata.get("source", "")), score) for doc, score in docs_and_scores),
+                                   openapi_weight, decay)
+
+
+def aggregate_source_scores(sources_and_scores: Iterable[Tuple[str, float]], openapi_weight: float = OPENAPI_WEIGHT,
+                            decay: float = 0.5) -> List[Tuple[str, float]]:
+    """aggregate_file_scores for (source, chunk score) pairs, e.g. BM25 hits."""
+    by_source: Dict[str, List[float]] = {}
+    for source, score in sources_and_scores:
+        if source:
+            by_source.setdefault(source, []).append(max(0.0, float(score)))
+
+    scores = {}
+    for source, chunk_scores in by_source.items():
+        total = sum(s * decay ** i for i, s in enumerate(sorted(chunk_scores, reverse=True)))
+        scores[source] = total * (openapi_weight if is_openapi_source(source) else 1.0)
+    return sorted(scores.items(), key=lambda x: -x[1])
+
+
+def lexical_rerank(query: str, ranked: List[Tuple[str, float]], docs: Iterable[Document],
+                   weight: float = RETRIEVER_RERANK_WEIGHT) -> List[Tuple[str, float]]:
+    """
+    Blend each file's score with the share of query terms found in its retrieved chunks
+    (paths, parameters, summaries): cheap, and catches exact identifiers embeddings blur.
+    """
+    terms = query_terms(query)
+    if not terms or not ranked:
+        return ranked
+    text_by_source: Dict[str, set] = {}
+    for doc in docs:
+        source = str(doc.metadata.get("source", ""))
+        text_by_source.setdefault(source, set()).update(TERM.findall(doc.page_content.lower()))
+
+    top = ranked[0][1] or 1.0
+    reranked = []
+    for source, score in ranked:
+        overlap = len(terms & text_by_source.get(source, set())) / len(terms)
+        reranked.append((source, (1 - weight) * score / top + weight * overlap))
+    return sorted(reranked, key=lambda x: -x[1])
+
+
+def rrf_fuse(rankings: List[List[Tuple[str, float]]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Reciprocal rank fusion: each file scores sum(1 / (k + rank)) over the rankings it appears in.
+    Only ranks matter, so BM25 and cosine scores don't have to be on the same scale.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (source, _) in enumerate(ranking, start=1):
+            fused[source] = fused.get(source, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: -x[1])
@@ -0,0 +1,214 @@
+import os
+import re
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from config import (SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_SIZE,
+                    SEMANTIC_CACHE_ENABLED, INDEX_PATH, EMBEDDING_MODEL)
+from index_manifest import file_sha256
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def query_literals(query: str) -> frozenset:
+    """Numbers and quoted strings: paraphrases must agree on them ("dog 5" is not "dog 6")."""
+    return frozenset(re.findall(r"\d+(?:\.\d+)?|\"[^\"]+\"|'[^']+'", query.lower()))
+
+
+class SemanticCache:
+    """
+    Cache of final answers keyed by the embedding of the user query.
+    A query whose cosine similarity with a past query reaches `threshold` gets the past
+    answer back, with its provenance (API file, timestamp, matched query), unless the entry
+    is older than `ttl` seconds or the API file it was answered from has changed since.
+    Entries live in an in-memory LRU bounded to `max_entries`, persisted in SQLite.
+    """
+
+    def __init__(self, path: str = SEMANTIC_CACHE_PATH, embedding=None, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL, max_entries: int = SEMANTIC_CACHE_SIZE):
+        if embedding is None:
+            from vector_store import get_vectorstore_handle
+            # Same model (and client) as the index, so query vectors are comparable
+            embedding = get_vectorstore_handle(INDEX_PATH, EMBEDDING_MODEL).embedding
+        self.embedding = embedding
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_text: Dict[str, str] = {}
+        self._matrix: Optional[Tuple[list, np.ndarray]] = None
+        # path -> (size, mtime_ns, sha256): avoids re-hashing API files that weren't touched
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id TEXT PRIMARY KEY, query TEXT NOT NULL, answer TEXT NOT NULL, api_file TEXT, "
+                "spec_sha256 TEXT, created_at REAL NOT NULL, last_used REAL NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._conn.commit()
+            self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT id, query, answer, api_file, spec_sha256, created_at, last_used, vector "
+            "FROM answers ORDER BY last_used"
+        ).fetchall()
+        for entry_id, query, answer, api_file, sha256, created_at, last_used, blob in rows[-self.max_entries:]:
+            self._add({"id": entry_id, "query": query, "answer": answer, "api_file": api_file,
+                       "spec_sha256": sha256, "created_at": created_at, "last_used": last_used,
+                       "vector": np.frombuffer(blob, dtype=np.float32)})
+
+    def _add(self, entry: Dict[str, Any]):
+        self._entries[entry["id"]] = entry
+        self._by_text[normalize_query(entry["query"])] = entry["id"]
+        self._matrix = None
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        if self._by_text.get(normalize_query(entry["query"])) == entry_id:
+            del self._by_text[normalize_query(entry["query"])]
+        self._matrix = None
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+            self._conn.commit()
+
+    def _file_hash(self, path: Optional[str]) -> Optional[str]:
+        if not path:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        known = self._hashes.get(path)
+        if known and known[:2] == (st.st_size, st.st_mtime_ns):
+            return known[2]
+        sha256 = file_sha256(path)
+        self._hashes[path] = (st.st_size, st.st_mtime_ns, sha256)
+        return sha256
+
+    def _valid(self, entry: Dict[str, Any]) -> bool:
+        if time.time() - entry["created_at"] > self.ttl:
+            return False
+        return not entry["api_file"] or self._file_hash(entry["api_file"]) == entry["spec_sha256"]
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _best_match(self, vector: np.ndarray, literals: frozenset) -> Tuple[Optional[str], float]:
+        """Closest past query above the threshold with the same literals."""
+        if self._matrix is None:
+            ids = list(self._entries)
+            matrix = np.vstack([self._entries[i]["vector"] for i in ids]) if ids else np.zeros((0, len(vector)), np.float32)
+            self._matrix = (ids, matrix)
+        ids, matrix = self._matrix
+        if not ids or matrix.shape[1] != len(vector):
+            return None, 0.0
+        scores = matrix @ vector
+        for best in np.argsort(-scores):
+            if scores[best] < self.threshold:
+                break
+            if query_literals(self._entries[ids[best]]["query"]) == literals:
+                return ids[best], float(scores[best])
+        return None, 0.0
+
+    def lookup(self, query: str) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Returns (provenance + answer of the closest valid past query or None, query vector).
+        The vector can be passed back to `store` to avoid embedding the query twice.
+        """
+        with self._lock:
+            entry_id = self._by_text.get(normalize_query(query))
+        vector, similarity = None, 1.0
+        if entry_id is None:
+            vector = self._embed(query)
+        with self._lock:
+            if entry_id is None:
+                entry_id, similarity = self._best_match(vector, query_literals(query))
+            entry = self._entries.get(entry_id) if entry_id else None
+            if entry is not None and not self._valid(entry):
+                print(f"Semantic cache entry for '{entry['query']}' expired or its API file changed")
+                self._remove(entry_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None, vector
+            self.hits += 1
+            entry["last_used"] = time.time()
+            self._entries.move_to_end(entry_id)
+            if self._conn is not None:
+                self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (entry["last_used"], entry_id))
+                self._conn.commit()
+            return {
+                "answer": entry["answer"],
+                "api_file": entry["api_file"],
+                "cached_at": entry["created_at"],
+                "matched_query": entry["query"],
+                "similarity": round(similarity, 4),
+            }, vector
+
+    def store(self, query: str, answer: str, api_file: Optional[str], vector: Optional[np.ndarray] = None):
+        if vector is None:
+            vector = self._embed(query)
+        now = time.time()
+        entry = {"id": uuid.uuid4().hex, "query": query, "answer": answer, "api_file": api_file,
+                 "spec_sha256": self._file_hash(api_file), "created_at": now, "last_used": now,
+                 "vector": vector.astype(np.float32)}
+        with self._lock:
+            previous = self._by_text.get(normalize_query(query))
+            if previous:
+                self._remove(previous)
+            self._add(entry)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (id, query, answer, api_file, spec_sha256, created_at, last_used, vector) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry["id"], query, answer, api_file, entry["spec_sha256"], now, now, entry["vector"].tobytes()),
+                )
+                self._conn.commit()
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_file(self, api_file: str) -> int:
+        """Drop every answer obtained from `api_file`; returns how many were dropped."""
+        with self._lock:
+            target = os.path.abspath(api_file)
+            stale = [i for i, e in self._entries.items() if e["api_file"] and os.path.abspath(e["api_file"]) == target]
+            for entry_id in stale:
+                self._remove(entry_id)
+        return len(stale)
+
+    def report(self) -> str:
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        return f"Semantic cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), {len(self._entries)} entries"
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide answer cache, or None if disabled (SEMANTIC_CACHE_ENABLED)."""
+    global _cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache()
+        return _cache
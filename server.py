@@ -0,0 +1,225 @@
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import (SERVER_HOST, SERVER_PORT, SERVER_MAX_CONCURRENT, SERVER_QUEUE_SIZE, SERVER_DEADLINE,
+                    MAX_CONCURRENT_LLM_CALLS, INDEX_PATH, EMBEDDING_MODEL)
+from concurrency import set_llm_concurrency
+from pipeline import QUERY_INSTRUCTIONS, prewarm, stream_pipeline
+from batch import summarize_state
+from vector_store import get_vectorstore_handle
+from instrumentation import get_aggregator
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class QueryGate:
+    """Admission control: at most `max_running` queries run at once, at most `max_queued` wait for a slot."""
+
+    def __init__(self, max_running: int = SERVER_MAX_CONCURRENT, max_queued: int = SERVER_QUEUE_SIZE):
+        self._slots = threading.BoundedSemaphore(max(1, max_running))
+        self._lock = threading.Lock()
+        self.max_queued = max_queued
+        self.queued = 0
+        self.running = 0
+
+    def enqueue(self) -> int | None:
+        """Take a place in the queue; returns the position, or None if the queue is full."""
+        with self._lock:
+            if self.queued >= self.max_queued:
+                return None
+            self.queued += 1
+            return self.queued
+
+    def leave(self):
+        with self._lock:
+            self.queued -= 1
+
+    def acquire(self, timeout: float) -> bool:
+        """Leave the queue: wait up to `timeout` seconds for a running slot."""
+        acquired = self._slots.acquire(timeout=max(0.0, timeout))
+        with self._lock:
+            self.queued -= 1
+            if acquired:
+                self.running += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.running -= 1
+        self._slots.release()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    POST /query  {"query": "...", "id": optional, "stream": true, "deadline": seconds}
+        streams NDJSON events (queued, started, one per completed node, result);
+        with "stream": false a single JSON result is returned.
+    GET /health  server load and loaded index version.
+    GET /metrics latency histograms per node / LLM / embedding / HTTP span since startup.
+    """
+    server_version = "MASQueryServer/1.0"
+    gate = QueryGate()
+
+    def log_message(self, format, *args):
+        print(f"[server] {self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_event(self, event: dict):
+        self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            return self._send_json(200, get_aggregator().to_dict())
+        if self.path != "/health":
+            return self._send_json(404, {"error": "Not found"})
+        self._send_json(200, {
+            "status": "ok",
+            "running": self.gate.running,
+            "queued": self.gate.queued,
+            "index_version": get_vectorstore_handle(INDEX_PATH, EMBEDDING_MODEL).version,
+        })
+
+    def _read_request(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError(f"Request body larger than {MAX_BODY_BYTES} bytes")
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(request, dict) or not str(request.get("query") or "").strip():
+            raise ValueError("Missing 'query' field")
+        return request
+
+    def do_POST(self):
+        if self.path != "/query":
+            return self._send_json(404, {"error": "Not found"})
+        try:
+            request = self._read_request()
+            deadline_s = float(request.get("deadline") or SERVER_DEADLINE)
+        except (ValueError, TypeError) as e:
+            return self._send_json(400, {"error": str(e)})
+
+        start = time.perf_counter()
+        deadline = start + deadline_s
+        stream = request.get("stream", True)
+        position = self.gate.enqueue()
+        if position is None:
+            return self._send_json(503, {"error": "Too many queued queries"}, {"Retry-After": "5"})
+
+        if stream:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            emit = self._write_event
+        else:
+            emit = lambda event: None
+
+        try:
+            emit({"event": "queued", "position": position})
+        except OSError:
+            self.gate.leave()
+            return
+        if not self.gate.acquire(deadline - time.perf_counter()):
+            result = {"id": request.get("id"), "query": request["query"], "answer": None, "api_file": None,
+                      "node_timings": {}, "error": f"Deadline of {deadline_s}s exceeded while queued",
+                      "elapsed": round(time.perf_counter() - start, 3)}
+            return self._finish(stream, 504, result)
+
+        try:
+            status, result = self._run(request, start, deadline, deadline_s, emit)
+        except OSError:
+            # Client went away: closing the stream generator stops the pipeline at the next node
+            print("[server] client disconnected, query abandoned")
+            return
+        finally:
+            self.gate.release()
+        self._finish(stream, status, result)
+
+    def _run(self, request: dict, start: float, deadline: float, deadline_s: float, emit) -> tuple:
+        emit({"event": "started", "waited": round(time.perf_counter() - start, 3)})
+        result = {"id": request.get("id"), "query": request["query"]}
+        final_state, status = {}, 200
+        steps = stream_pipeline(request["query"] + QUERY_INSTRUCTIONS)
+        try:
+            for node, final_state in steps:
+                emit({"event": "node", "node": node, "api_file": final_state.get("current_api_path"),
+                      "elapsed": round(time.perf_counter() - start, 3)})
+                # A running node is not interrupted; LLM and HTTP calls have their own timeouts
+                if time.perf_counter() > deadline and not final_state.get("done"):
+                    final_state = {**final_state, "done": True,
+                                   "error": f"Deadline of {deadline_s}s exceeded after node '{node}'"}
+                    status = 504
+                    break
+        finally:
+            steps.close()
+        result.update(summarize_state(final_state))
+        result["elapsed"] = round(time.perf_counter() - start, 3)
+        return status, result
+
+    def _finish(self, stream: bool, status: int, result: dict):
+        try:
+            if stream:
+                self._write_event({"event": "result", **result})
+            else:
+                self._send_json(status, result)
+        except OSError:
+            print("[server] client disconnected before the result was sent")
+
+
+def warm_up():
+    """Compile the graph, construct the agents and load the vector store and embedding model before the first query."""
+    start = time.perf_counter()
+    prewarm()
+    handle = get_vectorstore_handle(INDEX_PATH, EMBEDDING_MODEL)
+    try:
+        version, _ = handle.get()
+        handle.embedding.embed_query("warm up")
+        print(f"Index version {version} loaded")
+    except Exception as e:
+        print(f"Vector store not warmed up ({e}); it will be loaded by the first query")
+    print(f"Warm-up completed in {time.perf_counter() - start:.1f}s")
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, max_concurrent: int = SERVER_MAX_CONCURRENT,
+          queue_size: int = SERVER_QUEUE_SIZE, max_llm_calls: int = MAX_CONCURRENT_LLM_CALLS):
+    set_llm_concurrency(max_llm_calls)
+    QueryHandler.gate = QueryGate(max_concurrent, queue_size)
+    warm_up()
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    print(f"Serving on http://{host}:{port} (POST /query, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the multi-agent pipeline over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-concurrent", type=int, default=SERVER_MAX_CONCURRENT,
+                        help="queries run at the same time")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE,
+                        help="queries waiting for a slot before new ones get 503")
+    parser.add_argument("--max-llm-calls", type=int, default=MAX_CONCURRENT_LLM_CALLS,
+                        help="maximum concurrent LLM calls")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(args.host, args.port, args.max_concurrent, args.queue_size, args.max_llm_calls)
@@ -0,0 +1,300 @@
+import os
+import json
+import shutil
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import FAISS
+from compact_store import CompactVectorStore
+from config import INDEX_FORMAT, INDEX_SHARDS, ROUTER_TOP_FILES, INDEX_SEARCH_WORKERS
+
+SHARDS_DIR = "shards"
+ROUTER_NAME = "router.json"
+ROUTER_VECTORS_NAME = "router.npy"
+
+_search_pool = ThreadPoolExecutor(max_workers=max(1, INDEX_SEARCH_WORKERS), thread_name_prefix="shard-search")
+
+
+def shard_of(name: str, shards: int = INDEX_SHARDS) -> str:
+    """Shard of a service file (by file name): stable across runs and processes."""
+    return f"shard_{zlib.crc32(os.path.basename(name).encode('utf-8')) % shards:04d}"
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Vector index partitioned into shards of service files (INDEX_SHARDS groups, by file name
+    hash), each a FAISS or compact store of its own (INDEX_FORMAT) under shards/<name>.
+    A small router keeps one vector per file (its title/description chunk): a query is sent
+    only to the shards of the ROUTER_TOP_FILES closest files, searched in parallel, and the
+    hits are merged by relevance. Adding or removing a service only rewrites its shard.
+    Chunk ids must start with the file name followed by "#" (the Indexer's ids do), so a
+    deletion goes straight to the right shard.
+    Scores returned by similarity_search_with_score are relevance scores (higher is better).
+    """
+
+    def __init__(self, index_path, embedding: Embeddings, shards: int = INDEX_SHARDS,
+                 writable: bool = False, index_format: str = INDEX_FORMAT):
+        self.index_path = Path(index_path)
+        self.embedding = embedding
+        self.shards = shards
+        self.writable = writable
+        self.index_format = index_format
+        self._lock = threading.Lock()
+        self._stores: Dict[str, Optional[VectorStore]] = {}
+        self._dirty: set = set()
+        self._stale_dirs: List[str] = []
+        # source -> {"shard"}; router vectors are aligned with self._sources
+        self.router: Dict[str, dict] = {}
+        self._sources: List[str] = []
+        self._router_vectors: Optional[np.ndarray] = None
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    @classmethod
+    def exists(cls, index_path) -> bool:
+        return (Path(index_path) / ROUTER_NAME).exists()
+
+    @classmethod
+    def load(cls, index_path, embedding: Embeddings, writable: bool = False) -> "ShardedVectorStore":
+        """Reads the router only: shards are opened on first use."""
+        with open(Path(index_path) / ROUTER_NAME, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if writable and data.get("shards") != INDEX_SHARDS:
+            raise ValueError(f"index has {data.get('shards')} shards, INDEX_SHARDS is {INDEX_SHARDS}")
+        store = cls(index_path, embedding, shards=data["shards"], writable=writable,
+                    index_format=data.get("format", INDEX_FORMAT))
+        store.router = data.get("files", {})
+        store._sources = data.get("sources", [])
+        vectors_path = Path(index_path) / ROUTER_VECTORS_NAME
+        if store._sources and vectors_path.exists():
+            store._router_vectors = np.load(vectors_path)
+        return store
+
+    @classmethod
+    def create(cls, index_path, embedding: Embeddings) -> "ShardedVectorStore":
+        """Empty writable store; shards of a previous index at the same path are removed on save_local."""
+        store = cls(index_path, embedding, writable=True)
+        shards_dir = store.index_path / SHARDS_DIR
+        if shards_dir.exists():
+            store._stale_dirs = [p.name for p in shards_dir.iterdir() if p.is_dir()]
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, index_path=None, **kwargs: Any) -> "ShardedVectorStore":
+        store = cls.create(index_path, embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def _shard_path(self, shard: str) -> Path:
+        return self.index_path / SHARDS_DIR / shard
+
+    def _shard(self, shard: str) -> Optional[VectorStore]:
+        """The store of a shard, opened on first use; None if it has no index yet."""
+        with self._lock:
+            if shard in self._stores:
+                return self._stores[shard]
+            path = self._shard_path(shard)
+            store = None
+            try:
+                if self.index_format == "compact" and CompactVectorStore.exists(path):
+                    store = CompactVectorStore.load(path, self.embedding, writable=self.writable)
+                elif self.index_format != "compact" and (path / "index.faiss").exists():
+                    store = FAISS.load_local(str(path), self.embedding, allow_dangerous_deserialization=True)
+            except Exception as e:
+                # e.g. removed by a newer index version while this one was still in use
+                print(f"Shard {shard} could not be opened: {e}")
+            self._stores[shard] = store
+            return store
+
+    def store_for_source(self, file_path: str) -> Tuple[str, Optional[VectorStore]]:
+        """(shard, store) holding the chunks of a service file."""
+        shard = shard_of(file_path, self.shards)
+        return shard, self._shard(shard)
+
+    def add_texts(self, texts, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"{m.get('source', '')}#{i}" for i, m in enumerate(metadatas)]
+        # Embedded once for all shards (and the router), in the embedding's own batches
+        vectors = self.embedding.embed_documents(texts)
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_of(str(metadata.get("source", "")), self.shards), []).append(i)
+
+        for shard, positions in groups.items():
+            text_embeddings = [(texts[i], vectors[i]) for i in positions]
+            shard_metadatas = [metadatas[i] for i in positions]
+            shard_ids = [ids[i] for i in positions]
+            store = self._shard(shard) if shard not in self._stale_dirs else None
+            if store is None:
+                if self.index_format == "compact":
+                    store = CompactVectorStore.create(self._shard_path(shard), self.embedding)
+                    store.add_embeddings(text_embeddings, shard_metadatas, ids=shard_ids)
+                else:
+                    store = FAISS.from_embeddings(text_embeddings, self.embedding, shard_metadatas, ids=shard_ids)
+                with self._lock:
+                    self._stores[shard] = store
+                    if shard in self._stale_dirs:
+                        self._stale_dirs.remove(shard)
+            else:
+                store.add_embeddings(text_embeddings, shard_metadatas, ids=shard_ids)
+            self._dirty.add(shard)
+
+        self._route(metadatas, vectors)
+        return ids
+
+    def _route(self, metadatas: List[dict], vectors: List[List[float]]):
+        """Router entry of every new file: the vector of its info chunk (title/description), else of its first chunk."""
+        routes: Dict[str, int] = {}
+        for i, metadata in enumerate(metadatas):
+            source = str(metadata.get("source", ""))
+            if source and (source not in routes or metadata.get("section") == "info"):
+                routes[source] = i
+        if not routes:
+            return
+        matrix = np.asarray([vectors[i] for i in routes.values()], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._drop_routes(set(routes))
+            for source, vector in zip(routes, matrix):
+                self.router[source] = {"shard": shard_of(source, self.shards)}
+                self._sources.append(source)
+            self._router_vectors = matrix if self._router_vectors is None else np.vstack([self._router_vectors, matrix])
+
+    def _drop_routes(self, sources: set):
+        keep = [i for i, s in enumerate(self._sources) if s not in sources]
+        if len(keep) == len(self._sources):
+            return
+        self._sources = [self._sources[i] for i in keep]
+        self._router_vectors = self._router_vectors[keep] if keep and self._router_vectors is not None else None
+        for source in sources:
+            self.router.pop(source, None)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        groups: Dict[str, List[str]] = {}
+        for doc_id in ids:
+            groups.setdefault(shard_of(doc_id.split("#", 1)[0], self.shards), []).append(doc_id)
+        for shard, shard_ids in groups.items():
+            store = self._shard(shard)
+            if store is not None:
+                store.delete(shard_ids)
+                self._dirty.add(shard)
+        names = {doc_id.split("#", 1)[0] for doc_id in ids}
+        with self._lock:
+            # Re-added files get a new router entry in add_texts
+            self._drop_routes({s for s in self.router if os.path.basename(s) in names})
+        return True
+
+    def save_local(self, folder_path=None):
+        """Write the shards changed since the last save, then the router."""
+        folder = Path(folder_path or self.index_path)
+        for shard in sorted(self._dirty):
+            store = self._stores.get(shard)
+            if store is not None:
+                store.save_local(str(folder / SHARDS_DIR / shard))
+        self._dirty = set()
+        for shard in self._stale_dirs:
+            shutil.rmtree(folder / SHARDS_DIR / shard, ignore_errors=True)
+        self._stale_dirs = []
+        if self._router_vectors is not None:
+            np.save(folder / ROUTER_VECTORS_NAME, self._router_vectors)
+        tmp_path = folder / (ROUTER_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"shards": self.shards, "format": self.index_format,
+                       "sources": self._sources, "files": self.router}, f)
+        os.replace(tmp_path, folder / ROUTER_NAME)
+
+    def _routed_shards(self, vector: np.ndarray) -> List[str]:
+        """Shards of the files closest to the query, best first; every shard when there is no router."""
+        with self._lock:
+            sources, matrix = list(self._sources), self._router_vectors
+        if matrix is None or not sources:
+            shards_dir = self.index_path / SHARDS_DIR
+            return sorted(p.name for p in shards_dir.iterdir() if p.is_dir()) if shards_dir.exists() else []
+        query = vector / (np.linalg.norm(vector) or 1.0)
+        shards = []
+        for i in np.argsort(-(matrix @ query))[:ROUTER_TOP_FILES]:
+            shard = self.router[sources[i]]["shard"]
+            if shard not in shards:
+                shards.append(shard)
+        return shards
+
+    def _map_shards(self, shards: List[str], fn: Callable[[VectorStore], Any]) -> List[Any]:
+        def run(shard):
+            store = self._shard(shard)
+            return fn(store) if store is not None else None
+        return [r for r in _search_pool.map(run, shards) if r is not None]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if filter and "source" in filter:
+            shards = [shard_of(str(filter["source"]), self.shards)]
+        else:
+            shards = self._routed_shards(vector)
+
+        def search(store):
+            relevance = store._select_relevance_score_fn()
+            return [(doc, relevance(score)) for doc, score in
+                    store.similarity_search_with_score_by_vector(embedding, k, filter=filter, **kwargs)]
+
+        hits = [hit for shard_hits in self._map_shards(shards, search) for hit in shard_hits]
+        return sorted(hits, key=lambda x: -x[1])[:k]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Shard scores are already converted to relevance
+        return lambda score: score
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      **kwargs: Any) -> List[Document]:
+        """MMR inside each routed shard; the per-shard picks are interleaved in routing order."""
+        embedding = self.embedding.embed_query(query)
+        shards = self._routed_shards(np.asarray(embedding, dtype=np.float32))
+        picks = self._map_shards(shards, lambda store: store.max_marginal_relevance_search_by_vector(
+            embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, **kwargs))
+        merged = [docs[i] for i in range(k) for docs in picks if i < len(docs)]
+        return merged[:k]
+
+    def _open_shards(self) -> List[VectorStore]:
+        shards_dir = self.index_path / SHARDS_DIR
+        names = sorted(set(self._stores) | ({p.name for p in shards_dir.iterdir() if p.is_dir()}
+                                            if shards_dir.exists() else set()))
+        return [store for store in (self._shard(name) for name in names if name not in self._stale_dirs) if store]
+
+    def iter_documents(self) -> Iterator[Tuple[str, Document]]:
+        for store in self._open_shards():
+            if isinstance(store, CompactVectorStore):
+                yield from store.iter_documents()
+            else:
+                yield from store.docstore._dict.items()
+
+    def documents_for_source(self, file_path: str) -> List[Document]:
+        store = self._shard(shard_of(file_path, self.shards))
+        if store is None:
+            return []
+        if isinstance(store, CompactVectorStore):
+            return store.documents_for_source(file_path)
+        return [doc for doc in store.docstore._dict.values() if file_path in str(doc.metadata.get("source", ""))]
+
+    @property
+    def ntotal(self) -> int:
+        return sum(store.index.ntotal for store in self._open_shards())
@@ -0,0 +1,71 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import SPEC_CACHE_DIR, SPEC_CACHE_SIZE
+from index_manifest import file_sha256
+
+
+class SpecCache:
+    """
+    Cache of prepared API specs (the flattened spec) keyed by
+    file path + content hash. Entries live in an in-memory LRU bounded to
+    `max_entries` and are persisted as JSON files in `cache_dir`.
+    """
+
+    def __init__(self, cache_dir: str = SPEC_CACHE_DIR, max_entries: int = SPEC_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        # path -> (size, mtime_ns, sha256): avoids re-hashing files that weren't touched
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def key(self, file_path: str) -> str:
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+        known = self._hashes.get(path)
+        if known and known[:2] == (st.st_size, st.st_mtime_ns):
+            sha256 = known[2]
+        else:
+            sha256 = file_sha256(path)
+            self._hashes[path] = (st.st_size, st.st_mtime_ns, sha256)
+        return hashlib.sha256(f"{path}:{sha256}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, file_path: str) -> Optional[dict]:
+        key = self.key(file_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, file_path: str, entry: dict):
+        key = self.key(file_path)
+        self._remember(key, entry)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Could not persist spec cache entry for {file_path}: {e}")
+
+    def _remember(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
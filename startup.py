@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import subprocess
+from typing import Dict, List, Tuple
+
+IMPORT_LINE_PREFIX = "import time:"
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) of every module imported by `import <module>`, from python -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith(IMPORT_LINE_PREFIX) or "|" not in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len(IMPORT_LINE_PREFIX):].split("|")]
+        if self_us.isdigit():
+            rows.append((name, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def package_times(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Self time (us) summed per top-level package."""
+    totals: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def startup_report(top: int = 15) -> str:
+    """Import time of the CLI entry points by package, then the time to build each part of the pipeline."""
+    lines = []
+    for module in ["config", "pipeline"]:
+        rows = import_times(module)
+        # The last line is the requested module itself, its cumulative time is the total
+        total = rows[-1][2] if rows else 0
+        lines.append(f"import {module}: {total / 1e6:.2f}s ({len(rows)} modules)")
+    lines.append("")
+    lines.append("Slowest packages imported by pipeline (self time):")
+    for package, us in sorted(package_times(rows).items(), key=lambda x: -x[1])[:top]:
+        lines.append(f"  {package:<32}{us / 1e6:>8.3f}s")
+
+    start = time.perf_counter()
+    from pipeline import prewarm
+    imported = time.perf_counter() - start
+    timings = prewarm()
+    lines.append("")
+    lines.append("Lazy initialization (paid by the first query unless prewarmed):")
+    lines.append(f"  {'import pipeline':<32}{imported:>8.3f}s")
+    lines.append(f"  {'compile graph':<32}{timings.pop('graph'):>8.3f}s")
+    for step, seconds in timings.items():
+        lines.append(f"  {step:<32}{seconds:>8.3f}s")
+    return "\n".join(lines)
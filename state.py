@@ -1,4 +1,15 @@
-from typing import TypedDict, List, Optional
+from typing import TypedDict, List, Optional, Dict, Any
+
+# Appended to every user question so the executor calls the API instead of describing it
+QUERY_INSTRUCTIONS = ("\nDon't explain how to call the API and don't show code examples. "
+    "You must use your tool to actually send the request and return the real response data.\nReturn ONLY the http response."
+)
+
+
+def strip_instructions(user_query: str) -> str:
+    """The user's question without QUERY_INSTRUCTIONS, for retrieval and matching."""
+    return user_query.replace(QUERY_INSTRUCTIONS, "").strip()
+
 
 class State(TypedDict, total=False):
     user_query: str
@@ -8,9 +19,16 @@ class State(TypedDict, total=False):
     api_spec_yaml: Optional[str]
     system_message: Optional[str]
     last_response: Optional[str]
+    last_status: Optional[int]
+    last_request: Optional[Dict[str, Any]]
     done: bool
     retrieved: bool
     error: Optional[str]
     fetched_url: bool
     accepted: bool
     needs_reindex: bool
+    index_version: Optional[int]
+    node_timings: Dict[str, float]
+    trace_id: Optional[str]
+    cache_hit: Optional[Dict[str, Any]]
+    speculated: bool
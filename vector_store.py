@@ -0,0 +1,203 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from config import INDEX_PATH, EMBEDDING_MODEL, INDEX_FORMAT, INDEX_LAYOUT
+from compact_store import CompactVectorStore
+from sharded_store import ShardedVectorStore
+from index_manifest import IndexManifest
+from embedding_pipeline import BatchedEmbeddings
+
+# Number of index versions kept in memory so in-flight queries keep a consistent view
+KEEP_VERSIONS = 2
+
+
+class VectorStoreHandle:
+    """
+    Process-wide, in-memory handle on the vector index (LangChain FAISS or CompactVectorStore).
+    The store is loaded once and shared by every node; when the Indexer writes a new
+    index it is swapped atomically under a new version number (the manifest version).
+    Queries that pinned an older version keep reading it while it is still retained.
+    """
+
+    def __init__(self, index_path=INDEX_PATH, embedding_model=EMBEDDING_MODEL):
+        self.index_path = Path(index_path)
+        # Query-time embeddings only: no disk cache, calls traced like the Indexer's
+        self.embedding = BatchedEmbeddings(model=embedding_model, cache_path=None)
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[int, VectorStore]" = OrderedDict()
+        self._version: Optional[int] = None
+        self._manifest_mtime_ns: Optional[int] = None
+        # (version, shard) -> source -> positions of its chunks in a LangChain FAISS index
+        self._source_positions: Dict[tuple, Dict[str, List[int]]] = {}
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def get(self, version: Optional[int] = None) -> Tuple[int, VectorStore]:
+        """
+        Return (version, store). A pinned `version` is served if still retained,
+        otherwise the current store, hot reloaded if the index on disk changed.
+        """
+        if version is not None:
+            with self._lock:
+                if version in self._snapshots:
+                    return version, self._snapshots[version]
+
+        self._refresh()
+        with self._lock:
+            if self._version is None:
+                raise FileNotFoundError("Index path not found. Run Indexer first.")
+            return self._version, self._snapshots[self._version]
+
+    def publish(self, version: int, store: VectorStore):
+        """Swap in a store just written to disk (by the Indexer of this process)."""
+        if isinstance(store, (CompactVectorStore, ShardedVectorStore)) and store.writable:
+            # Queries read the files just written (memory-mapped), not the Indexer's in-memory copy
+            store = type(store).load(self.index_path, self.embedding)
+        manifest_path = IndexManifest(self.index_path).path
+        mtime_ns = manifest_path.stat().st_mtime_ns if manifest_path.exists() else None
+        with self._lock:
+            self._swap(version, store, mtime_ns)
+
+    def _swap(self, version: int, store: VectorStore, mtime_ns: Optional[int]):
+        self._snapshots[version] = store
+        self._snapshots.move_to_end(version)
+        while len(self._snapshots) > KEEP_VERSIONS:
+            self._snapshots.popitem(last=False)
+        for key in [k for k in self._source_positions if k[0] not in self._snapshots]:
+            del self._source_positions[key]
+        self._version = version
+        self._manifest_mtime_ns = mtime_ns
+
+    def search_source(self, version: int, store: VectorStore, query: str, source: str, k: int) -> List[Document]:
+        """
+        The k chunks of one service file closest to the query, scoring only that file's vectors.
+        LangChain FAISS applies a filter after a global top-fetch_k search: its file chunks are
+        located once per index version instead, so the cost doesn't grow with the corpus.
+        """
+        shard = None
+        if isinstance(store, ShardedVectorStore):
+            shard, store = store.store_for_source(source)
+            if store is None:
+                return []
+        if isinstance(store, CompactVectorStore):
+            # Already scores only the rows of the source
+            return store.similarity_search(query, k=k, filter={"source": source})
+
+        positions = self._positions(version, shard, store).get(source, [])
+        if not positions:
+            return []
+        vectors = np.vstack([store.index.reconstruct(p) for p in positions])
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        if store._normalize_L2:
+            query_vector /= np.linalg.norm(query_vector) or 1.0
+        if store.distance_strategy == DistanceStrategy.EUCLIDEAN_DISTANCE:
+            scores = -((vectors - query_vector) ** 2).sum(axis=1)
+        else:
+            scores = vectors @ query_vector
+        return [store.docstore.search(store.index_to_docstore_id[positions[i]]) for i in np.argsort(-scores)[:k]]
+
+    def _positions(self, version: int, shard: Optional[str], store: FAISS) -> Dict[str, List[int]]:
+        key = (version, shard)
+        with self._lock:
+            positions = self._source_positions.get(key)
+        if positions is not None:
+            return positions
+        positions = {}
+        for position, doc_id in store.index_to_docstore_id.items():
+            doc = store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                positions.setdefault(str(doc.metadata.get("source", "")), []).append(position)
+        with self._lock:
+            if version in self._snapshots:
+                self._source_positions[key] = positions
+        return positions
+
+    def _refresh(self):
+        """Reload the index if its manifest changed on disk (e.g. written by another process)."""
+        manifest = IndexManifest(self.index_path)
+        try:
+            mtime_ns = manifest.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._manifest_mtime_ns:
+            return
+
+        with self._lock:
+            if mtime_ns == self._manifest_mtime_ns:
+                return
+            manifest = IndexManifest.load(self.index_path)
+            if manifest.version != self._version or self._version is None:
+                print(f"Loading {INDEX_FORMAT} index version {manifest.version} from {self.index_path}")
+                store = load_store(self.index_path, self.embedding)
+                self._swap(manifest.version, store, mtime_ns)
+            else:
+                self._manifest_mtime_ns = mtime_ns
+
+
+_handles: Dict[Tuple[str, str], VectorStoreHandle] = {}
+_handles_lock = threading.Lock()
+
+
+def get_vectorstore_handle(index_path=INDEX_PATH, embedding_model=EMBEDDING_MODEL) -> VectorStoreHandle:
+    """Return the shared handle for an index path, creating it on first use."""
+    key = (str(Path(index_path).resolve()), embedding_model)
+    with _handles_lock:
+        if key not in _handles:
+            _handles[key] = VectorStoreHandle(index_path, embedding_model)
+        return _handles[key]
+
+
+def index_exists(index_path=INDEX_PATH, index_format: str = INDEX_FORMAT, layout: str = INDEX_LAYOUT) -> bool:
+    if layout == "sharded":
+        return ShardedVectorStore.exists(index_path)
+    if index_format == "compact":
+        return CompactVectorStore.exists(index_path)
+    return (Path(index_path) / "index.faiss").exists()
+
+
+def load_store(index_path, embedding, writable: bool = False, index_format: str = INDEX_FORMAT,
+               layout: str = INDEX_LAYOUT):
+    """Open the index in the configured layout and format (INDEX_LAYOUT, INDEX_FORMAT); `writable` is for the Indexer."""
+    if layout == "sharded":
+        return ShardedVectorStore.load(index_path, embedding, writable=writable)
+    if index_format == "compact":
+        return CompactVectorStore.load(index_path, embedding, writable=writable)
+    return FAISS.load_local(str(index_path), embedding, allow_dangerous_deserialization=True)
+
+
+def new_store(chunks: List[Document], embedding, ids: List[str], index_path=INDEX_PATH, index_format: str = INDEX_FORMAT,
+              layout: str = INDEX_LAYOUT):
+    if layout == "sharded":
+        return ShardedVectorStore.from_documents(chunks, embedding, ids=ids, index_path=index_path)
+    if index_format == "compact":
+        return CompactVectorStore.from_documents(chunks, embedding, ids=ids, index_path=index_path)
+    return FAISS.from_documents(chunks, embedding, ids=ids)
+
+
+def iter_documents(store) -> Iterator[Tuple[str, Document]]:
+    """(id, chunk) of every indexed chunk."""
+    if isinstance(store, (CompactVectorStore, ShardedVectorStore)):
+        return store.iter_documents()
+    return iter(store.docstore._dict.items())
+
+
+def documents_for_source(store, file_path: str) -> List[Document]:
+    """Return the indexed chunks generated from a given service file."""
+    if isinstance(store, (CompactVectorStore, ShardedVectorStore)):
+        return store.documents_for_source(file_path)
+    return [
+        doc for doc in store.docstore._dict.values()
+        if file_path in str(doc.metadata.get("source", ""))
+    ]
+
+
+def vector_count(store) -> int:
+    return store.ntotal if isinstance(store, ShardedVectorStore) else store.index.ntotal